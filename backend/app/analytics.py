@@ -1,15 +1,55 @@
+import queue
 import sqlite3
 import logging
-from datetime import datetime, timedelta
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 from app.schemas import RefineRequest
 
 DB_PATH = "analytics.db"
+# Rows are written in batches by a background thread: whichever comes first
+BATCH_SIZE = 50
+FLUSH_INTERVAL_SECONDS = 1.0
+# Beyond this many pending rows, new events are dropped instead of blocking
+MAX_PENDING_ROWS = 10000
 logger = logging.getLogger("uvicorn")
 
+INSERT_LOG_SQL = """
+    INSERT INTO request_logs 
+    (timestamp, project_key, issue_type, component_team, summary_length, output_language)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+# Rollup buckets use the same formats SQLite's strftime produced for the old
+# GROUP BY queries, so labels stay identical after the switch.
+ROLLUP_PERIODS = {
+    "daily": ("%Y-%m-%d", 30),
+    "weekly": ("%Y-%W", 12),
+    "monthly": ("%Y-%m", 12),
+}
+ROLLUP_DIMENSIONS = ("project_key", "component_team", "output_language")
+
+UPSERT_ROLLUP_SQL = """
+    INSERT INTO usage_rollups (period, bucket, dimension, dimension_value, count, first_date)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (period, bucket, dimension, dimension_value) DO UPDATE SET
+        count = count + excluded.count,
+        first_date = MIN(first_date, excluded.first_date)
+"""
+
+def connect(db_path: str = DB_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
 def init_db():
     """Initialize the SQLite database for analytics."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect()
         cursor = conn.cursor()
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS request_logs (
@@ -22,95 +62,269 @@ def init_db():
                 output_language TEXT
             )
         """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_request_logs_timestamp
+            ON request_logs (timestamp)
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS usage_rollups (
+                period TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                dimension TEXT NOT NULL,
+                dimension_value TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                first_date TEXT,
+                PRIMARY KEY (period, bucket, dimension, dimension_value)
+            )
+        """)
         conn.commit()
+        # First start after upgrading: build rollups from the existing logs
+        has_rollups = cursor.execute("SELECT 1 FROM usage_rollups LIMIT 1").fetchone()
+        has_logs = cursor.execute("SELECT 1 FROM request_logs LIMIT 1").fetchone()
+        if has_logs and not has_rollups:
+            backfill_rollups(conn)
         conn.close()
         logger.info("Analytics DB initialized.")
     except Exception as e:
         logger.error(f"Failed to init analytics DB: {e}")
 
-def log_usage(request: RefineRequest):
-    """Log a usage event to the database."""
+def rollup_rows(log_rows) -> list:
+    """Aggregate request_logs rows into usage_rollups upsert parameters."""
+    counts = Counter()
+    first_dates = {}
+    for timestamp, project_key, _issue_type, component_team, _length, output_language in log_rows:
+        logged_at = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+        day = logged_at.strftime("%Y-%m-%d")
+        values = {
+            "all": "",
+            "project_key": project_key or "",
+            "component_team": component_team or "",
+            "output_language": output_language or "",
+        }
+        for period, (bucket_format, _) in ROLLUP_PERIODS.items():
+            bucket = logged_at.strftime(bucket_format)
+            for dimension, value in values.items():
+                key = (period, bucket, dimension, value)
+                counts[key] += 1
+                first_dates[key] = min(first_dates.get(key, day), day)
+    return [key + (count, first_dates[key]) for key, count in counts.items()]
+
+def backfill_rollups(conn: sqlite3.Connection):
+    """Rebuild usage_rollups from the full request_logs table."""
+    selects = []
+    for period, (bucket_format, _) in ROLLUP_PERIODS.items():
+        bucket_expr = "date(timestamp)" if period == "daily" else f"strftime('{bucket_format}', timestamp)"
+        selects.append(f"""
+            SELECT '{period}', {bucket_expr}, 'all', '', COUNT(*), min(date(timestamp))
+            FROM request_logs GROUP BY 2
+        """)
+        for dimension in ROLLUP_DIMENSIONS:
+            selects.append(f"""
+                SELECT '{period}', {bucket_expr}, '{dimension}', COALESCE({dimension}, ''),
+                       COUNT(*), min(date(timestamp))
+                FROM request_logs GROUP BY 2, 4
+            """)
+    conn.execute("BEGIN IMMEDIATE")
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO request_logs 
-            (project_key, issue_type, component_team, summary_length, output_language)
-            VALUES (?, ?, ?, ?, ?)
-        """, (
-            request.project_key,
-            request.issue_type,
-            request.component_team,
-            len(request.summary) if request.summary else 0,
-            request.output_language
-        ))
+        conn.execute("DELETE FROM usage_rollups")
+        for select in selects:
+            conn.execute(f"""
+                INSERT INTO usage_rollups (period, bucket, dimension, dimension_value, count, first_date)
+                {select}
+            """)
         conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    logger.info("Analytics rollups rebuilt from request_logs.")
+
+class AnalyticsWriter:
+    """Background thread that batches request_logs inserts on one WAL connection."""
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        db_path: str = DB_PATH,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+        max_pending: int = MAX_PENDING_ROWS
+    ):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="analytics-writer", daemon=True)
+        self.dropped = 0
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, row: tuple):
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"Analytics queue full, dropped {self.dropped} rows so far.")
+
+    def _flush(self, conn: sqlite3.Connection, batch: list):
+        if not batch:
+            return
+        try:
+            with conn:
+                conn.executemany(INSERT_LOG_SQL, batch)
+                conn.executemany(UPSERT_ROLLUP_SQL, rollup_rows(batch))
+        except Exception as e:
+            logger.error(f"Failed to log usage ({len(batch)} rows): {e}")
+        batch.clear()
+
+    def _run(self):
+        try:
+            conn = connect(self.db_path)
+        except Exception as e:
+            logger.error(f"Analytics writer could not open DB: {e}")
+            return
+
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+        while not stopping:
+            try:
+                row = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                if row is self._STOP:
+                    stopping = True
+                else:
+                    batch.append(row)
+            except queue.Empty:
+                pass
+
+            if stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(conn, batch)
+                deadline = time.monotonic() + self.flush_interval
+
+        # Drain whatever was queued after the stop marker
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is not self._STOP:
+                batch.append(row)
+        self._flush(conn, batch)
         conn.close()
-    except Exception as e:
-        logger.error(f"Failed to log usage: {e}")
 
-def get_usage_stats(period: str = "weekly"):
-    """Get usage counts grouped by period (daily, weekly, monthly)."""
+    def stop(self, timeout: float = 5.0):
+        if not self._thread.is_alive():
+            return
+        # Blocking put: the stop marker must get in even if the queue is full
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer() -> AnalyticsWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AnalyticsWriter()
+            _writer.start()
+        return _writer
+
+def shutdown():
+    """Flush pending rows and stop the background writer."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+
+def log_usage(request: RefineRequest):
+    """Queue a usage event; it is written by the background writer."""
+    get_writer().submit((
+        datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        request.project_key,
+        request.issue_type,
+        request.component_team,
+        len(request.summary) if request.summary else 0,
+        request.output_language
+    ))
+
+def get_usage_stats(period: str = "weekly", dimension: Optional[str] = None):
+    """Get usage counts grouped by period (daily, weekly, monthly).
+
+    Reads only usage_rollups. With a dimension (project_key, component_team,
+    output_language) a per-value breakdown aligned with the labels is added.
+    """
     try:
-        conn = sqlite3.connect(DB_PATH)
+        if period not in ROLLUP_PERIODS:
+            period = "weekly"
+        limit = ROLLUP_PERIODS[period][1]
+        conn = connect()
         cursor = conn.cursor()
-        
-        if period == "daily":
-            # Last 30 days
-            query = """
-                SELECT 
-                    date(timestamp) as time_group,
-                    COUNT(*) as count
-                FROM request_logs
-                GROUP BY time_group
-                ORDER BY time_group DESC
-                LIMIT 30
-            """
-        elif period == "monthly":
-            # Last 12 months
-            query = """
-                SELECT 
-                    strftime('%Y-%m', timestamp) as time_group,
-                    COUNT(*) as count
-                FROM request_logs
-                GROUP BY time_group
-                ORDER BY time_group DESC
-                LIMIT 12
-            """
-        else: # weekly default
-            query = """
-                SELECT 
-                    strftime('%Y-%W', timestamp) as time_group,
-                    COUNT(*) as count,
-                    min(date(timestamp)) as week_start
-                FROM request_logs
-                GROUP BY time_group
-                ORDER BY time_group DESC
-                LIMIT 12
-            """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
+        # One read transaction: both queries see the same snapshot even while
+        # the writer thread keeps adding rows
+        cursor.execute("BEGIN")
+
+        cursor.execute("""
+            SELECT bucket, count, first_date
+            FROM usage_rollups
+            WHERE period = ? AND dimension = 'all' AND dimension_value = ''
+            ORDER BY bucket DESC
+            LIMIT ?
+        """, (period, limit))
+        rows = cursor.fetchall()[::-1]
+
+        breakdown_rows = []
+        if dimension in ROLLUP_DIMENSIONS and rows:
+            cursor.execute("""
+                SELECT bucket, dimension_value, count
+                FROM usage_rollups
+                WHERE period = ? AND dimension = ? AND bucket BETWEEN ? AND ?
+            """, (period, dimension, rows[0][0], rows[-1][0]))
+            breakdown_rows = cursor.fetchall()
+        conn.rollback()
         conn.close()
         
         # Format for chart
         labels = []
         data = []
         
-        for row in rows:
+        for bucket, count, first_date in rows:
             if period == "weekly":
-                 # row[0] is year-week, row[1] is count, row[2] is start date
-                labels.append(f"Week {row[0]} ({row[2]})")
-                data.append(row[1])
+                labels.append(f"Week {bucket} ({first_date})")
             else:
-                # row[0] is date/month, row[1] is count
-                labels.append(row[0])
-                data.append(row[1])
-            
-        return {
-            "labels": labels[::-1],
-            "data": data[::-1]
+                labels.append(bucket)
+            data.append(count)
+
+        result = {
+            "labels": labels,
+            "data": data
         }
+        if dimension in ROLLUP_DIMENSIONS:
+            positions = {row[0]: index for index, row in enumerate(rows)}
+            breakdown = {}
+            for bucket, value, count in breakdown_rows:
+                if bucket not in positions:
+                    continue
+                series = breakdown.setdefault(value or "(none)", [0] * len(rows))
+                series[positions[bucket]] = count
+            result["dimension"] = dimension
+            result["breakdown"] = breakdown
+        return result
     except Exception as e:
         logger.error(f"Failed to get analytics: {e}")
         return {"labels": [], "data": []}
+
+if __name__ == "__main__":
+    # Usage: python -m app.analytics backfill
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        logging.basicConfig(level=logging.INFO)
+        init_db()
+        conn = connect()
+        backfill_rollups(conn)
+        conn.close()
+    else:
+        print("Usage: python -m app.analytics backfill")
+        sys.exit(1)
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional
+
+from app import metrics
+from app.schemas import RefineRequest, RetrievedReference
+
+logger = logging.getLogger("uvicorn")
+
+
+class BatchJob:
+    """One batch refine run. Results are appended in completion order.
+
+    The job runs as its own task, so a dropped stream does not stop it and
+    the results stay available for polling until the job expires.
+    """
+
+    def __init__(self, total: int):
+        self.job_id = uuid.uuid4().hex
+        self.total = total
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.results: List[dict] = []
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    async def add_result(self, result: dict):
+        async with self._changed:
+            self.results.append(result)
+            self._changed.notify_all()
+
+    async def finish(self):
+        async with self._changed:
+            self.finished_at = time.time()
+            self._changed.notify_all()
+
+    async def follow(self) -> AsyncIterator[dict]:
+        """Yield every result, including those already finished, until the job is done."""
+        cursor = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.results) > cursor or self.done)
+                pending = self.results[cursor:]
+                finished = self.done and cursor + len(pending) >= len(self.results)
+            for result in pending:
+                yield result
+            cursor += len(pending)
+            if finished:
+                return
+
+    def status(self) -> dict:
+        failed = sum(1 for result in self.results if result.get("error"))
+        return {
+            "job_id": self.job_id,
+            "status": "done" if self.done else "running",
+            "total": self.total,
+            "completed": len(self.results),
+            "failed": failed,
+            "elapsed_ms": round(((self.finished_at or time.time()) - self.created_at) * 1000, 1),
+            "results": sorted(self.results, key=lambda result: result["index"])
+        }
+
+
+class BatchJobStore:
+    """In-process registry of recent batch jobs, bounded by count and age."""
+
+    def __init__(self, max_jobs: int = 100, ttl_seconds: float = 3600):
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+        self._jobs: "OrderedDict[str, BatchJob]" = OrderedDict()
+
+    def create(self, total: int) -> BatchJob:
+        self._prune()
+        job = BatchJob(total)
+        self._jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        self._prune()
+        return self._jobs.get(job_id)
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl_seconds
+        for job_id, job in list(self._jobs.items()):
+            if job.done and job.finished_at < cutoff:
+                del self._jobs[job_id]
+        # Over capacity: drop the oldest finished jobs; running jobs are never evicted
+        for job_id, job in list(self._jobs.items()):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if job.done:
+                del self._jobs[job_id]
+
+    def cancel_all(self):
+        for job in self._jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+
+
+async def run_batch(job: BatchJob, requests: List[RefineRequest], rag_service, llm_service, llm_concurrency: int, with_vectors: bool = False):
+    """Retrieve context for every request in one batched pass, then fan out the LLM calls."""
+    try:
+        to_search = [index for index, request in enumerate(requests) if request.selected_references is None]
+        references: List[List[RetrievedReference]] = [request.selected_references or [] for request in requests]
+        retrieval_error = None
+        if to_search:
+            try:
+                found = await rag_service.search_context_batch(
+                    [requests[index] for index in to_search], with_vectors=with_vectors
+                )
+                for index, refs in zip(to_search, found):
+                    references[index] = refs
+            except Exception as e:
+                logger.error(f"Batch {job.job_id} retrieval failed: {e}")
+                retrieval_error = str(e)
+
+        semaphore = asyncio.Semaphore(max(1, llm_concurrency))
+
+        async def refine_one(index: int):
+            request = requests[index]
+            result = {"index": index, "issue_key": request.issue_key, "summary": request.summary}
+            if retrieval_error and request.selected_references is None:
+                result["error"] = f"Retrieval failed: {retrieval_error}"
+                await job.add_result(result)
+                return
+            try:
+                async with semaphore:
+                    refined = await llm_service.refine_description(request, references[index], raise_errors=True)
+                result.update({
+                    "original_text": request.current_description,
+                    "refined_content": refined,
+                    "references": [ref.model_dump() for ref in references[index]]
+                })
+            except Exception as e:
+                logger.error(f"Batch {job.job_id} item {index} failed: {e}")
+                result["error"] = str(e)
+            await job.add_result(result)
+
+        await asyncio.gather(*(refine_one(index) for index in range(len(requests))))
+    finally:
+        await job.finish()
+        metrics.REQUEST_SECONDS.observe(job.finished_at - job.created_at, endpoint="refine_batch")
@@ -0,0 +1,342 @@
+import abc
+import asyncio
+import hashlib
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+from app import metrics
+
+logger = logging.getLogger("uvicorn")
+
+# Disk writes queued beyond this are dropped; each writer transaction takes up to WRITE_BATCH_SIZE
+MAX_PENDING_WRITES = 10000
+WRITE_BATCH_SIZE = 100
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so cosmetic edits to a draft reuse the same key."""
+    return " ".join((text or "").split())
+
+
+class TieredCache(abc.ABC):
+    """Bounded in-memory LRU with an optional SQLite tier and optional TTL.
+
+    The SQLite tier can be shared by several workers and survives restarts
+    and uvicorn --reload; disk hits are promoted into memory. Disk reads run
+    on a worker thread and writes go through a background writer thread, so
+    a miss never blocks the event loop on SQLite. Subclasses decide how keys
+    are derived and how values are serialized.
+    """
+
+    table = "cache"
+    # `cache` label of ra_cache_lookups_total
+    name = "cache"
+    _STOP = object()
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        path: Optional[str] = None,
+        ttl_seconds: Optional[float] = None,
+        disk_max_entries: Optional[int] = None,
+        max_pending_writes: int = MAX_PENDING_WRITES
+    ):
+        self.max_entries = max_entries
+        self.path = path or None
+        self.ttl_seconds = ttl_seconds if ttl_seconds and ttl_seconds > 0 else None
+        self.disk_max_entries = disk_max_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Serializes use of the shared connection between readers and the writer
+        self._disk_lock = threading.Lock()
+        self._conn = None
+        self._writes: "queue.Queue" = queue.Queue(maxsize=max_pending_writes)
+        self._writer: Optional[threading.Thread] = None
+        self._disk_writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dropped_writes = 0
+        if self.path:
+            self._open_disk_tier()
+
+    @abc.abstractmethod
+    def _serialize(self, value: Any) -> bytes:
+        ...
+
+    @abc.abstractmethod
+    def _deserialize(self, raw: bytes) -> Any:
+        ...
+
+    def _open_disk_tier(self):
+        try:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    key TEXT PRIMARY KEY,
+                    value BLOB,
+                    expires_at REAL,
+                    last_access REAL
+                )
+            """)
+            self._conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to open {self.table} at {self.path}: {e}")
+            self._conn = None
+            return
+        self._writer = threading.Thread(target=self._run_writer, name=f"{self.table}-writer", daemon=True)
+        self._writer.start()
+
+    def peek_by_key(self, key: str) -> Optional[Any]:
+        """Memory tier only; never touches disk, so it is safe from synchronous code."""
+        with self._lock:
+            return self._get_memory(key, time.time())
+
+    async def get_by_key(self, key: str) -> Optional[Any]:
+        return (await self.get_many_by_key([key]))[0]
+
+    async def get_many_by_key(self, keys: List[str]) -> List[Optional[Any]]:
+        """Look keys up in memory, then read all memory misses from disk in one worker-thread call."""
+        now = time.time()
+        with self._lock:
+            values = [self._get_memory(key, now) for key in keys]
+        missing = [index for index, value in enumerate(values) if value is None]
+        entries = [None] * len(missing)
+        if missing and self._conn is not None:
+            entries = await asyncio.to_thread(self._read_disk_many, [keys[index] for index in missing], now)
+        with self._lock:
+            for index, entry in zip(missing, entries):
+                if entry is None:
+                    self.misses += 1
+                    metrics.CACHE_LOOKUPS.inc(cache=self.name, result="misses")
+                    continue
+                values[index], expires_at = entry
+                self._put_memory(keys[index], values[index], expires_at)
+                self.disk_hits += 1
+                metrics.CACHE_LOOKUPS.inc(cache=self.name, result="disk_hits")
+        return values
+
+    def set_by_key(self, key: str, value: Any):
+        """Store in memory now; the disk write is queued for the writer thread."""
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._put_memory(key, value, expires_at)
+        if self._writer is None:
+            return
+        try:
+            self._writes.put_nowait((key, value, expires_at))
+        except queue.Full:
+            # A lost disk write only costs a future miss
+            self.dropped_writes += 1
+
+    def _get_memory(self, key: str, now: float) -> Optional[Any]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        self.memory_hits += 1
+        metrics.CACHE_LOOKUPS.inc(cache=self.name, result="memory_hits")
+        return value
+
+    def _put_memory(self, key: str, value: Any, expires_at: Optional[float]):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _read_disk_many(self, keys: List[str], now: float) -> list:
+        with self._disk_lock:
+            if self._conn is None:
+                return [None] * len(keys)
+            try:
+                entries, expired, touched = [], [], []
+                for key in keys:
+                    row = self._conn.execute(
+                        f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row and row[1] is not None and row[1] <= now:
+                        expired.append((key,))
+                        row = None
+                    if row:
+                        touched.append((now, key))
+                    entries.append((self._deserialize(row[0]), row[1]) if row else None)
+                if expired:
+                    self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", expired)
+                if touched and self.disk_max_entries:
+                    self._conn.executemany(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", touched)
+                if expired or (touched and self.disk_max_entries):
+                    self._conn.commit()
+                return entries
+            except Exception as e:
+                logger.error(f"{self.table} read failed: {e}")
+                return [None] * len(keys)
+
+    def _run_writer(self):
+        stopping = False
+        while not stopping:
+            batch = [self._writes.get()]
+            # Whatever queued up meanwhile goes into the same transaction
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            if any(item is self._STOP for item in batch):
+                stopping = True
+                batch = [item for item in batch if item is not self._STOP]
+            self._write_disk(batch)
+
+    def _write_disk(self, batch: list):
+        if not batch:
+            return
+        with self._disk_lock:
+            if self._conn is None:
+                return
+            try:
+                now = time.time()
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                    [(key, self._serialize(value), expires_at, now) for key, value, expires_at in batch]
+                )
+                previous, self._disk_writes = self._disk_writes, self._disk_writes + len(batch)
+                if previous // 100 != self._disk_writes // 100:
+                    self._prune_disk(now)
+                self._conn.commit()
+            except Exception as e:
+                logger.error(f"{self.table} write failed ({len(batch)} entries): {e}")
+
+    def _prune_disk(self, now: float):
+        if self.ttl_seconds:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+        if self.disk_max_entries:
+            self._conn.execute(f"""
+                DELETE FROM {self.table} WHERE key IN (
+                    SELECT key FROM {self.table}
+                    ORDER BY last_access DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """, (self.disk_max_entries,))
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "disk_enabled": self._conn is not None,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "pending_writes": self._writes.qsize(),
+            "dropped_writes": self.dropped_writes,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self, timeout: float = 5.0):
+        """Flush queued disk writes, then close the connection."""
+        if self._writer is not None and self._writer.is_alive():
+            # Blocking put: the stop marker must get in even if the queue is full
+            self._writes.put(self._STOP)
+            self._writer.join(timeout)
+        self._writer = None
+        with self._disk_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class EmbeddingCache(TieredCache):
+    """Query vectors keyed by model ID plus normalized text.
+
+    model_id may be None until the backend reports it (the sidecar does so
+    at handshake); until then every lookup misses and nothing is stored.
+    """
+
+    table = "embedding_cache"
+    name = "embedding"
+
+    def __init__(
+        self,
+        model_id: Optional[str],
+        max_entries: int = 2048,
+        path: Optional[str] = None,
+        disk_max_entries: Optional[int] = None
+    ):
+        super().__init__(max_entries=max_entries, path=path, disk_max_entries=disk_max_entries)
+        self.model_id = model_id
+
+    def _serialize(self, value: List[float]) -> bytes:
+        return array("f", value).tobytes()
+
+    def _deserialize(self, raw: bytes) -> List[float]:
+        return array("f", raw).tolist()
+
+    def make_key(self, text: str) -> str:
+        raw = f"{self.model_id}\x00{normalize_text(text)}".encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    async def get(self, text: str) -> Optional[List[float]]:
+        return (await self.get_many([text]))[0]
+
+    async def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        if self.model_id is None:
+            return [None] * len(texts)
+        return await self.get_many_by_key([self.make_key(text) for text in texts])
+
+    def peek(self, text: str) -> Optional[List[float]]:
+        if self.model_id is None:
+            return None
+        return self.peek_by_key(self.make_key(text))
+
+    def set(self, text: str, vector: List[float]):
+        if self.model_id is not None:
+            self.set_by_key(self.make_key(text), vector)
+
+    def stats(self) -> dict:
+        return {"model_id": self.model_id, **super().stats()}
+
+
+class ResponseCache(TieredCache):
+    """Refined LLM output keyed by a content hash of everything that shapes the prompt."""
+
+    table = "response_cache"
+    name = "response"
+
+    def _serialize(self, value: str) -> bytes:
+        return value.encode("utf-8")
+
+    def _deserialize(self, raw: bytes) -> str:
+        return raw.decode("utf-8") if isinstance(raw, bytes) else raw
+
+    def make_key(self, request, references, prompt_version: str, model: str) -> str:
+        material = {
+            "draft": request.current_description,
+            "summary": request.summary,
+            "issue_type": request.issue_type,
+            "output_language": request.output_language,
+            "references": [
+                [ref.source_type, ref.title, ref.content_excerpt] for ref in references
+            ],
+            "prompt_version": prompt_version,
+            "model": model,
+        }
+        raw = json.dumps(material, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
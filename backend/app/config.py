@@ -1,6 +1,8 @@
+import hashlib
 import os
 import yaml
 from functools import lru_cache
+from typing import Dict
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -9,11 +11,125 @@ class Settings(BaseSettings):
     
     OPENROUTER_API_KEY: str = ""
     LM_STUDIO_URL: str = "http://localhost:1234/v1"
+    LLM_TIMEOUT: float = 120.0
+    LLM_MAX_CONNECTIONS: int = 20
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    # Scheduler: concurrent calls per provider (overrides as JSON, e.g. {"lmstudio": 2})
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_PROVIDER_CONCURRENCY: Dict[str, int] = {}
+    # Calls waiting beyond LLM_MAX_QUEUE, or longer than LLM_QUEUE_TIMEOUT seconds, are refused
+    LLM_MAX_QUEUE: int = 100
+    LLM_QUEUE_TIMEOUT: float = 30.0
+    LLM_MAX_RETRIES: int = 3
+    LLM_BACKOFF_BASE: float = 0.5
+    LLM_BACKOFF_MAX: float = 20.0
+    # Hedging: if the primary has no first token (stream) / no answer (complete) after the
+    # adaptive delay, send the same prompt to LLM_HEDGE_PROVIDER; the first to answer wins.
+    # Empty disables hedging.
+    LLM_HEDGE_PROVIDER: str = ""
+    # Defaults to LLM_MODEL
+    LLM_HEDGE_MODEL: str = ""
+    LLM_HEDGE_PERCENTILE: float = 0.95
+    # Used until enough primary latencies have been observed
+    LLM_HEDGE_INITIAL_DELAY: float = 3.0
+    LLM_HEDGE_MIN_DELAY: float = 0.5
+    LLM_HEDGE_MAX_DELAY: float = 15.0
+    # Static request rate before the provider reports its own limits; 0 = unlimited
+    LLM_RATE_LIMIT_RPS: float = 0.0
 
     QDRANT_URL: str = "http://localhost:6333"
     QDRANT_COLLECTION_USM: str = "usm_nodes"
     QDRANT_COLLECTION_TEST: str = "test_cases"
     QDRANT_COLLECTION_JIRA: str = "jira_references"
+    QDRANT_PREFER_GRPC: bool = False
+    QDRANT_GRPC_PORT: int = 6334
+    QDRANT_TIMEOUT: int = 10
+    QDRANT_MAX_CONNECTIONS: int = 20
+
+    EMBEDDING_MODEL: str = "BAAI/bge-m3"
+    # flag (PyTorch via FlagEmbedding) | torch-int8 | onnx | sidecar
+    EMBEDDING_BACKEND: str = "flag"
+    # Only useful on GPU; on CPU fp16 is slower than fp32
+    EMBEDDING_USE_FP16: bool = False
+    # 0 keeps the runtime default
+    EMBEDDING_NUM_THREADS: int = 0
+    EMBEDDING_MAX_LENGTH: int = 512
+    EMBEDDING_TRUNCATION_SIDE: str = "right"
+    EMBEDDING_ONNX_PATH: str = ""
+    # Tokenizer to pair with the ONNX model; defaults to EMBEDDING_MODEL
+    EMBEDDING_ONNX_TOKENIZER: str = ""
+    # EMBEDDING_BACKEND=sidecar: workers share one model process (python -m app.embedding_sidecar)
+    EMBEDDING_SIDECAR_SOCKET: str = "/tmp/requirement-assistant-embedding.sock"
+    # Backend the sidecar process itself loads
+    EMBEDDING_SIDECAR_BACKEND: str = "flag"
+    EMBEDDING_SIDECAR_TIMEOUT: float = 30.0
+    EMBEDDING_CACHE_SIZE: int = 2048
+    # Empty disables the on-disk tier
+    EMBEDDING_CACHE_PATH: str = "embedding_cache.db"
+    # Least recently used vectors beyond this are pruned from the SQLite tier (~4 KB each)
+    EMBEDDING_CACHE_DISK_MAX_ENTRIES: int = 50000
+    EMBEDDING_BATCH_MAX_SIZE: int = 32
+    EMBEDDING_BATCH_WAIT_MS: float = 2.0
+    # Background model load retries back off exponentially up to this interval
+    EMBEDDING_LOAD_RETRY_MAX_SECONDS: float = 60.0
+
+    RESPONSE_CACHE_SIZE: int = 512
+    RESPONSE_CACHE_TTL_SECONDS: int = 86400
+    # Empty keeps the cache per process; set a SQLite path to share it across workers
+    RESPONSE_CACHE_PATH: str = ""
+    RESPONSE_CACHE_DISK_MAX_ENTRIES: int = 10000
+
+    # Reference context sent to the LLM is packed into this many (estimated) tokens; 0 disables
+    CONTEXT_TOKEN_BUDGET: int = 3000
+    # Per-model overrides as JSON, e.g. {"google/gemini-2.0-flash-exp:free": 6000}
+    CONTEXT_TOKEN_BUDGETS: Dict[str, int] = {}
+    # MMR trade-off between relevance (1.0) and diversity (0.0)
+    CONTEXT_MMR_LAMBDA: float = 0.7
+    # References at least this similar to a better one are dropped
+    CONTEXT_DUPLICATE_THRESHOLD: float = 0.95
+    CONTEXT_MIN_REFERENCE_TOKENS: int = 48
+    # Fetch hit vectors from Qdrant so duplicates are judged on embeddings, not words;
+    # off by default since each hit then carries ~4 KB of JSON floats
+    CONTEXT_FETCH_VECTORS: bool = False
+
+    # /api/v1/refine/batch: concurrent LLM calls per batch, and how long finished jobs stay pollable
+    BATCH_LLM_CONCURRENCY: int = 8
+    BATCH_JOB_TTL_SECONDS: int = 3600
+    BATCH_MAX_JOBS: int = 100
+
+    # Semantic cache: reuse results of near-identical queries (same team and language)
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_SIZE: int = 512
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95
+    SEMANTIC_CACHE_TTL_SECONDS: int = 3600
+    # Also reuse the refined draft; needs a stricter threshold than references
+    SEMANTIC_CACHE_DRAFTS: bool = False
+    SEMANTIC_CACHE_DRAFT_THRESHOLD: float = 0.98
+
+    # prompts.yaml is checked for changes at most this often (seconds; 0 disables hot reload)
+    PROMPTS_RELOAD_INTERVAL: float = 2.0
+    # Ask for usage on streams too (cached prompt tokens are reported there)
+    LLM_STREAM_INCLUDE_USAGE: bool = True
+
+    # Memory-mapped collection snapshots (python -m app.snapshot); empty disables
+    SNAPSHOT_DIR: str = ""
+    SNAPSHOT_DTYPE: str = "float16"
+    # Collections with at most this many points are searched in-process instead of Qdrant
+    SNAPSHOT_PRIMARY_MAX_POINTS: int = 0
+    # Qdrant searches slower than this fall back to the snapshot
+    SNAPSHOT_QDRANT_TIMEOUT: float = 1.0
+    # Snapshots whose float32 matrix fits are dequantized into memory once (per collection)
+    SNAPSHOT_RESIDENT_MAX_MB: int = 256
+
+    # Bulk ingestion (python -m app.ingest)
+    INGEST_STATE_PATH: str = "ingest_state.db"
+    INGEST_BATCH_SIZE: int = 256
+    INGEST_UPSERT_CHUNK: int = 128
+    INGEST_PARALLEL_UPSERTS: int = 4
+
+    # Readiness probes reuse dependency checks for this long
+    HEALTH_PROBE_TTL_SECONDS: float = 5.0
+    HEALTH_PROBE_TIMEOUT: float = 2.0
     LOG_LEVEL: str = "INFO"
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
@@ -24,15 +140,31 @@ def get_settings():
 
 class PromptConfig:
     _prompts = {}
+    # Content hash of the loaded prompts.yaml; part of the response cache key
+    version = ""
 
-    @classmethod
-    def load(cls, path="prompts.yaml"):
+    @staticmethod
+    def resolve_path(path="prompts.yaml") -> str:
         if not os.path.exists(path):
             # Fallback path if running from backend root
             path = os.path.join(os.path.dirname(__file__), "..", "prompts.yaml")
-        
+        return path
+
+    @staticmethod
+    def read(path: str):
+        """(prompts, version) parsed from a prompts file, without installing them."""
         with open(path, "r", encoding="utf-8") as f:
-            cls._prompts = yaml.safe_load(f)
+            raw = f.read()
+        return yaml.safe_load(raw) or {}, hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def install(cls, prompts: dict, version: str):
+        cls._prompts = prompts
+        cls.version = version
+
+    @classmethod
+    def load(cls, path="prompts.yaml"):
+        cls.install(*cls.read(cls.resolve_path(path)))
 
     @classmethod
     def get(cls, key: str) -> str:
@@ -0,0 +1,229 @@
+import math
+import re
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from app.schemas import RetrievedReference
+
+# Labels written by the RAGService formatters. Headline fields identify the
+# reference and are kept whole; body fields are what gets truncated.
+HEADLINE_FIELDS = ("Story", "TestCase", "JIRA", "Summary", "Component")
+BODY_FIELDS = ("Desc", "I want", "Pre", "Steps", "AC")
+FIELD_PATTERN = re.compile(
+    r"^(" + "|".join(re.escape(label) for label in HEADLINE_FIELDS + BODY_FIELDS) + r"): ?",
+    re.MULTILINE
+)
+CJK_PATTERN = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+WORD_PATTERN = re.compile(r"\w+")
+ELLIPSIS = "…"
+# Separator and "[SOURCE] title:" header added per reference by _build_messages
+REFERENCE_OVERHEAD_TOKENS = 12
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokenizer-free estimate: CJK characters ~1 token each, other text ~4 chars per token.
+
+    Slightly pessimistic for most BPE vocabularies, which keeps packed
+    prompts under budget without loading a tokenizer per model.
+    """
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    # Binary search on character length; estimate_tokens is monotonic in prefix length
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) + 1 <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low].rstrip() + ELLIPSIS
+
+
+def split_fields(excerpt: str) -> List[Tuple[str, str]]:
+    """Split a formatted excerpt into (label, value) pairs; unlabeled text gets label ""."""
+    matches = list(FIELD_PATTERN.finditer(excerpt))
+    if not matches:
+        return [("", excerpt)]
+    fields = []
+    if matches[0].start() > 0:
+        fields.append(("", excerpt[:matches[0].start()].rstrip("\n")))
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(excerpt)
+        fields.append((match.group(1), excerpt[match.end():end].rstrip("\n")))
+    return fields
+
+
+def join_fields(fields: Sequence[Tuple[str, str]]) -> str:
+    return "\n".join(f"{label}: {value}" if label else value for label, value in fields)
+
+
+def water_fill_cap(costs: Sequence[int], budget: int) -> int:
+    """Largest per-item cap c with sum(min(cost, c)) <= budget."""
+    if sum(costs) <= budget:
+        return max(costs, default=0)
+    remaining, count = budget, len(costs)
+    for cost in sorted(costs):
+        share = remaining // count
+        if cost > share:
+            return share
+        remaining -= cost
+        count -= 1
+    return remaining
+
+
+def truncate_excerpt(excerpt: str, max_tokens: int) -> str:
+    """Fit an excerpt into max_tokens by trimming the longest body fields first."""
+    if estimate_tokens(excerpt) <= max_tokens:
+        return excerpt
+    fields = split_fields(excerpt)
+    body = [index for index, (label, _) in enumerate(fields) if label in BODY_FIELDS or label == ""]
+    fixed = sum(
+        estimate_tokens(f"{label}: {value}\n") for index, (label, value) in enumerate(fields) if index not in body
+    )
+    label_cost = sum(estimate_tokens(f"{fields[index][0]}: \n") for index in body)
+    body_budget = max_tokens - fixed - label_cost
+    if not body or body_budget <= 0:
+        return truncate_to_tokens(excerpt, max_tokens)
+
+    cap = water_fill_cap([estimate_tokens(fields[index][1]) for index in body], body_budget)
+    trimmed = list(fields)
+    for index in body:
+        label, value = fields[index]
+        trimmed[index] = (label, truncate_to_tokens(value, cap))
+    return join_fields(trimmed)
+
+
+def word_jaccard(left: set, right: set) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def similarity_matrix(refs: Sequence[RetrievedReference]) -> np.ndarray:
+    """Pairwise reference similarity: cosine of retrieval vectors, word Jaccard otherwise."""
+    count = len(refs)
+    similarities = np.zeros((count, count))
+    embedded = [index for index, ref in enumerate(refs) if ref.vector is not None]
+    if len(embedded) > 1:
+        matrix = np.asarray([refs[index].vector for index in embedded], dtype=np.float64)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms > 0, norms, 1.0)
+        similarities[np.ix_(embedded, embedded)] = matrix @ matrix.T
+    # References selected in the extension arrive without vectors
+    has_vector = [ref.vector is not None for ref in refs]
+    if not all(has_vector):
+        words = [set(WORD_PATTERN.findall(ref.content_excerpt.lower())) for ref in refs]
+        for row in range(count):
+            for column in range(row + 1, count):
+                if not (has_vector[row] and has_vector[column]):
+                    similarities[row, column] = similarities[column, row] = word_jaccard(words[row], words[column])
+    return similarities
+
+
+@dataclass
+class PackedContext:
+    references: List[RetrievedReference]
+    tokens_before: int = 0
+    tokens_after: int = 0
+    duplicates_dropped: int = 0
+    truncated: int = 0
+    overflow_dropped: int = 0
+    budget: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.tokens_before - self.tokens_after, 0)
+
+
+@dataclass
+class ContextPacker:
+    """Orders references by MMR, drops near-duplicates and fits them into a token budget.
+
+    budget <= 0 disables packing and passes references through unchanged.
+    """
+
+    budget: int = 3000
+    mmr_lambda: float = 0.7
+    duplicate_threshold: float = 0.95
+    min_reference_tokens: int = 48
+
+    @property
+    def fingerprint(self) -> str:
+        return f"ctx{self.budget}/{self.mmr_lambda}/{self.duplicate_threshold}/{self.min_reference_tokens}"
+
+    @staticmethod
+    def reference_tokens(ref: RetrievedReference) -> int:
+        return estimate_tokens(ref.title) + estimate_tokens(ref.content_excerpt) + REFERENCE_OVERHEAD_TOKENS
+
+    def diversify(self, refs: List[RetrievedReference]) -> Tuple[List[RetrievedReference], int]:
+        """Greedy MMR over relevance_score; returns the new order and the duplicate count."""
+        similarities = similarity_matrix(refs)
+        remaining = sorted(range(len(refs)), key=lambda index: refs[index].relevance_score, reverse=True)
+        selected: List[int] = []
+        # Highest similarity of each candidate to anything selected so far
+        redundancy = [0.0] * len(refs)
+        duplicates = 0
+        while remaining:
+            best = max(
+                remaining,
+                key=lambda index: self.mmr_lambda * refs[index].relevance_score
+                - (1 - self.mmr_lambda) * redundancy[index]
+            )
+            remaining.remove(best)
+            selected.append(best)
+
+            kept = []
+            for index in remaining:
+                similarity = float(similarities[index, best])
+                if similarity >= self.duplicate_threshold:
+                    duplicates += 1
+                    continue
+                kept.append(index)
+                redundancy[index] = max(redundancy[index], similarity)
+            remaining = kept
+        return [refs[index] for index in selected], duplicates
+
+    def pack(self, refs: List[RetrievedReference]) -> PackedContext:
+        tokens_before = sum(self.reference_tokens(ref) for ref in refs)
+        if self.budget <= 0 or not refs:
+            return PackedContext(list(refs), tokens_before, tokens_before, budget=self.budget)
+
+        ordered, duplicates = self.diversify(refs)
+
+        # Keep as many references as can each get min_reference_tokens, best first
+        max_refs = max(self.budget // max(self.min_reference_tokens, 1), 1)
+        overflow = max(len(ordered) - max_refs, 0)
+        ordered = ordered[:max_refs]
+
+        costs = [self.reference_tokens(ref) for ref in ordered]
+        cap = water_fill_cap(costs, self.budget)
+        packed, truncated = [], 0
+        for ref, cost in zip(ordered, costs):
+            if cost <= cap:
+                packed.append(ref)
+                continue
+            header = estimate_tokens(ref.title) + REFERENCE_OVERHEAD_TOKENS
+            excerpt = truncate_excerpt(ref.content_excerpt, max(cap - header, 1))
+            packed.append(ref.model_copy(update={"content_excerpt": excerpt}))
+            truncated += 1
+
+        return PackedContext(
+            references=packed,
+            tokens_before=tokens_before,
+            tokens_after=sum(self.reference_tokens(ref) for ref in packed),
+            duplicates_dropped=duplicates,
+            truncated=truncated,
+            overflow_dropped=overflow,
+            budget=self.budget
+        )
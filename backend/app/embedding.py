@@ -0,0 +1,410 @@
+import abc
+import argparse
+import asyncio
+import logging
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+logger = logging.getLogger("uvicorn")
+
+
+class EmbeddingBackend(abc.ABC):
+    """Encodes texts into normalized dense vectors.
+
+    Heavy libraries are imported in load(), so picking a backend only pays
+    for the runtime it actually uses.
+    """
+
+    name = ""
+
+    def __init__(self, model_name: str, max_length: int = 512, truncation_side: str = "right", num_threads: int = 0):
+        self.model_name = model_name
+        self.max_length = max_length
+        self.truncation_side = truncation_side
+        self.num_threads = num_threads
+
+    @property
+    def model_id(self) -> Optional[str]:
+        """Identifies the vectors this backend produces; the embedding cache namespace."""
+        return f"{self.model_name}@{self.name}:{self.max_length}"
+
+    @abc.abstractmethod
+    def load(self) -> "EmbeddingBackend":
+        """Import the runtime and load the model; returns self."""
+
+    @abc.abstractmethod
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        ...
+
+
+class FlagEmbeddingBackend(EmbeddingBackend):
+    """Reference PyTorch implementation through FlagEmbedding."""
+
+    name = "flag"
+
+    def __init__(self, *args, use_fp16: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.use_fp16 = use_fp16
+        self._model = None
+
+    def load(self):
+        import torch
+        from FlagEmbedding import FlagModel
+
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        self._model = FlagModel(self.model_name, use_fp16=self.use_fp16)
+        self._model.tokenizer.truncation_side = self.truncation_side
+        return self
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        return self._model.encode(texts, max_length=self.max_length).tolist()
+
+
+class QuantizedTorchBackend(FlagEmbeddingBackend):
+    """FlagEmbedding with Linear layers dynamically quantized to int8 (CPU only)."""
+
+    name = "torch-int8"
+
+    def load(self):
+        import torch
+
+        self.use_fp16 = False
+        super().load()
+        self._model.model = torch.quantization.quantize_dynamic(
+            self._model.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        return self
+
+
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    """ONNX Runtime session over an exported bge-m3 encoder (fp32 or int8).
+
+    Export with `optimum-cli export onnx --model BAAI/bge-m3 --task feature-extraction <dir>`
+    and optionally quantize with `python -m app.embedding quantize`. Only the
+    tokenizer comes from transformers, so torch is never imported.
+    """
+
+    name = "onnx"
+
+    def __init__(self, *args, onnx_path: str = "", tokenizer_name: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.onnx_path = onnx_path
+        self.tokenizer_name = tokenizer_name or self.model_name
+        self._session = None
+        self._tokenizer = None
+        self._input_names = ()
+
+    def load(self):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        if not self.onnx_path or not os.path.exists(self.onnx_path):
+            raise FileNotFoundError(f"EMBEDDING_ONNX_PATH not found: {self.onnx_path!r}")
+        options = onnxruntime.SessionOptions()
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = onnxruntime.InferenceSession(
+            self.onnx_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = tuple(node.name for node in self._session.get_inputs())
+        self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+        self._tokenizer.truncation_side = self.truncation_side
+        return self
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+
+        tokens = self._tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np"
+        )
+        feeds = {name: tokens[name].astype(np.int64) for name in self._input_names if name in tokens}
+        output = self._session.run(None, feeds)[0]
+        # bge-m3 dense embedding = normalized CLS token of the last hidden state
+        vectors = output[:, 0] if output.ndim == 3 else output
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.clip(norms, 1e-12, None)).tolist()
+
+
+EMBEDDING_BACKENDS = {
+    backend.name: backend
+    for backend in (FlagEmbeddingBackend, QuantizedTorchBackend, OnnxEmbeddingBackend)
+}
+
+
+def embedding_model_id(settings) -> Optional[str]:
+    """EmbeddingBackend.model_id for a configuration, known before the model loads.
+
+    None for the sidecar backend: its vectors come from whatever model the
+    sidecar process loaded, which it reports at handshake.
+    """
+    if settings.EMBEDDING_BACKEND == "sidecar":
+        return None
+    return f"{settings.EMBEDDING_MODEL}@{settings.EMBEDDING_BACKEND}:{settings.EMBEDDING_MAX_LENGTH}"
+
+
+def create_embedding_backend(settings, backend_name: Optional[str] = None) -> EmbeddingBackend:
+    name = backend_name or settings.EMBEDDING_BACKEND
+    common = {
+        "max_length": settings.EMBEDDING_MAX_LENGTH,
+        "truncation_side": settings.EMBEDDING_TRUNCATION_SIDE,
+        "num_threads": settings.EMBEDDING_NUM_THREADS,
+    }
+    if name == "sidecar":
+        # Imported here: the sidecar module builds on this one
+        from app.embedding_sidecar import SidecarEmbeddingBackend
+
+        return SidecarEmbeddingBackend(
+            settings.EMBEDDING_MODEL,
+            socket_path=settings.EMBEDDING_SIDECAR_SOCKET,
+            timeout=settings.EMBEDDING_SIDECAR_TIMEOUT,
+            **common
+        )
+    backend_cls = EMBEDDING_BACKENDS.get(name)
+    if backend_cls is None:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{name}'. Options: {', '.join(EMBEDDING_BACKENDS)}, sidecar")
+    if backend_cls is OnnxEmbeddingBackend:
+        return backend_cls(
+            settings.EMBEDDING_MODEL,
+            onnx_path=settings.EMBEDDING_ONNX_PATH,
+            tokenizer_name=settings.EMBEDDING_ONNX_TOKENIZER or None,
+            **common
+        )
+    if backend_cls is FlagEmbeddingBackend:
+        return backend_cls(settings.EMBEDDING_MODEL, use_fp16=settings.EMBEDDING_USE_FP16, **common)
+    return backend_cls(settings.EMBEDDING_MODEL, **common)
+
+
+class EmbeddingBatcher:
+    """Micro-batches concurrent embed calls onto a single worker thread.
+
+    When the encoder is idle, whatever is queued is dispatched at once, so a
+    lone request pays no extra latency. Texts that arrive while an encode is
+    running are picked up by the next batch; if the embedding thread is
+    still busy (e.g. with embed_many), the batch stays open for up to
+    max_wait_ms, up to max_batch_size texts, so batching grows with load.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], Sequence[Sequence[float]]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 2.0
+    ):
+        self._encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+        self._queue = None
+        self._loop = None
+        self._worker = None
+        # Encodes running or waiting on the embedding thread
+        self._encoding = 0
+        # Collected texts whose encode has not finished yet
+        self._batch: List[tuple] = []
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def embed(self, text: str) -> List[float]:
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """Encode a known list in one call on the embedding thread, bypassing the queue."""
+        if not texts:
+            return []
+        unique = list(dict.fromkeys(texts))
+        vectors = await self._encode(asyncio.get_running_loop(), unique)
+        by_text = dict(zip(unique, vectors))
+        return [list(by_text[text]) for text in texts]
+
+    async def _encode(self, loop, texts: List[str]):
+        self._encoding += 1
+        try:
+            return await loop.run_in_executor(self._executor, self._encode_fn, texts)
+        finally:
+            self._encoding -= 1
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if not self._encoding:
+            return batch
+
+        # The embedding thread is busy anyway: let more texts join meanwhile
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size and self._encoding:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            batch = [(text, future) for text, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            self._batch = batch
+            try:
+                vectors = await self._encode(self._loop, texts)
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(texts)} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            finally:
+                self._batch = []
+
+            by_text = dict(zip(texts, vectors))
+            for text, future in batch:
+                if not future.done():
+                    future.set_result(list(by_text[text]))
+
+    def close(self):
+        """Stop the worker; every caller still waiting gets an error instead of hanging."""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        pending = list(self._batch)
+        self._batch = []
+        if self._queue is not None:
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Embedding batcher closed"))
+        self._executor.shutdown(wait=False)
+
+
+PARITY_SAMPLES = [
+    "調整金額(CN)/注數(VNC) 點擊投注左方的數字, 彈出簡易計算機後修改想要的數字並點擊確認完成修改",
+    "使用者可以在結帳頁輸入折扣碼，當使用者輸入有效折扣碼時，應顯示折扣後價格。",
+    "單一遊戲 API 帶入 ext 未生成壓縮圖使用 PNG",
+    "Step1. 登入後台 Step2. 進入報表頁面 Step3. 匯出 CSV，預期檔案包含所有欄位",
+    "Implement Google Login. User wants to login with google without creating a new password.",
+    "As a merchant admin I want to export the monthly settlement report so that finance can reconcile.",
+    "Given the user is on the deposit page When the amount exceeds the limit Then an error is shown",
+    "修改想要投注的金額或注数，简体中文描述也应该得到相近的向量",
+]
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _max_rss_mb() -> float:
+    import resource
+
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _timed_load_and_encode(backend: EmbeddingBackend, texts: List[str], rounds: int):
+    rss_before = _max_rss_mb()
+    started = time.perf_counter()
+    backend.load()
+    load_s = time.perf_counter() - started
+    vectors = backend.encode(texts)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        backend.encode(texts)
+    encode_ms = (time.perf_counter() - started) / max(rounds, 1) * 1000
+    return vectors, load_s, encode_ms, _max_rss_mb() - rss_before
+
+
+def run_parity(args) -> int:
+    from app.config import get_settings
+
+    settings = get_settings()
+    texts = PARITY_SAMPLES
+    if args.texts:
+        with open(args.texts, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    # Candidate first, so its peak RSS is not hidden by the reference model
+    candidate = create_embedding_backend(settings, args.backend)
+    candidate_vectors, candidate_load, candidate_ms, candidate_rss = _timed_load_and_encode(candidate, texts, args.rounds)
+
+    reference = FlagEmbeddingBackend(
+        settings.EMBEDDING_MODEL,
+        max_length=settings.EMBEDDING_MAX_LENGTH,
+        truncation_side=settings.EMBEDDING_TRUNCATION_SIDE,
+        num_threads=settings.EMBEDDING_NUM_THREADS,
+        use_fp16=False
+    )
+    reference_vectors, reference_load, reference_ms, _ = _timed_load_and_encode(reference, texts, args.rounds)
+
+    similarities = [_cosine(a, b) for a, b in zip(reference_vectors, candidate_vectors)]
+    worst = min(similarities)
+    print(f"backend={candidate.name} texts={len(texts)} threshold={args.threshold}")
+    print(f"cosine vs reference: min={worst:.5f} mean={sum(similarities) / len(similarities):.5f}")
+    print(f"load: candidate={candidate_load:.1f}s reference={reference_load:.1f}s")
+    print(f"encode batch of {len(texts)}: candidate={candidate_ms:.1f}ms reference={reference_ms:.1f}ms")
+    print(f"candidate peak RSS growth: {candidate_rss:.0f} MB")
+    if worst < args.threshold:
+        print("FAIL: similarity below threshold")
+        return 1
+    print("OK")
+    return 0
+
+
+def run_quantize(args) -> int:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(args.input, args.output, weight_type=QuantType.QInt8)
+    print(f"Wrote {args.output}")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Embedding backend utilities")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parity = commands.add_parser("parity", help="Compare a backend against the FlagEmbedding fp32 reference")
+    parity.add_argument("--backend", choices=sorted([*EMBEDDING_BACKENDS, "sidecar"]), help="Defaults to EMBEDDING_BACKEND")
+    parity.add_argument("--threshold", type=float, default=0.99, help="Minimum cosine similarity per text")
+    parity.add_argument("--texts", help="File with one sample text per line")
+    parity.add_argument("--rounds", type=int, default=3, help="Timed encode rounds")
+    parity.set_defaults(handler=run_parity)
+
+    quantize = commands.add_parser("quantize", help="Dynamic int8 quantization of an exported ONNX model")
+    quantize.add_argument("--input", required=True)
+    quantize.add_argument("--output", required=True)
+    quantize.set_defaults(handler=run_quantize)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    # Usage (from backend/): python -m app.embedding parity --backend onnx --threshold 0.99
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""Shared embedding process for multi-worker deployments.
+
+One sidecar loads the model and serves every uvicorn worker on the host over
+a Unix socket, so model memory no longer grows with the worker count:
+
+    python -m app.embedding_sidecar            # uses EMBEDDING_SIDECAR_SOCKET
+    EMBEDDING_BACKEND=sidecar uvicorn main:app --workers 4
+
+Wire format (little-endian, length-prefixed):
+    request:  u32 count, then count x (u32 byte length, UTF-8 text)
+    response: u8 status, then
+              status 0: u32 count, u32 dim, count * dim float32
+              status 1: u32 byte length, UTF-8 error message
+A request with count 0 is a handshake; the reply carries the vector dim,
+followed by u32 byte length and the UTF-8 model id of the loaded backend,
+which workers use to namespace their embedding caches.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from array import array
+from typing import List, Optional
+
+from app.embedding import EmbeddingBackend, EmbeddingBatcher, create_embedding_backend
+
+logger = logging.getLogger("uvicorn")
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+MAX_TEXTS_PER_REQUEST = 1024
+MAX_TEXT_BYTES = 1 << 20
+
+_U32 = struct.Struct("<I")
+_HEADER = struct.Struct("<BII")
+
+
+def encode_request(texts: List[str]) -> bytes:
+    parts = [_U32.pack(len(texts))]
+    for text in texts:
+        raw = text.encode("utf-8")
+        parts.append(_U32.pack(len(raw)))
+        parts.append(raw)
+    return b"".join(parts)
+
+
+def encode_vectors(vectors: List[List[float]], dim: int) -> bytes:
+    values = array("f")
+    for vector in vectors:
+        values.extend(vector)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return _HEADER.pack(STATUS_OK, len(vectors), dim) + values.tobytes()
+
+
+def encode_handshake(dim: int, model_id: str) -> bytes:
+    raw = model_id.encode("utf-8")
+    return _HEADER.pack(STATUS_OK, 0, dim) + _U32.pack(len(raw)) + raw
+
+
+def encode_error(message: str) -> bytes:
+    raw = message.encode("utf-8")
+    return bytes([STATUS_ERROR]) + _U32.pack(len(raw)) + raw
+
+
+def decode_vectors(raw: bytes, count: int, dim: int) -> List[List[float]]:
+    values = array("f", raw)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return [values[row * dim:(row + 1) * dim].tolist() for row in range(count)]
+
+
+class SidecarEmbeddingBackend(EmbeddingBackend):
+    """Client side: forwards each encode batch to the sidecar over a blocking socket.
+
+    encode() runs on the EmbeddingBatcher thread, so every worker still batches
+    its own queries and sends one request per batch.
+    """
+
+    name = "sidecar"
+
+    def __init__(self, model_name: str, socket_path: str, timeout: float = 30.0, connect_timeout: float = 120.0, **kwargs):
+        super().__init__(model_name, **kwargs)
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.dim = 0
+        self.remote_model_id: Optional[str] = None
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+
+    @property
+    def model_id(self) -> Optional[str]:
+        # Whatever the sidecar loaded; unknown until the handshake
+        return self.remote_model_id
+
+    def load(self):
+        # The sidecar may still be loading its model; keep retrying until connect_timeout
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                with self._lock:
+                    self._request([])
+                logger.info(f"Connected to embedding sidecar at {self.socket_path} ({self.model_id}, dim={self.dim})")
+                return self
+            except OSError as e:
+                self._close_socket()
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(f"Embedding sidecar unavailable at {self.socket_path}: {e}") from e
+                time.sleep(0.5)
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            try:
+                return self._request(texts)
+            except socket.timeout:
+                raise
+            except OSError:
+                # Sidecar restarted since the last batch: reconnect once
+                self._close_socket()
+                return self._request(texts)
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._sock = sock
+        try:
+            self._sock.sendall(encode_request(texts))
+            status = self._read_exact(1)[0]
+            if status != STATUS_OK:
+                (length,) = _U32.unpack(self._read_exact(4))
+                raise RuntimeError(f"Embedding sidecar error: {self._read_exact(length).decode('utf-8')}")
+            count, dim = struct.unpack("<II", self._read_exact(8))
+            self.dim = dim
+            if not texts:
+                (length,) = _U32.unpack(self._read_exact(4))
+                self.remote_model_id = self._read_exact(length).decode("utf-8")
+                return []
+            return decode_vectors(self._read_exact(count * dim * 4), count, dim)
+        except socket.timeout:
+            # A late reply would be read as the answer to the next request
+            self._close_socket()
+            raise
+
+    def _read_exact(self, size: int) -> bytes:
+        buffer = bytearray()
+        while len(buffer) < size:
+            chunk = self._sock.recv(size - len(buffer))
+            if not chunk:
+                raise ConnectionError("Embedding sidecar closed the connection")
+            buffer.extend(chunk)
+        return bytes(buffer)
+
+    def _close_socket(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+
+class EmbeddingSidecar:
+    """Server side: one model, requests from every worker merged by an EmbeddingBatcher."""
+
+    def __init__(self, backend: EmbeddingBackend, socket_path: str, max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        self.backend = backend
+        self.socket_path = socket_path
+        self.batcher = EmbeddingBatcher(backend.encode, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+        self.dim = 0
+
+    async def serve(self):
+        self.backend.load()
+        self.dim = len(self.backend.encode(["warm-up"])[0])
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        logger.info(f"Embedding sidecar ({self.backend.model_id}, dim={self.dim}) listening on {self.socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.batcher.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    (count,) = _U32.unpack(await reader.readexactly(4))
+                except asyncio.IncompleteReadError:
+                    break
+                if count > MAX_TEXTS_PER_REQUEST:
+                    writer.write(encode_error(f"too many texts ({count})"))
+                    await writer.drain()
+                    break
+                if count == 0:
+                    writer.write(encode_handshake(self.dim, self.backend.model_id))
+                    await writer.drain()
+                    continue
+                texts = []
+                for _ in range(count):
+                    (length,) = _U32.unpack(await reader.readexactly(4))
+                    if length > MAX_TEXT_BYTES:
+                        raise ValueError(f"text too long ({length} bytes)")
+                    texts.append((await reader.readexactly(length)).decode("utf-8"))
+                try:
+                    vectors = await asyncio.gather(*(self.batcher.embed(text) for text in texts))
+                    writer.write(encode_vectors(vectors, self.dim))
+                except Exception as e:
+                    logger.error(f"Sidecar encode failed: {e}")
+                    writer.write(encode_error(str(e)))
+                await writer.drain()
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError) as e:
+            logger.warning(f"Dropping sidecar client: {e}")
+        finally:
+            writer.close()
+
+
+def main(argv=None):
+    from app.config import get_settings
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Serve query embeddings to API workers over a Unix socket")
+    parser.add_argument("--socket", default=settings.EMBEDDING_SIDECAR_SOCKET)
+    parser.add_argument("--backend", default=settings.EMBEDDING_SIDECAR_BACKEND, help="Backend the sidecar loads")
+    args = parser.parse_args(argv)
+    if args.backend == SidecarEmbeddingBackend.name:
+        parser.error("the sidecar needs a model backend, not 'sidecar'")
+
+    logging.basicConfig(level=logging.INFO)
+    sidecar = EmbeddingSidecar(
+        create_embedding_backend(settings, args.backend),
+        args.socket,
+        max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+        max_wait_ms=settings.EMBEDDING_BATCH_WAIT_MS
+    )
+    try:
+        asyncio.run(sidecar.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
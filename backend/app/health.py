@@ -0,0 +1,51 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger("uvicorn")
+
+
+class CachedProbe:
+    """Runs a dependency check at most once per interval and reuses the result.
+
+    Orchestrators probe every few seconds per pod; without caching each probe
+    would add a round trip to Qdrant and the LLM provider. Concurrent callers
+    share a single in-flight check.
+    """
+
+    def __init__(self, name: str, check: Callable[[], Awaitable[None]], ttl_seconds: float = 5.0, timeout: float = 2.0):
+        self.name = name
+        self.check = check
+        self.ttl_seconds = ttl_seconds
+        self.timeout = timeout
+        self.ok: Optional[bool] = None
+        self.detail = "unknown"
+        self.checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self.ok is not None and time.monotonic() - self.checked_at < self.ttl_seconds
+
+    async def status(self) -> dict:
+        if not self._fresh():
+            async with self._lock:
+                if not self._fresh():
+                    await self._run()
+        return {
+            "ok": self.ok,
+            "detail": self.detail,
+            "age_seconds": round(time.monotonic() - self.checked_at, 1)
+        }
+
+    async def _run(self):
+        try:
+            await asyncio.wait_for(self.check(), timeout=self.timeout)
+            self.ok, self.detail = True, "connected"
+        except asyncio.TimeoutError:
+            self.ok, self.detail = False, f"error: timed out after {self.timeout}s"
+        except Exception as e:
+            self.ok, self.detail = False, f"error: {e}"
+        if not self.ok:
+            logger.warning(f"{self.name} probe failed: {self.detail}")
+        self.checked_at = time.monotonic()
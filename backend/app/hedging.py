@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Optional, Tuple, TypeVar
+
+logger = logging.getLogger("uvicorn")
+
+T = TypeVar("T")
+
+PRIMARY = "primary"
+HEDGE = "hedge"
+
+
+class LatencyTracker:
+    """Rolling window of primary-provider latencies for the adaptive hedge delay.
+
+    Calls cancelled because the hedge won are recorded at their elapsed time,
+    a lower bound of their true latency, so the window never only holds the
+    fast calls.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, quantile: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(int(quantile * len(ordered)), len(ordered) - 1)
+        return ordered[index]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+async def hedged(
+    primary: Awaitable[T],
+    start_hedge: Callable[[], Awaitable[T]],
+    delay: float,
+    discard: Optional[Callable[[T], Awaitable[None]]] = None
+) -> Tuple[T, str, bool]:
+    """Await primary; if it is not done after delay (or fails), race it against a hedge.
+
+    Returns (result, winner, hedge_started). The losing call is cancelled;
+    results that complete but lose the race are passed to discard so they
+    can release resources such as open streams. If every attempt fails, the
+    primary's exception is raised.
+    """
+    primary_task = asyncio.ensure_future(primary)
+    tasks = {primary_task: PRIMARY}
+    returned = None
+    try:
+        done, _ = await asyncio.wait({primary_task}, timeout=delay)
+        if done and primary_task.exception() is None:
+            returned = primary_task
+            return primary_task.result(), PRIMARY, False
+
+        if done:
+            logger.warning(f"Primary LLM failed ({primary_task.exception()}); failing over to hedge")
+        tasks[asyncio.ensure_future(start_hedge())] = HEDGE
+        pending = {task for task in tasks if not task.done()}
+        while returned is None and pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            returned = next((task for task in done if task.exception() is None), None)
+        if returned is None:
+            raise primary_task.exception()
+        return returned.result(), tasks[returned], True
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+            elif discard is not None and task is not returned and not task.cancelled() and task.exception() is None:
+                # Finished alongside the winner: still owns resources such as an open stream
+                await discard(task.result())
@@ -0,0 +1,422 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http import models as qdrant_models
+
+from app.config import get_settings
+
+logger = logging.getLogger("uvicorn")
+settings = get_settings()
+
+# kind -> (collection setting, field that identifies a record across exports)
+COLLECTION_KEYS = {
+    "usm": ("QDRANT_COLLECTION_USM", "node_id"),
+    "test": ("QDRANT_COLLECTION_TEST", "test_case_number"),
+    "jira": ("QDRANT_COLLECTION_JIRA", "issue_key"),
+}
+# Point ids are derived from the record key so re-ingesting overwrites in place
+POINT_NAMESPACE = uuid.UUID("6f1c2f1e-5d0b-4c3a-9f2e-1b7a4d8c9e10")
+MIGRATE_SCROLL_LIMIT = 1000
+
+STATE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS ingest_state (
+        collection TEXT NOT NULL,
+        record_key TEXT NOT NULL,
+        point_id TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        text_hash TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        model_id TEXT NOT NULL,
+        ingested_at REAL NOT NULL,
+        PRIMARY KEY (collection, record_key)
+    )
+"""
+UPSERT_STATE_SQL = """
+    INSERT INTO ingest_state (collection, record_key, point_id, content_hash, text_hash, updated_at, model_id, ingested_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (collection, record_key) DO UPDATE SET
+        point_id = excluded.point_id,
+        content_hash = excluded.content_hash,
+        text_hash = excluded.text_hash,
+        updated_at = excluded.updated_at,
+        model_id = excluded.model_id,
+        ingested_at = excluded.ingested_at
+"""
+
+
+def _hash(value) -> str:
+    encoded = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def point_id(collection: str, record_key: str) -> str:
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{collection}:{record_key}"))
+
+
+@dataclass
+class Record:
+    key: str
+    point_id: str
+    payload: dict
+    content_hash: str
+    text_hash: str
+    updated_at: str
+
+
+@dataclass
+class IngestStats:
+    read: int = 0
+    unchanged: int = 0
+    embedded: int = 0
+    payload_only: int = 0
+    invalid: int = 0
+    pruned: int = 0
+    migrated: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "read": self.read,
+            "unchanged": self.unchanged,
+            "embedded": self.embedded,
+            "payload_only": self.payload_only,
+            "invalid": self.invalid,
+            "pruned": self.pruned,
+            "migrated": self.migrated,
+            "elapsed_seconds": round(elapsed, 1),
+            "embedded_per_second": round(self.embedded / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+class IngestState:
+    """SQLite record of what each collection holds: content hash, updated_at and model per record.
+
+    Rows are written only after Qdrant acknowledged the upsert, so an
+    interrupted run resumes by running the same command again.
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(STATE_SCHEMA)
+        self.conn.commit()
+
+    def load(self, collection: str) -> Dict[str, Tuple[str, str, str, str]]:
+        """record_key -> (content_hash, text_hash, updated_at, model_id)"""
+        rows = self.conn.execute(
+            "SELECT record_key, content_hash, text_hash, updated_at, model_id FROM ingest_state WHERE collection = ?",
+            (collection,)
+        )
+        return {key: (content_hash, text_hash, updated_at, model_id) for key, content_hash, text_hash, updated_at, model_id in rows}
+
+    def save(self, collection: str, records: List[Record], model_id: str):
+        now = time.time()
+        self.conn.executemany(UPSERT_STATE_SQL, [
+            (collection, record.key, record.point_id, record.content_hash, record.text_hash, record.updated_at, model_id, now)
+            for record in records
+        ])
+        self.conn.commit()
+
+    def delete(self, collection: str, keys: List[str]):
+        self.conn.executemany(
+            "DELETE FROM ingest_state WHERE collection = ? AND record_key = ?",
+            [(collection, key) for key in keys]
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def read_records(path: str, collection: str, key_field: str, stats: IngestStats) -> Iterator[Record]:
+    with open(path, encoding="utf-8") as handle:
+        for line_number, line in enumerate(handle, 1):
+            line = line.strip()
+            if not line:
+                continue
+            stats.read += 1
+            try:
+                payload = json.loads(line)
+            except json.JSONDecodeError as e:
+                stats.invalid += 1
+                logger.warning(f"{path}:{line_number}: invalid JSON ({e})")
+                continue
+            key = payload.get(key_field) if isinstance(payload, dict) else None
+            if not key or not payload.get("text"):
+                stats.invalid += 1
+                logger.warning(f"{path}:{line_number}: missing {key_field} or text")
+                continue
+            key = str(key)
+            yield Record(
+                key=key,
+                point_id=point_id(collection, key),
+                payload=payload,
+                content_hash=_hash(payload),
+                text_hash=_hash(payload["text"]),
+                updated_at=str(payload.get("updated_at") or "")
+            )
+
+
+class Ingestor:
+    """Streams a JSONL export into one collection.
+
+    Unchanged records (same content hash, updated_at and embedding model) are
+    skipped; records whose text is unchanged only get their payload
+    overwritten. The rest are encoded in large batches on a worker thread
+    while earlier batches are upserted in parallel chunks.
+    """
+
+    def __init__(
+        self,
+        client: AsyncQdrantClient,
+        state: IngestState,
+        encode,
+        model_id: str,
+        batch_size: int = 256,
+        upsert_chunk: int = 128,
+        parallel_upserts: int = 4
+    ):
+        self.client = client
+        self.state = state
+        self.encode = encode
+        self.model_id = model_id
+        self.batch_size = max(1, batch_size)
+        self.upsert_chunk = max(1, upsert_chunk)
+        self._upsert_slots = asyncio.Semaphore(max(1, parallel_upserts))
+        self._pending: Set[asyncio.Task] = set()
+
+    async def ensure_collection(self, collection: str, vector_size: int):
+        if not await self.client.collection_exists(collection):
+            logger.info(f"Creating collection {collection} ({vector_size} dims, cosine)")
+            await self.client.create_collection(
+                collection_name=collection,
+                vectors_config=qdrant_models.VectorParams(size=vector_size, distance=qdrant_models.Distance.COSINE)
+            )
+
+    async def _write(self, collection: str, records: List[Record], operation):
+        try:
+            await operation
+            self.state.save(collection, records, self.model_id)
+        finally:
+            self._upsert_slots.release()
+
+    async def _submit(self, collection: str, records: List[Record], operation):
+        # Bounded: waits here when parallel_upserts chunks are already in flight
+        await self._upsert_slots.acquire()
+        self._pending.add(asyncio.create_task(self._write(collection, records, operation)))
+        # Surface failures early instead of after the whole file was encoded
+        for task in [task for task in self._pending if task.done()]:
+            self._pending.discard(task)
+            task.result()
+
+    async def _upsert(self, collection: str, records: List[Record], vectors: List[List[float]]):
+        for start in range(0, len(records), self.upsert_chunk):
+            chunk = records[start:start + self.upsert_chunk]
+            points = [
+                qdrant_models.PointStruct(id=record.point_id, vector=list(vector), payload=record.payload)
+                for record, vector in zip(chunk, vectors[start:start + self.upsert_chunk])
+            ]
+            await self._submit(collection, chunk, self.client.upsert(collection_name=collection, points=points, wait=True))
+
+    async def _overwrite_payloads(self, collection: str, records: List[Record]):
+        for start in range(0, len(records), self.upsert_chunk):
+            chunk = records[start:start + self.upsert_chunk]
+            operations = [
+                qdrant_models.OverwritePayloadOperation(
+                    overwrite_payload=qdrant_models.SetPayload(payload=record.payload, points=[record.point_id])
+                )
+                for record in chunk
+            ]
+            await self._submit(collection, chunk, self.client.batch_update_points(
+                collection_name=collection, update_operations=operations, wait=True
+            ))
+
+    async def migrate(self, collection: str, key_field: str, exported: Set[str], prune: bool) -> int:
+        """Delete points whose id is not the one derived from their record key.
+
+        Collections loaded before incremental ingest use other ids, so
+        re-ingesting them adds a second point per record that the state
+        file, and therefore --prune, knows nothing about. Such points are
+        deleted when their key is in this export (the derived-id point
+        replaces them), and with prune also when it is not.
+        """
+        if not await self.client.collection_exists(collection):
+            return 0
+        unmanaged = []
+        offset = None
+        while True:
+            points, offset = await self.client.scroll(
+                collection_name=collection,
+                limit=MIGRATE_SCROLL_LIMIT,
+                offset=offset,
+                with_payload=[key_field],
+                with_vectors=False
+            )
+            for point in points:
+                key = (point.payload or {}).get(key_field)
+                key = str(key) if key else None
+                if key is not None and str(point.id) == point_id(collection, key):
+                    continue
+                if prune or key in exported:
+                    unmanaged.append(point.id)
+            if offset is None:
+                break
+        for start in range(0, len(unmanaged), self.upsert_chunk):
+            await self.client.delete(
+                collection_name=collection,
+                points_selector=qdrant_models.PointIdsList(points=unmanaged[start:start + self.upsert_chunk]),
+                wait=True
+            )
+        if unmanaged:
+            logger.info(f"{collection}: deleted {len(unmanaged)} points with ids not derived from their {key_field}")
+        return len(unmanaged)
+
+    async def run(
+        self,
+        kind: str,
+        path: str,
+        prune: bool = False,
+        full: bool = False,
+        migrate: bool = False
+    ) -> IngestStats:
+        setting_name, key_field = COLLECTION_KEYS[kind]
+        collection = getattr(settings, setting_name)
+        stats = IngestStats()
+        known = self.state.load(collection)
+        seen: Set[str] = set()
+        to_embed: List[Record] = []
+        payload_only: List[Record] = []
+        collection_ready = False
+
+        async def flush_embeddings():
+            nonlocal collection_ready
+            batch = to_embed[:]
+            to_embed.clear()
+            # Encoding runs on a thread, so earlier chunks keep upserting meanwhile
+            vectors = await asyncio.to_thread(self.encode, [record.payload["text"] for record in batch])
+            if not collection_ready:
+                await self.ensure_collection(collection, len(vectors[0]))
+                collection_ready = True
+            await self._upsert(collection, batch, vectors)
+            stats.embedded += len(batch)
+            logger.info(f"{collection}: {stats.read} read, {stats.embedded} embedded, {stats.unchanged} unchanged")
+
+        for record in read_records(path, collection, key_field, stats):
+            if record.key in seen:
+                logger.warning(f"{collection}: duplicate {key_field} {record.key}; keeping the first line")
+                continue
+            seen.add(record.key)
+            previous = None if full else known.get(record.key)
+            if previous is not None and previous[3] == self.model_id:
+                content_hash, text_hash, updated_at, _ = previous
+                if content_hash == record.content_hash and updated_at == record.updated_at:
+                    stats.unchanged += 1
+                    continue
+                if text_hash == record.text_hash:
+                    payload_only.append(record)
+                    if len(payload_only) >= self.upsert_chunk:
+                        await self._overwrite_payloads(collection, payload_only[:])
+                        stats.payload_only += len(payload_only)
+                        payload_only.clear()
+                    continue
+            to_embed.append(record)
+            if len(to_embed) >= self.batch_size:
+                await flush_embeddings()
+
+        if to_embed:
+            await flush_embeddings()
+        if payload_only:
+            await self._overwrite_payloads(collection, payload_only)
+            stats.payload_only += len(payload_only)
+        pending, self._pending = self._pending, set()
+        await asyncio.gather(*pending)
+
+        if prune:
+            stale = [key for key in known if key not in seen]
+            if stale:
+                await self.client.delete(
+                    collection_name=collection,
+                    points_selector=qdrant_models.PointIdsList(points=[point_id(collection, key) for key in stale]),
+                    wait=True
+                )
+                self.state.delete(collection, stale)
+                stats.pruned = len(stale)
+        # Nothing recorded yet: the collection may predate incremental ingest
+        if migrate or not known:
+            stats.migrated = await self.migrate(collection, key_field, seen, prune)
+        return stats
+
+
+def _load_model():
+    from app.services import VectorService
+
+    # Straight to the model: documents would only evict query vectors from the embedding cache
+    return VectorService.get_model()
+
+
+async def _main(args) -> int:
+    from app.services import create_qdrant_client
+
+    model = _load_model()
+    state = IngestState(args.state)
+    client = create_qdrant_client()
+    try:
+        ingestor = Ingestor(
+            client,
+            state,
+            model.encode,
+            model.model_id,
+            batch_size=args.batch_size,
+            upsert_chunk=args.upsert_chunk,
+            parallel_upserts=args.parallel
+        )
+        for kind, path in args.inputs:
+            stats = await ingestor.run(kind, path, prune=args.prune, full=args.full, migrate=args.migrate)
+            print(json.dumps({"collection": kind, "input": path, **stats.summary()}, ensure_ascii=False))
+    finally:
+        await client.close()
+        state.close()
+    return 0
+
+
+def _input_spec(value: str) -> Tuple[str, str]:
+    kind, separator, path = value.partition("=")
+    if not separator or kind not in COLLECTION_KEYS:
+        raise argparse.ArgumentTypeError(f"expected KIND=PATH with KIND in {', '.join(COLLECTION_KEYS)}")
+    return kind, path
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Incrementally index JSONL exports into the Qdrant collections")
+    parser.add_argument("inputs", nargs="+", type=_input_spec, metavar="KIND=PATH", help="e.g. usm=usm_nodes.jsonl")
+    parser.add_argument("--state", default=settings.INGEST_STATE_PATH, help="SQLite file tracking indexed records")
+    parser.add_argument("--batch-size", type=int, default=settings.INGEST_BATCH_SIZE, help="Texts per encode call")
+    parser.add_argument("--upsert-chunk", type=int, default=settings.INGEST_UPSERT_CHUNK, help="Points per upsert request")
+    parser.add_argument("--parallel", type=int, default=settings.INGEST_PARALLEL_UPSERTS, help="Upsert requests in flight")
+    parser.add_argument("--prune", action="store_true", help="Delete indexed records missing from the export (complete exports only)")
+    parser.add_argument("--full", action="store_true", help="Re-embed everything, ignoring the state file")
+    parser.add_argument(
+        "--migrate",
+        action="store_true",
+        help="Delete points whose id is not derived from their record key (automatic while the state file is empty)"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    return asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    # Usage (from backend/): python -m app.ingest usm=usm_nodes.jsonl test=test_cases.jsonl --prune
+    sys.exit(main())
@@ -0,0 +1,341 @@
+import asyncio
+import logging
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+
+from app import metrics
+
+logger = logging.getLogger("uvicorn")
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 409, 500, 502, 503, 504}
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class SchedulerRejected(Exception):
+    """The call could not start before its deadline, or the wait queue was full."""
+
+
+def parse_duration(value) -> Optional[float]:
+    """Seconds from a rate-limit header value.
+
+    Accepts plain seconds ("12", "0.5"), Go-style durations ("6m0s", "20ms"),
+    epoch timestamps in seconds or milliseconds (OpenRouter's X-RateLimit-Reset)
+    and HTTP dates (Retry-After).
+    """
+    if value is None:
+        return None
+    text = str(value).strip()
+    if not text:
+        return None
+    try:
+        number = float(text)
+    except ValueError:
+        parts = DURATION_PART.findall(text)
+        if parts and "".join(amount + unit for amount, unit in parts) == text:
+            return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+        try:
+            return max(parsedate_to_datetime(text).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+    if number > 1e12:
+        return max(number / 1000 - time.time(), 0.0)
+    if number > 1e9:
+        return max(number - time.time(), 0.0)
+    return max(number, 0.0)
+
+
+def _header(headers, *names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+    return None
+
+
+class TokenBucket:
+    """Request-rate bucket whose level and refill rate follow the provider's headers.
+
+    Providers report the window limit, what is left of it and when it resets
+    (x-ratelimit-*-requests on OpenAI-compatible APIs, X-RateLimit-* on
+    OpenRouter). The bucket takes `remaining` as its level and refills at
+    (limit - remaining) / reset, so it is full again when the window resets.
+    Until a provider reports anything the bucket is unlimited unless a static
+    rate is configured. A 429 with Retry-After empties it until then.
+    """
+
+    def __init__(self, rate: float = 0.0, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else (max(rate, 1.0) if rate > 0 else None)
+        self.tokens = self.capacity or 0.0
+        self.paused_until = 0.0
+        self.updated = time.monotonic()
+
+    @property
+    def limited(self) -> bool:
+        return self.capacity is not None
+
+    def _refill(self, now: float):
+        if self.limited and self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available (0 if one can be taken now)."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if not self.limited:
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        if self.rate <= 0:
+            # Exhausted with no known refill: probe again shortly
+            return 1.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.limited:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        if self.limited:
+            self.tokens = min(self.tokens, 0.0)
+
+    def update_from_headers(self, headers):
+        limit = _header(headers, "x-ratelimit-limit-requests", "x-ratelimit-limit")
+        remaining = _header(headers, "x-ratelimit-remaining-requests", "x-ratelimit-remaining")
+        reset = parse_duration(_header(headers, "x-ratelimit-reset-requests", "x-ratelimit-reset"))
+        try:
+            limit = float(limit) if limit is not None else None
+            remaining = float(remaining) if remaining is not None else None
+        except ValueError:
+            return
+        if limit is None or remaining is None or limit <= 0:
+            return
+        now = time.monotonic()
+        self._refill(now)
+        self.capacity = limit
+        self.tokens = min(remaining, limit)
+        if reset:
+            self.rate = max(limit - remaining, 1.0) / reset
+        self.updated = now
+
+
+class Lease:
+    """A held concurrency slot; release exactly once."""
+
+    def __init__(self, scheduler: "LLMScheduler"):
+        self._scheduler = scheduler
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._scheduler._release()
+
+
+class LLMScheduler:
+    """Admission control for one LLM provider.
+
+    Calls wait in a bounded queue for a concurrency slot and a rate token,
+    giving up at their deadline. Rate-limit, timeout, connection and 5xx
+    errors are retried with jittered exponential backoff (never sooner than
+    Retry-After); the slot is released while backing off.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        max_concurrency: int = 8,
+        max_queue: int = 100,
+        queue_timeout: float = 30.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        rate: float = 0.0
+    ):
+        self.provider = provider
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate)
+        self.in_flight = 0
+        self.waiting = 0
+        self._waiters: List[asyncio.Future] = []
+
+    def _set_gauges(self):
+        metrics.LLM_QUEUE_DEPTH.set(self.waiting, provider=self.provider)
+        metrics.LLM_IN_FLIGHT.set(self.in_flight, provider=self.provider)
+
+    async def acquire(self, deadline: Optional[float] = None) -> Lease:
+        """Wait for a slot and a rate token; raises SchedulerRejected at the deadline."""
+        deadline = deadline if deadline is not None else time.monotonic() + self.queue_timeout
+        if self.waiting >= self.max_queue:
+            metrics.LLM_REJECTED.inc(provider=self.provider, reason="queue_full")
+            raise SchedulerRejected(f"{self.provider} queue is full ({self.waiting} waiting)")
+
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        acquired = False
+        self.waiting += 1
+        self._set_gauges()
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if self.in_flight < self.max_concurrency:
+                    delay = self.bucket.delay()
+                    if delay <= 0:
+                        break
+                else:
+                    delay = remaining
+                if remaining <= 0:
+                    metrics.LLM_REJECTED.inc(provider=self.provider, reason="deadline")
+                    raise SchedulerRejected(f"{self.provider} did not admit the call before its deadline")
+                # Woken early when a slot frees up; otherwise re-check the bucket after delay
+                waiter = loop.create_future()
+                self._waiters.append(waiter)
+                try:
+                    await asyncio.wait_for(waiter, timeout=min(delay, remaining))
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+            self.bucket.take()
+            self.in_flight += 1
+            acquired = True
+        finally:
+            self.waiting -= 1
+            self._set_gauges()
+            if not acquired:
+                # Cancelled or rejected, possibly after _release woke us: pass the wakeup on
+                self._wake_next()
+            metrics.LLM_QUEUE_WAIT_SECONDS.observe(time.monotonic() - started, provider=self.provider)
+        return Lease(self)
+
+    def _release(self):
+        self.in_flight -= 1
+        self._set_gauges()
+        self._wake_next()
+
+    def _wake_next(self):
+        if self.in_flight >= self.max_concurrency:
+            return
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    def observe_headers(self, headers):
+        if headers is not None:
+            self.bucket.update_from_headers(headers)
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        backoff = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = random.uniform(0, backoff)
+        response = getattr(error, "response", None)
+        if response is not None:
+            self.observe_headers(response.headers)
+            retry_after_ms = response.headers.get("retry-after-ms")
+            try:
+                retry_after = float(retry_after_ms) / 1000 if retry_after_ms else None
+            except ValueError:
+                retry_after = None
+            if retry_after is None:
+                retry_after = parse_duration(response.headers.get("retry-after"))
+            if retry_after is not None:
+                self.bucket.pause(retry_after)
+                delay = max(delay, retry_after)
+        return delay
+
+    @staticmethod
+    def _retry_reason(error: Exception) -> Optional[str]:
+        if isinstance(error, RateLimitError):
+            return "rate_limit"
+        if isinstance(error, APITimeoutError):
+            return "timeout"
+        if isinstance(error, APIConnectionError):
+            return "connection"
+        if isinstance(error, APIStatusError) and error.status_code in RETRYABLE_STATUS:
+            return "server_error"
+        return None
+
+    async def run(self, call: Callable[[], Awaitable[T]], hold: bool = False):
+        """Run call under the scheduler with retries.
+
+        With hold=False the slot is released when call returns and the result
+        is returned. With hold=True (streams) returns (result, lease) and the
+        caller releases the lease once it has consumed the response.
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        attempt = 0
+        while True:
+            lease = await self.acquire(deadline)
+            try:
+                result = await call()
+            except Exception as e:
+                lease.release()
+                reason = self._retry_reason(e)
+                if reason is None or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt, e)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                attempt += 1
+                metrics.LLM_RETRIES.inc(provider=self.provider, reason=reason)
+                logger.warning(f"{self.provider} call failed ({reason}); retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                lease.release()
+                raise
+            self.observe_headers(getattr(result, "headers", None))
+            if hold:
+                return result, lease
+            lease.release()
+            return result
+
+    def stats(self) -> dict:
+        return {
+            "provider": self.provider,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "rate_limited": self.bucket.limited,
+            "tokens": round(self.bucket.tokens, 2) if self.bucket.limited else None,
+        }
+
+
+_schedulers: Dict[str, LLMScheduler] = {}
+
+
+def get_scheduler(provider: str, settings) -> LLMScheduler:
+    """One scheduler per provider, shared by every LLMService in the process."""
+    scheduler = _schedulers.get(provider)
+    if scheduler is None:
+        scheduler = LLMScheduler(
+            provider,
+            max_concurrency=settings.LLM_PROVIDER_CONCURRENCY.get(provider, settings.LLM_MAX_CONCURRENCY),
+            max_queue=settings.LLM_MAX_QUEUE,
+            queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+            max_retries=settings.LLM_MAX_RETRIES,
+            backoff_base=settings.LLM_BACKOFF_BASE,
+            backoff_max=settings.LLM_BACKOFF_MAX,
+            rate=settings.LLM_RATE_LIMIT_RPS
+        )
+        _schedulers[provider] = scheduler
+    return scheduler
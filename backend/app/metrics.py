@@ -0,0 +1,302 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from cache hits up to slow LLM generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [bucket counts..., sum, count]
+                series = [0] * len(self.buckets) + [0.0, 0]
+                self._series[key] = series
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for index, bound in enumerate(self.buckets):
+                cumulative += series[index]
+                labels = _format_labels(self.label_names, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "ra_request_seconds", "End-to-end handler latency.", labels=("endpoint",)
+)
+EMBED_SECONDS = REGISTRY.histogram(
+    "ra_embed_seconds", "Query embedding latency by source (cache or model).", labels=("source",)
+)
+SEARCH_SECONDS = REGISTRY.histogram(
+    "ra_qdrant_search_seconds", "Qdrant search latency per collection.", labels=("collection",)
+)
+SEARCH_HITS = REGISTRY.histogram(
+    "ra_qdrant_search_hits", "Hits returned per collection search.", labels=("collection",),
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+)
+SNAPSHOT_SEARCH_SECONDS = REGISTRY.histogram(
+    "ra_snapshot_search_seconds", "In-process search latency on a memory-mapped collection snapshot.", labels=("collection",)
+)
+SNAPSHOT_SEARCHES = REGISTRY.counter(
+    "ra_snapshot_searches_total", "Searches served from a local snapshot (primary or fallback).", labels=("collection", "reason")
+)
+LLM_TTFT_SECONDS = REGISTRY.histogram(
+    "ra_llm_time_to_first_token_seconds", "Time until the first streamed LLM token.", labels=("model",)
+)
+LLM_SECONDS = REGISTRY.histogram(
+    "ra_llm_seconds", "Total LLM call latency.", labels=("model", "mode")
+)
+LLM_TOKENS = REGISTRY.counter(
+    "ra_llm_tokens_total", "Tokens reported by the provider.", labels=("model", "kind")
+)
+LLM_QUEUE_DEPTH = REGISTRY.gauge(
+    "ra_llm_queue_depth", "Calls waiting for an LLM provider slot or rate token.", labels=("provider",)
+)
+LLM_IN_FLIGHT = REGISTRY.gauge(
+    "ra_llm_in_flight", "LLM calls currently holding a provider slot.", labels=("provider",)
+)
+LLM_QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "ra_llm_queue_wait_seconds", "Time spent waiting for admission to an LLM provider.", labels=("provider",)
+)
+LLM_RETRIES = REGISTRY.counter(
+    "ra_llm_retries_total", "LLM calls retried after a transient failure.", labels=("provider", "reason")
+)
+LLM_REJECTED = REGISTRY.counter(
+    "ra_llm_rejected_total", "LLM calls refused by the scheduler.", labels=("provider", "reason")
+)
+LLM_HEDGES = REGISTRY.counter(
+    "ra_llm_hedges_total", "LLM calls that also started a hedge request.", labels=("mode",)
+)
+LLM_HEDGE_WINS = REGISTRY.counter(
+    "ra_llm_hedge_wins_total", "Which side won a hedged LLM call.", labels=("mode", "winner")
+)
+LLM_HEDGE_DELAY_SECONDS = REGISTRY.gauge(
+    "ra_llm_hedge_delay_seconds", "Current adaptive delay before a hedge request is sent.", labels=("mode",)
+)
+CONTEXT_TOKENS = REGISTRY.histogram(
+    "ra_context_tokens", "Estimated reference-context tokens per prompt, before and after packing.", labels=("stage",),
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 12000, 16000)
+)
+CONTEXT_TOKENS_SAVED = REGISTRY.counter(
+    "ra_context_tokens_saved_total", "Estimated prompt tokens removed by context packing."
+)
+CONTEXT_REFERENCES_DROPPED = REGISTRY.counter(
+    "ra_context_references_dropped_total", "References left out of the prompt.", labels=("reason",)
+)
+COALESCED_CALLS = REGISTRY.counter(
+    "ra_coalesced_calls_total", "Duplicate concurrent calls served by an in-flight computation.", labels=("operation",)
+)
+PROMPT_RELOADS = REGISTRY.counter(
+    "ra_prompt_reloads_total", "prompts.yaml (re)compilations by result (ok or error).", labels=("result",)
+)
+SEMANTIC_CACHE_LOOKUPS = REGISTRY.counter(
+    "ra_semantic_cache_lookups_total", "Semantic cache lookups by cache (search or draft) and result.", labels=("cache", "result")
+)
+SEMANTIC_CACHE_SIMILARITY = REGISTRY.histogram(
+    "ra_semantic_cache_hit_similarity", "Cosine similarity of semantic cache hits to the cached query.", labels=("cache",),
+    buckets=(0.9, 0.92, 0.94, 0.95, 0.96, 0.97, 0.98, 0.99, 0.995, 1.0)
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "ra_cache_lookups_total", "Embedding and response cache lookups by cache and result.", labels=("cache", "result")
+)
+
+
+class RequestTimings:
+    """Per-request stage durations, summarized into a Server-Timing header."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+
+    def add(self, stage: str, seconds: float):
+        self.stages.append((stage, seconds))
+
+    def header_value(self) -> str:
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def record_stage(stage: str, seconds: float):
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+def bind_timings(timings: RequestTimings):
+    """Collect the current context's stages into timings, e.g. inside a shared task."""
+    _current_timings.set(timings)
+
+
+@contextmanager
+def timed(histogram: Histogram, stage: Optional[str] = None, **labels):
+    """Observe the block's duration in histogram and, if given, as a Server-Timing stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, **labels)
+        if stage:
+            record_stage(stage, elapsed)
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware that collects stage timings and adds a Server-Timing header.
+
+    Streaming responses send their headers before the body is produced, so
+    they only carry the stages finished by then.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.header_value().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timings.reset(token)
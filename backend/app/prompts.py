@@ -0,0 +1,176 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from string import Formatter
+from typing import Dict, Mapping, Optional, Tuple
+
+from app import metrics
+from app.config import PromptConfig
+
+logger = logging.getLogger("uvicorn")
+
+# Per-request placeholders of user_prompt_template; everything else is
+# resolved once per (mode, language) at compile time.
+DYNAMIC_FIELDS = ("issue_type", "summary", "context", "draft")
+MODES = ("pm", "qa")
+DEFAULT_MODE = "pm"
+
+
+def prompt_mode(issue_type: Optional[str]) -> str:
+    return "qa" if "bug" in (issue_type or "").lower() else "pm"
+
+
+def _format_spec(conversion: Optional[str], spec: str) -> Optional[str]:
+    if not conversion and not spec:
+        return None
+    return "{0" + (f"!{conversion}" if conversion else "") + (f":{spec}" if spec else "") + "}"
+
+
+@dataclass(frozen=True)
+class CompiledTemplate:
+    """A str.format template split into literal runs around its per-request fields.
+
+    literals has one more entry than fields; rendering interleaves them.
+    """
+
+    literals: Tuple[str, ...]
+    fields: Tuple[Tuple[str, Optional[str]], ...]
+
+    @classmethod
+    def compile(cls, template: str, static: Mapping[str, str], dynamic: Tuple[str, ...] = ()) -> "CompiledTemplate":
+        literals, fields, current = [], [], []
+        for literal, field_name, spec, conversion in Formatter().parse(template):
+            current.append(literal)
+            if field_name is None:
+                continue
+            formatter = _format_spec(conversion, spec or "")
+            if field_name in static:
+                value = static[field_name]
+                current.append(formatter.format(value) if formatter else str(value))
+            elif field_name in dynamic:
+                literals.append("".join(current))
+                current = []
+                fields.append((field_name, formatter))
+            else:
+                raise KeyError(f"unknown placeholder {{{field_name}}}")
+        literals.append("".join(current))
+        return cls(tuple(literals), tuple(fields))
+
+    def render(self, values: Mapping[str, object]) -> str:
+        parts = [self.literals[0]]
+        for (name, formatter), literal in zip(self.fields, self.literals[1:]):
+            value = values[name]
+            parts.append(formatter.format(value) if formatter else str(value))
+            parts.append(literal)
+        return "".join(parts)
+
+    @property
+    def static_prefix(self) -> str:
+        """Leading text identical for every request, i.e. what a prefix cache can reuse."""
+        return self.literals[0]
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    system: str
+    user: CompiledTemplate
+
+    def messages(self, **values) -> list:
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user.render(values)}
+        ]
+
+
+class PromptTemplates:
+    """prompts.yaml compiled for every (mode, language), reloaded when the file changes.
+
+    The system prompt is fully rendered at compile time, so each pair sends
+    a byte-identical prefix that provider and LM Studio prompt caches can
+    reuse. A file that fails to parse or compile is logged and the previous
+    templates stay in service.
+    """
+
+    def __init__(self, languages: Dict[str, Dict[str, str]], default_language: str, reload_interval: float = 2.0):
+        self.languages = languages
+        self.default_language = default_language
+        self.reload_interval = reload_interval
+        self.version = ""
+        self.loaded_at: Optional[float] = None
+        self._compiled: Dict[Tuple[str, str], CompiledPrompt] = {}
+        self._mtime_ns: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reload(force=True)
+
+    def _compile(self, prompts: dict) -> Dict[Tuple[str, str], CompiledPrompt]:
+        compiled = {}
+        for mode in MODES:
+            config = prompts.get(mode) or prompts.get(DEFAULT_MODE)
+            if not config:
+                raise KeyError(f"prompts.yaml has neither '{mode}' nor '{DEFAULT_MODE}'")
+            for language, lang_config in self.languages.items():
+                static = {**lang_config, "output_language": lang_config["language_instruction"]}
+                system = CompiledTemplate.compile(config.get("system_prompt", ""), lang_config)
+                user = CompiledTemplate.compile(config.get("user_prompt_template", ""), static, DYNAMIC_FIELDS)
+                compiled[(mode, language)] = CompiledPrompt(system.render({}), user)
+        return compiled
+
+    def reload(self, force: bool = False) -> bool:
+        """Recompile if prompts.yaml changed; returns whether new templates were installed."""
+        with self._lock:
+            path = PromptConfig.resolve_path()
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError as e:
+                if force:
+                    logger.error(f"Cannot read prompts file {path}: {e}")
+                return False
+            if not force and mtime_ns == self._mtime_ns:
+                return False
+            # Recorded even on failure so a broken file is not re-parsed on every request
+            self._mtime_ns = mtime_ns
+            try:
+                prompts, version = PromptConfig.read(path)
+                compiled = self._compile(prompts)
+            except Exception as e:
+                metrics.PROMPT_RELOADS.inc(result="error")
+                logger.error(f"Failed to load {path}, keeping prompt version {self.version or 'none'}: {e}")
+                return False
+            self._compiled = compiled
+            self.version = version
+            self.loaded_at = time.time()
+            PromptConfig.install(prompts, version)
+            metrics.PROMPT_RELOADS.inc(result="ok")
+            logger.info(f"Compiled prompts {version} for {len(compiled)} (mode, language) pairs from {path}")
+            return True
+
+    def _maybe_reload(self):
+        if self.reload_interval <= 0:
+            return
+        now = time.monotonic()
+        if now - self._checked_at >= self.reload_interval:
+            self._checked_at = now
+            self.reload()
+
+    def get(self, issue_type: Optional[str], language: str) -> CompiledPrompt:
+        self._maybe_reload()
+        mode = prompt_mode(issue_type)
+        compiled = self._compiled.get((mode, language)) or self._compiled.get((mode, self.default_language))
+        if compiled is None:
+            raise LookupError("No prompt templates are loaded")
+        return compiled
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "path": PromptConfig.resolve_path(),
+            "loaded_at": self.loaded_at,
+            "reload_interval": self.reload_interval,
+            "static_prefix_chars": {
+                f"{mode}/{language}": len(prompt.system) + len(prompt.user.static_prefix)
+                for (mode, language), prompt in sorted(self._compiled.items())
+            },
+        }
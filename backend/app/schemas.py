@@ -1,11 +1,23 @@
-from pydantic import BaseModel
-from typing import List, Optional, Literal
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Annotated, Dict, List, Optional, Literal
+
+SourceType = Literal["usm_node", "test_case", "jira_reference"]
+
+# Qdrant scores offset + limit hits per source, so paging depth is capped
+MAX_REFERENCES_PAGE = 20
+SourceLimit = Annotated[int, Field(ge=0, le=100)]
 
 class RetrievedReference(BaseModel):
-    source_type: Literal["usm_node", "test_case", "jira_reference"]
+    source_type: SourceType
     title: str
     content_excerpt: str
     relevance_score: float
+    # Retrieval vector, when fetched; used for near-duplicate pruning, never serialized
+    _vector: Optional[List[float]] = PrivateAttr(default=None)
+
+    @property
+    def vector(self) -> Optional[List[float]]:
+        return self._vector
 
 class RefineRequest(BaseModel):
     current_description: str
@@ -18,6 +30,22 @@ class RefineRequest(BaseModel):
     restrict_to_team: bool = True
     output_language: Literal["zh-TW", "zh-CN", "en"] = "zh-TW"
     selected_references: Optional[List[RetrievedReference]] = None
+    bypass_cache: bool = False
+
+class BatchRefineRequest(BaseModel):
+    items: List[RefineRequest] = Field(min_length=1, max_length=100)
+
+class ReferencesRequest(RefineRequest):
+    page: int = Field(default=0, ge=0, le=MAX_REFERENCES_PAGE)
+    page_size: int = Field(default=15, ge=1, le=100)
+    # Per-source page size, replacing that source's share of the 2:2:1 split
+    source_limits: Optional[Dict[SourceType, SourceLimit]] = None
+
+class ReferencesResponse(BaseModel):
+    references: List[RetrievedReference]
+    page: int
+    limits: Dict[str, int]
+    has_more: bool
 
 class RefineResponse(BaseModel):
     original_text: str
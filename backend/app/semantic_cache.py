@@ -0,0 +1,118 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app import metrics
+
+
+class SemanticCache:
+    """Bounded nearest-neighbour cache keyed by query vector.
+
+    Entries live in a preallocated (max_entries, dim) matrix and only match
+    lookups from the same partition (team, language and whatever else
+    shapes the value). A lookup hits when the best cosine similarity reaches
+    the threshold. When full, expired rows are reused first, then the least
+    recently used one.
+    """
+
+    def __init__(self, name: str, max_entries: int = 512, threshold: float = 0.95, ttl_seconds: Optional[float] = None):
+        self.name = name
+        self.max_entries = max(1, max_entries)
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds if ttl_seconds and ttl_seconds > 0 else None
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._partitions = np.full(self.max_entries, -1, dtype=np.int64)
+        self._expires_at = np.full(self.max_entries, np.inf)
+        self._last_used = np.zeros(self.max_entries)
+        self._values: List[Any] = [None] * self.max_entries
+        self._partition_ids: Dict[str, int] = {}
+        self._next_partition_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        return query / norm if norm else query
+
+    def lookup(self, partition: str, vector: Sequence[float]) -> Optional[Tuple[Any, float]]:
+        """(value, similarity) of the closest live entry in partition, if close enough."""
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            partition_id = self._partition_ids.get(partition)
+            rows = None
+            if partition_id is not None and self._vectors is not None and self._vectors.shape[1] == query.shape[0]:
+                rows = np.flatnonzero((self._partitions == partition_id) & (self._expires_at > now))
+            if rows is None or rows.size == 0:
+                return self._miss()
+            similarities = self._vectors[rows] @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                return self._miss()
+            row = rows[best]
+            self._last_used[row] = now
+            self.hits += 1
+            value = self._values[row]
+        metrics.SEMANTIC_CACHE_LOOKUPS.inc(cache=self.name, result="hit")
+        metrics.SEMANTIC_CACHE_SIMILARITY.observe(similarity, cache=self.name)
+        return value, similarity
+
+    def _miss(self):
+        self.misses += 1
+        metrics.SEMANTIC_CACHE_LOOKUPS.inc(cache=self.name, result="miss")
+        return None
+
+    def store(self, partition: str, vector: Sequence[float], value: Any):
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                # First entry, or the embedding model changed: start over at the new width
+                self._vectors = np.zeros((self.max_entries, query.shape[0]), dtype=np.float32)
+                self._partitions[:] = -1
+                self._values = [None] * self.max_entries
+                self._partition_ids.clear()
+            partition_id = self._partition_ids.get(partition)
+            if partition_id is None:
+                partition_id = self._partition_ids[partition] = self._next_partition_id
+                self._next_partition_id += 1
+            free = np.flatnonzero((self._partitions < 0) | (self._expires_at <= now))
+            if free.size:
+                row = int(free[0])
+            else:
+                row = int(np.argmin(self._last_used))
+                self.evictions += 1
+            self._vectors[row] = query
+            self._partitions[row] = partition_id
+            self._expires_at[row] = now + self.ttl_seconds if self.ttl_seconds else np.inf
+            self._last_used[row] = now
+            self._values[row] = value
+            if len(self._partition_ids) > 4 * self.max_entries:
+                self._compact_partitions()
+
+    def _compact_partitions(self):
+        # Partitions whose rows were all replaced would otherwise accumulate ids
+        live = {int(partition_id) for partition_id in self._partitions if partition_id >= 0}
+        self._partition_ids = {key: value for key, value in self._partition_ids.items() if value in live}
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = int(np.count_nonzero((self._partitions >= 0) & (self._expires_at > time.time())))
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -1,11 +1,24 @@
+import asyncio
 import logging
 import re
-from typing import Dict, List, Optional, get_args
-from openai import AsyncOpenAI, APIConnectionError, RateLimitError, APIStatusError
-from FlagEmbedding import FlagModel
-from qdrant_client import QdrantClient
+import threading
+import time
+import httpx
+from typing import AsyncIterator, Dict, List, Optional, get_args
+from openai import NOT_GIVEN, AsyncOpenAI, APIConnectionError, RateLimitError, APIStatusError
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.http import models as qdrant_models
-from app.config import get_settings, PromptConfig
+from app.cache import EmbeddingCache, ResponseCache
+from app import metrics
+from app.config import get_settings
+from app.context import ContextPacker, PackedContext
+from app.hedging import HEDGE, PRIMARY, LatencyTracker, hedged
+from app.llm_scheduler import SchedulerRejected, get_scheduler
+from app.prompts import PromptTemplates
+from app.singleflight import SingleFlight, request_key
+from app.semantic_cache import SemanticCache
+from app.snapshot import load_snapshots
+from app.embedding import EmbeddingBackend, EmbeddingBatcher, create_embedding_backend, embedding_model_id
 from app.schemas import RefineRequest, RetrievedReference
 
 logger = logging.getLogger("uvicorn")
@@ -59,29 +72,229 @@ LANGUAGE_CONFIG = {
     }
 }
 
-def resolve_language_config(output_language: str) -> Dict[str, str]:
-    return LANGUAGE_CONFIG.get(output_language, LANGUAGE_CONFIG["zh-TW"])
+WARMUP_TEXT = "預熱 warm-up"
+
+
+class EmbeddingNotReady(Exception):
+    """The embedding model is still loading (or failed to load)."""
+
 
 class VectorService:
     _model = None
+    _cache = None
+    _batcher = None
+    _load_lock = threading.Lock()
+    _load_error: Optional[str] = None
 
     @classmethod
-    def get_model(cls):
+    def get_model(cls) -> EmbeddingBackend:
         if cls._model is None:
-            logger.info("Loading Embedding Model: BAAI/bge-m3...")
-            cls._model = FlagModel('BAAI/bge-m3', use_fp16=True) 
-            logger.info("Embedding Model loaded.")
+            with cls._load_lock:
+                if cls._model is None:
+                    cls._model = cls._load_model()
         return cls._model
 
     @classmethod
-    def embed_query(cls, text: str) -> List[float]:
-        model = cls.get_model()
-        return model.encode(text).tolist()
+    def _load_model(cls) -> EmbeddingBackend:
+        logger.info(f"Loading Embedding Model: {settings.EMBEDDING_MODEL} ({settings.EMBEDDING_BACKEND} backend)...")
+        started = time.perf_counter()
+        model = create_embedding_backend(settings).load()
+        # First encode pays for lazy kernel/graph initialization; keep it off user requests
+        model.encode([WARMUP_TEXT])
+        if cls._cache is not None:
+            # A sidecar only reports which model it serves at handshake
+            cls._cache.model_id = model.model_id
+        logger.info(f"Embedding Model loaded and warmed up in {time.perf_counter() - started:.1f}s.")
+        return model
+
+    @classmethod
+    def is_ready(cls) -> bool:
+        # _model is only assigned once loading and warm-up have finished
+        return cls._model is not None
+
+    @classmethod
+    def load_error(cls) -> Optional[str]:
+        return cls._load_error
+
+    @classmethod
+    async def warm_up(cls):
+        """Load the model on a worker thread so the server can start accepting connections.
+
+        A failed load (download hiccup, transient OOM) is retried with
+        exponential backoff up to EMBEDDING_LOAD_RETRY_MAX_SECONDS apart;
+        /readyz reports the last error meanwhile.
+        """
+        delay = 1.0
+        while True:
+            try:
+                await asyncio.to_thread(cls.get_model)
+                cls._load_error = None
+                return
+            except Exception as e:
+                cls._load_error = str(e)
+                logger.error(f"Embedding model failed to load, retrying in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, settings.EMBEDDING_LOAD_RETRY_MAX_SECONDS)
+
+    @classmethod
+    def get_cache(cls) -> EmbeddingCache:
+        if cls._cache is None:
+            cls._cache = EmbeddingCache(
+                model_id=cls._model.model_id if cls._model is not None else embedding_model_id(settings),
+                max_entries=settings.EMBEDDING_CACHE_SIZE,
+                path=settings.EMBEDDING_CACHE_PATH,
+                disk_max_entries=settings.EMBEDDING_CACHE_DISK_MAX_ENTRIES
+            )
+        return cls._cache
+
+    @classmethod
+    def get_batcher(cls) -> EmbeddingBatcher:
+        if cls._batcher is None:
+            cls._batcher = EmbeddingBatcher(
+                cls.encode,
+                max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+                max_wait_ms=settings.EMBEDDING_BATCH_WAIT_MS
+            )
+        return cls._batcher
+
+    @classmethod
+    def encode(cls, texts: List[str]) -> List[List[float]]:
+        return cls.get_model().encode(texts)
+
+    @classmethod
+    async def embed_query(cls, text: str) -> List[float]:
+        started = time.perf_counter()
+        cache = cls.get_cache()
+        vector = await cache.get(text)
+        source = "cache"
+        if vector is None:
+            if not cls.is_ready():
+                raise EmbeddingNotReady(cls._load_error or "Embedding model is still loading")
+            source = "model"
+            vector = await cls.get_batcher().embed(text)
+            cache.set(text, vector)
+        elapsed = time.perf_counter() - started
+        metrics.EMBED_SECONDS.observe(elapsed, source=source)
+        metrics.record_stage("embed", elapsed)
+        return vector
+
+    @classmethod
+    async def embed_queries(cls, texts: List[str]) -> List[List[float]]:
+        """Embed many queries at once: cache hits first, all misses in one encode."""
+        started = time.perf_counter()
+        cache = cls.get_cache()
+        vectors = await cache.get_many(texts)
+        misses = [text for text, vector in zip(texts, vectors) if vector is None]
+        if misses:
+            if not cls.is_ready():
+                raise EmbeddingNotReady(cls._load_error or "Embedding model is still loading")
+            encoded = dict(zip(misses, await cls.get_batcher().embed_many(misses)))
+            for text, vector in encoded.items():
+                cache.set(text, vector)
+            vectors = [vector if vector is not None else encoded[text] for text, vector in zip(texts, vectors)]
+        elapsed = time.perf_counter() - started
+        metrics.EMBED_SECONDS.observe(elapsed, source="model" if misses else "cache")
+        metrics.record_stage("embed", elapsed)
+        return vectors
+
+    @classmethod
+    def shutdown(cls):
+        if cls._batcher is not None:
+            cls._batcher.close()
+            cls._batcher = None
+        if cls._cache is not None:
+            cls._cache.close()
+            cls._cache = None
+
+# Payload fields each formatter reads; everything else (notably the long
+# `text` used for embedding) stays in Qdrant. JIRA keeps `text` because
+# _build_jira_content falls back to parsing it.
+PAYLOAD_FIELDS = {
+    "usm": ["title", "description", "i_want"],
+    "test": ["title", "precondition", "steps"],
+    "jira": [
+        "jira_ticket", "issue_key", "jira_key", "summary", "title", "component", "component_name",
+        "description", "desc", "acceptance_criteria", "ac", "text",
+    ],
+}
+
+JIRA_DESCRIPTION_PATTERNS = [
+    re.compile(r"(?:描述|Description|Desc)\s*[:：]\s*(.*)", re.IGNORECASE | re.DOTALL),
+]
+JIRA_AC_PATTERNS = [
+    re.compile(r"(?:AC|Acceptance\s*Criteria)\s*[:：]\s*(.*)", re.IGNORECASE | re.DOTALL),
+]
+NON_LETTERS = re.compile(r"[^A-Za-z]")
+
+# RetrievedReference.source_type -> key used by _compute_limits
+SOURCE_LIMIT_KEYS = {
+    "usm_node": "usm",
+    "test_case": "test",
+    "jira_reference": "jira",
+}
+
+def create_qdrant_client() -> AsyncQdrantClient:
+    return AsyncQdrantClient(
+        url=settings.QDRANT_URL,
+        prefer_grpc=settings.QDRANT_PREFER_GRPC,
+        grpc_port=settings.QDRANT_GRPC_PORT,
+        timeout=settings.QDRANT_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=settings.QDRANT_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.QDRANT_MAX_CONNECTIONS
+        )
+    )
+
+def build_query_text(request: RefineRequest) -> str:
+    return f"{request.summary} {request.current_description}"
+
+def derive_component_team(component_name: Optional[str]) -> str:
+    if not component_name:
+        return ""
+    primary = component_name.split(",")[0].strip()
+    if not primary:
+        return ""
+    letters_only = NON_LETTERS.sub("", primary)
+    if len(letters_only) >= 3:
+        return letters_only[:3].upper()
+    return primary[:3].upper()
+
+def resolve_team_hint(component_team: Optional[str], component_name: Optional[str]) -> str:
+    return (component_team or "").strip().upper() or derive_component_team(component_name)
 
 class RAGService:
-    def __init__(self):
-        self.client = QdrantClient(url=settings.QDRANT_URL)
+    _team_filters: Dict[str, Optional[qdrant_models.Filter]] = {}
+    _team_filter_cache_size = 256
+    _semantic_cache = None
+
+    @classmethod
+    def get_semantic_cache(cls) -> Optional[SemanticCache]:
+        """Search results reused for near-identical queries; None unless SEMANTIC_CACHE_ENABLED."""
+        if cls._semantic_cache is None and settings.SEMANTIC_CACHE_ENABLED:
+            cls._semantic_cache = SemanticCache(
+                "search",
+                max_entries=settings.SEMANTIC_CACHE_SIZE,
+                threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+                ttl_seconds=settings.SEMANTIC_CACHE_TTL_SECONDS
+            )
+        return cls._semantic_cache
+
+    def __init__(self, client: Optional[AsyncQdrantClient] = None):
+        self.client = client or create_qdrant_client()
         self.vector_service = VectorService()
+        self.snapshots = load_snapshots(
+            settings.SNAPSHOT_DIR,
+            (settings.QDRANT_COLLECTION_USM, settings.QDRANT_COLLECTION_TEST, settings.QDRANT_COLLECTION_JIRA),
+            resident_max_bytes=settings.SNAPSHOT_RESIDENT_MAX_MB * 1024 * 1024
+        )
+        self._search_flights = SingleFlight("search_context")
+
+    async def close(self):
+        await self.client.close()
+
+    async def ping(self):
+        """Cheap connectivity check on the shared client, for readiness probes."""
+        await self.client.get_collections()
 
     def _build_min_should_value(self, count: int, field_info, conditions):
         field_type = getattr(field_info, "annotation", None) or getattr(field_info, "type_", None)
@@ -131,20 +344,19 @@ class RAGService:
 
         return ({candidate_fields[0]: count} if candidate_fields else {"min_count": count}), False
 
-    def _derive_component_team(self, component_name: Optional[str]) -> str:
-        if not component_name:
-            return ""
-        primary = component_name.split(",")[0].strip()
-        if not primary:
-            return ""
-        letters_only = re.sub(r"[^A-Za-z]", "", primary)
-        if len(letters_only) >= 3:
-            return letters_only[:3].upper()
-        return primary[:3].upper()
-
     def _build_team_filter(self, team: str) -> Optional[qdrant_models.Filter]:
         if not team:
             return None
+        cached = self._team_filters.get(team)
+        if cached is not None:
+            return cached
+        if len(self._team_filters) >= self._team_filter_cache_size:
+            self._team_filters.clear()
+        team_filter = self._create_team_filter(team)
+        self._team_filters[team] = team_filter
+        return team_filter
+
+    def _create_team_filter(self, team: str) -> qdrant_models.Filter:
         should_conditions = [
             qdrant_models.FieldCondition(
                 key="team_name",
@@ -185,11 +397,20 @@ class RAGService:
             remainder -= 1
         return limits
 
-    def _extract_text_section(self, text: str, patterns: List[str]) -> str:
+    def resolve_limits(self, total_limit: int, source_limits: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """2:2:1 split of total_limit, with per-source overrides keyed by source_type."""
+        limits = self._compute_limits(total_limit)
+        for source_type, limit in (source_limits or {}).items():
+            key = SOURCE_LIMIT_KEYS.get(source_type)
+            if key:
+                limits[key] = max(int(limit), 0)
+        return limits
+
+    def _extract_text_section(self, text: str, patterns: List[re.Pattern]) -> str:
         if not text:
             return ""
         for pattern in patterns:
-            match = re.search(pattern, text, flags=re.IGNORECASE | re.DOTALL)
+            match = pattern.search(text)
             if match:
                 return match.group(1).strip()
         return ""
@@ -201,22 +422,12 @@ class RAGService:
         description = (
             payload.get("description")
             or payload.get("desc")
-            or self._extract_text_section(
-                payload.get("text", ""),
-                [
-                    r"(?:描述|Description|Desc)\s*[:：]\s*(.*)",
-                ]
-            )
+            or self._extract_text_section(payload.get("text", ""), JIRA_DESCRIPTION_PATTERNS)
         )
         acceptance_criteria = (
             payload.get("acceptance_criteria")
             or payload.get("ac")
-            or self._extract_text_section(
-                payload.get("text", ""),
-                [
-                    r"(?:AC|Acceptance\s*Criteria)\s*[:：]\s*(.*)",
-                ]
-            )
+            or self._extract_text_section(payload.get("text", ""), JIRA_AC_PATTERNS)
         )
         text_fallback = payload.get("text", "")
         if not description and text_fallback:
@@ -234,152 +445,361 @@ class RAGService:
             content_parts.append(f"AC: {acceptance_criteria}")
         return "\n".join(content_parts)
 
-    def _search_collection(
+    def _plan_collection_search(
+        self,
+        vector: List[float],
+        limit: int,
+        team_filter: Optional[qdrant_models.Filter],
+        restrict_to_team: bool,
+        with_vectors: bool = False,
+        payload_fields: Optional[List[str]] = None
+    ) -> List[qdrant_models.SearchRequest]:
+        # Requests are ordered by merge priority: team hits first, then the
+        # unfiltered fallback used to fill up to the limit.
+        with_payload = payload_fields if payload_fields else True
+        plan = []
+        if team_filter:
+            plan.append(qdrant_models.SearchRequest(
+                vector=vector,
+                filter=team_filter,
+                limit=limit,
+                with_payload=with_payload,
+                with_vector=with_vectors
+            ))
+        if not team_filter or not restrict_to_team:
+            plan.append(qdrant_models.SearchRequest(
+                vector=vector,
+                limit=limit,
+                with_payload=with_payload,
+                with_vector=with_vectors
+            ))
+        return plan
+
+    def _make_reference(self, source_type: str, title, content: str, hit) -> RetrievedReference:
+        # Fields are built here from known types, so skip pydantic validation per hit
+        reference = RetrievedReference.model_construct(
+            source_type=source_type,
+            title=str(title),
+            content_excerpt=content,
+            relevance_score=float(hit.score)
+        )
+        reference._vector = self._hit_vector(hit)
+        return reference
+
+    @staticmethod
+    def _hit_vector(hit) -> Optional[List[float]]:
+        vector = hit.vector
+        if isinstance(vector, dict):
+            # Named vectors: collections here hold a single dense vector
+            vector = next(iter(vector.values()), None)
+        return vector or None
+
+    def _merge_planned_hits(self, batches, limit: int):
+        hits = []
+        seen_ids = set()
+        for batch in batches:
+            for hit in batch:
+                if len(hits) >= limit:
+                    return hits
+                if hit.id not in seen_ids:
+                    hits.append(hit)
+                    seen_ids.add(hit.id)
+        return hits
+
+    async def _search_collection(
         self,
         collection_name: str,
         vector: List[float],
         limit: int,
         team_hint: str,
         label: str,
-        restrict_to_team: bool
+        restrict_to_team: bool,
+        offset: int = 0,
+        with_vectors: bool = False,
+        payload_fields: Optional[List[str]] = None
     ):
         if limit <= 0:
             return []
 
+        # Paging re-fetches the preceding hits so the team/fallback merge and
+        # its dedupe stay identical to page 0; the earlier hits are sliced off.
+        snapshot = self.snapshots.get(collection_name)
+        if snapshot is not None and len(snapshot) <= settings.SNAPSHOT_PRIMARY_MAX_POINTS:
+            hits = (await self._search_snapshot(
+                collection_name, "primary", [vector], limit, [team_hint], [restrict_to_team], offset, with_vectors
+            ))[0]
+            metrics.SEARCH_HITS.observe(len(hits), collection=collection_name)
+            return hits
+
         team_filter = self._build_team_filter(team_hint)
-        if not team_filter:
-            try:
-                return self.client.search(
-                    collection_name=collection_name,
-                    query_vector=vector,
-                    limit=limit
-                )
-            except Exception as e:
+        plan = self._plan_collection_search(
+            vector, offset + limit, team_filter, restrict_to_team, with_vectors, payload_fields
+        )
+        try:
+            with metrics.timed(metrics.SEARCH_SECONDS, stage=f"qdrant_{collection_name}", collection=collection_name):
+                batches = await self._qdrant_search_batch(collection_name, plan)
+        except Exception as e:
+            if snapshot is None:
                 logger.error(f"Qdrant {label} search failed: {e}")
                 return []
+            logger.warning(f"Qdrant {label} search failed ({e!r}); using snapshot")
+            hits = (await self._search_snapshot(
+                collection_name, "fallback", [vector], limit, [team_hint], [restrict_to_team], offset, with_vectors
+            ))[0]
+        else:
+            hits = self._merge_planned_hits(batches, offset + limit)[offset:]
+        metrics.SEARCH_HITS.observe(len(hits), collection=collection_name)
+        return hits
 
-        if restrict_to_team:
-            try:
-                return self.client.search(
-                    collection_name=collection_name,
-                    query_vector=vector,
-                    limit=limit,
-                    query_filter=team_filter
-                )
-            except Exception as e:
-                logger.error(f"Qdrant {label} team search failed: {e}")
-                return []
+    async def _qdrant_search_batch(self, collection_name: str, requests: List[qdrant_models.SearchRequest]):
+        # With a snapshot to fall back on, a slow Qdrant is treated like a down one
+        if collection_name in self.snapshots:
+            return await asyncio.wait_for(
+                self.client.search_batch(collection_name=collection_name, requests=requests),
+                timeout=settings.SNAPSHOT_QDRANT_TIMEOUT
+            )
+        return await self.client.search_batch(collection_name=collection_name, requests=requests)
 
-        hits = []
-        seen_ids = set()
-        try:
-            hits = self.client.search(
-                collection_name=collection_name,
-                query_vector=vector,
-                limit=limit,
-                query_filter=team_filter
+    async def _search_snapshot(
+        self,
+        collection_name: str,
+        reason: str,
+        vectors: List[List[float]],
+        limit: int,
+        team_hints: List[str],
+        restrict_to_team: List[bool],
+        offset: int = 0,
+        with_vectors: bool = False
+    ) -> List[list]:
+        snapshot = self.snapshots[collection_name]
+        metrics.SNAPSHOT_SEARCHES.inc(collection=collection_name, reason=reason)
+        with metrics.timed(metrics.SNAPSHOT_SEARCH_SECONDS, stage=f"snapshot_{collection_name}", collection=collection_name):
+            # NumPy releases the GIL in the matrix product
+            return await asyncio.to_thread(
+                snapshot.search_batch, vectors, limit, team_hints, restrict_to_team, offset, with_vectors
+            )
+
+    def snapshot_status(self) -> dict:
+        return {collection: snapshot.status() for collection, snapshot in self.snapshots.items()}
+
+    @property
+    def snapshots_cover_all(self) -> bool:
+        """Whether retrieval can be served entirely from snapshots when Qdrant is down."""
+        return all(
+            collection in self.snapshots
+            for collection in (settings.QDRANT_COLLECTION_USM, settings.QDRANT_COLLECTION_TEST, settings.QDRANT_COLLECTION_JIRA)
+        )
+
+    async def _search_collection_batch(
+        self,
+        collection_name: str,
+        label: str,
+        vectors: List[List[float]],
+        limit: int,
+        team_hints: List[str],
+        restrict_to_team: List[bool],
+        with_vectors: bool = False,
+        payload_fields: Optional[List[str]] = None
+    ) -> List[list]:
+        """Search one collection for many queries in a single search_batch round trip."""
+        if limit <= 0:
+            return [[] for _ in vectors]
+
+        snapshot = self.snapshots.get(collection_name)
+        if snapshot is not None and len(snapshot) <= settings.SNAPSHOT_PRIMARY_MAX_POINTS:
+            results = await self._search_snapshot(
+                collection_name, "primary", vectors, limit, team_hints, restrict_to_team, with_vectors=with_vectors
             )
-            seen_ids = {hit.id for hit in hits}
+            for hits in results:
+                metrics.SEARCH_HITS.observe(len(hits), collection=collection_name)
+            return results
+
+        spans, requests = [], []
+        for vector, team_hint, restrict in zip(vectors, team_hints, restrict_to_team):
+            plan = self._plan_collection_search(
+                vector, limit, self._build_team_filter(team_hint), restrict, with_vectors, payload_fields
+            )
+            spans.append((len(requests), len(plan)))
+            requests.extend(plan)
+        try:
+            with metrics.timed(metrics.SEARCH_SECONDS, stage=f"qdrant_{collection_name}", collection=collection_name):
+                batches = await self._qdrant_search_batch(collection_name, requests)
         except Exception as e:
-            logger.error(f"Qdrant {label} team search failed: {e}")
-            hits = []
+            if snapshot is None:
+                logger.error(f"Qdrant {label} batch search failed: {e}")
+                return [[] for _ in vectors]
+            logger.warning(f"Qdrant {label} batch search failed ({e!r}); using snapshot")
+            results = await self._search_snapshot(
+                collection_name, "fallback", vectors, limit, team_hints, restrict_to_team, with_vectors=with_vectors
+            )
+        else:
+            results = [self._merge_planned_hits(batches[start:start + count], limit) for start, count in spans]
+        for hits in results:
+            metrics.SEARCH_HITS.observe(len(hits), collection=collection_name)
+        return results
 
-        if len(hits) < limit:
-            try:
-                more_hits = self.client.search(
-                    collection_name=collection_name,
-                    query_vector=vector,
-                    limit=limit - len(hits)
-                )
-                for hit in more_hits:
-                    if hit.id not in seen_ids:
-                        hits.append(hit)
-                        seen_ids.add(hit.id)
-            except Exception as e:
-                logger.error(f"Qdrant {label} fallback search failed: {e}")
+    async def search_context_batch(
+        self,
+        requests: List[RefineRequest],
+        total_limit: int = 15,
+        with_vectors: bool = False
+    ) -> List[List[RetrievedReference]]:
+        """search_context for many requests: one encode and one search_batch per collection."""
+        if not requests:
+            return []
+        vectors = await self.vector_service.embed_queries([build_query_text(request) for request in requests])
+        team_hints = [resolve_team_hint(request.component_team, request.component_name) for request in requests]
+        restrict = [request.restrict_to_team for request in requests]
+        limits = self._compute_limits(total_limit)
 
-        return hits
+        usm_hits, test_hits, jira_hits = await asyncio.gather(*(
+            self._search_collection_batch(
+                collection_name=collection_name,
+                label=label,
+                vectors=vectors,
+                limit=limits[key],
+                team_hints=team_hints,
+                restrict_to_team=restrict,
+                with_vectors=with_vectors,
+                payload_fields=PAYLOAD_FIELDS[key]
+            )
+            for key, collection_name, label in (
+                ("usm", settings.QDRANT_COLLECTION_USM, "USM"),
+                ("test", settings.QDRANT_COLLECTION_TEST, "Test Case"),
+                ("jira", settings.QDRANT_COLLECTION_JIRA, "JIRA"),
+            )
+        ))
+        return [
+            self._build_references(usm, test, jira)
+            for usm, test, jira in zip(usm_hits, test_hits, jira_hits)
+        ]
 
-    def search_context(
+    async def search_context(
         self,
         query_text: str,
         total_limit: int = 15,
         component_team: Optional[str] = None,
         component_name: Optional[str] = None,
-        restrict_to_team: bool = True
+        restrict_to_team: bool = True,
+        limits: Optional[Dict[str, int]] = None,
+        page: int = 0,
+        with_vectors: bool = False,
+        language: Optional[str] = None,
+        bypass_cache: bool = False
     ) -> List[RetrievedReference]:
-        vector = self.vector_service.embed_query(query_text)
-        results = []
+        """Retrieve references; identical concurrent calls share one search.
 
-        team_hint = (component_team or "").strip().upper()
-        if not team_hint:
-            team_hint = self._derive_component_team(component_name)
+        with_vectors attaches each hit's stored vector (RetrievedReference.vector)
+        for near-duplicate pruning in the context packer. With the semantic
+        cache enabled, first pages of near-identical queries from the same
+        team and language reuse an earlier result; bypass_cache neither
+        reads nor stores one.
+        """
+        args = (
+            query_text, total_limit, component_team, component_name, restrict_to_team, limits, page, with_vectors,
+            language, bypass_cache
+        )
+        return await self._search_flights.do(
+            request_key("search_context", *args),
+            lambda: self._search_context(*args)
+        )
 
-        limits = self._compute_limits(total_limit)
+    async def _search_context(
+        self,
+        query_text: str,
+        total_limit: int,
+        component_team: Optional[str],
+        component_name: Optional[str],
+        restrict_to_team: bool,
+        limits: Optional[Dict[str, int]],
+        page: int,
+        with_vectors: bool,
+        language: Optional[str],
+        bypass_cache: bool
+    ) -> List[RetrievedReference]:
+        vector = await self.vector_service.embed_query(query_text)
+        team_hint = resolve_team_hint(component_team, component_name)
+        if limits is None:
+            limits = self._compute_limits(total_limit)
+
+        semantic = self.get_semantic_cache() if page == 0 and not bypass_cache else None
+        if semantic is not None:
+            partition = request_key("search", team_hint, language, restrict_to_team, limits, with_vectors)
+            cached = semantic.lookup(partition, vector)
+            if cached is not None:
+                return list(cached[0])
 
-        usm_hits = self._search_collection(
-            collection_name=settings.QDRANT_COLLECTION_USM,
-            vector=vector,
-            limit=limits["usm"],
-            team_hint=team_hint,
-            label="USM",
-            restrict_to_team=restrict_to_team
+        usm_hits, test_hits, jira_hits = await asyncio.gather(
+            self._search_collection(
+                collection_name=settings.QDRANT_COLLECTION_USM,
+                vector=vector,
+                limit=limits["usm"],
+                team_hint=team_hint,
+                label="USM",
+                restrict_to_team=restrict_to_team,
+                offset=page * limits["usm"],
+                with_vectors=with_vectors,
+                payload_fields=PAYLOAD_FIELDS["usm"]
+            ),
+            self._search_collection(
+                collection_name=settings.QDRANT_COLLECTION_TEST,
+                vector=vector,
+                limit=limits["test"],
+                team_hint=team_hint,
+                label="Test Case",
+                restrict_to_team=restrict_to_team,
+                offset=page * limits["test"],
+                with_vectors=with_vectors,
+                payload_fields=PAYLOAD_FIELDS["test"]
+            ),
+            self._search_collection(
+                collection_name=settings.QDRANT_COLLECTION_JIRA,
+                vector=vector,
+                limit=limits["jira"],
+                team_hint=team_hint,
+                label="JIRA",
+                restrict_to_team=restrict_to_team,
+                offset=page * limits["jira"],
+                with_vectors=with_vectors,
+                payload_fields=PAYLOAD_FIELDS["jira"]
+            )
         )
+
+        references = self._build_references(usm_hits, test_hits, jira_hits)
+        # Empty results are more likely an outage than a real answer; don't pin them
+        if semantic is not None and references:
+            semantic.store(partition, vector, references)
+        return references
+
+    def _build_references(self, usm_hits, test_hits, jira_hits) -> List[RetrievedReference]:
+        results = []
         for hit in usm_hits:
             payload = hit.payload
             content = f"Story: {payload.get('title')}\nDesc: {payload.get('description')}\nI want: {payload.get('i_want')}"
-            results.append(RetrievedReference(
-                source_type="usm_node",
-                title=payload.get("title", "Unknown Story"),
-                content_excerpt=content,
-                relevance_score=hit.score
-            ))
+            results.append(self._make_reference("usm_node", payload.get("title") or "Unknown Story", content, hit))
 
-        test_hits = self._search_collection(
-            collection_name=settings.QDRANT_COLLECTION_TEST,
-            vector=vector,
-            limit=limits["test"],
-            team_hint=team_hint,
-            label="Test Case",
-            restrict_to_team=restrict_to_team
-        )
         for hit in test_hits:
             payload = hit.payload
             content = f"TestCase: {payload.get('title')}\nPre: {payload.get('precondition')}\nSteps: {payload.get('steps')}"
-            results.append(RetrievedReference(
-                source_type="test_case",
-                title=payload.get("title", "Unknown Test Case"),
-                content_excerpt=content,
-                relevance_score=hit.score
-            ))
+            results.append(self._make_reference("test_case", payload.get("title") or "Unknown Test Case", content, hit))
 
-        jira_hits = self._search_collection(
-            collection_name=settings.QDRANT_COLLECTION_JIRA,
-            vector=vector,
-            limit=limits["jira"],
-            team_hint=team_hint,
-            label="JIRA",
-            restrict_to_team=restrict_to_team
-        )
         for hit in jira_hits:
             payload = hit.payload
-            content = self._build_jira_content(payload)
-            results.append(RetrievedReference(
-                source_type="jira_reference",
-                title=payload.get("summary") or payload.get("title") or "Unknown JIRA",
-                content_excerpt=content,
-                relevance_score=hit.score
-            ))
+            title = payload.get("summary") or payload.get("title") or "Unknown JIRA"
+            results.append(self._make_reference("jira_reference", title, self._build_jira_content(payload), hit))
 
         results.sort(key=lambda x: x.relevance_score, reverse=True)
         return results
 
-class LLMService:
-    def __init__(self):
-        self.provider = settings.LLM_PROVIDER.lower()
-        self.model = settings.LLM_MODEL
-        
-        logger.info(f"LLM Service initialized. Provider: {self.provider}, Model: {self.model}")
+class LLMError(Exception):
+    pass
+
+class LLMEndpoint:
+    """One provider + model: its OpenAI-compatible client and scheduler."""
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
 
         # Default Config (OpenAI Compatible)
         api_key = "dummy"
@@ -401,71 +821,420 @@ class LLMService:
             base_url = "https://openrouter.ai/api/v1"
             api_key = settings.OPENROUTER_API_KEY
 
-        # Initialize OpenAI Client (Single instance is better for connection pooling, 
-        # but here we init per request or per service lifecycle depending on DI scope.
-        # FastAPI Depends() defaults to request scope, but we can cache it.)
+        self.scheduler = get_scheduler(self.provider, settings)
+
+        # One client per app lifetime (see main.lifespan) so keep-alive
+        # connections to the provider are reused across requests.
         self.client = AsyncOpenAI(
             base_url=base_url,
-            api_key=api_key
+            api_key=api_key,
+            timeout=settings.LLM_TIMEOUT,
+            # Retries are handled by the scheduler, which also respects Retry-After
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                timeout=settings.LLM_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=settings.LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS
+                )
+            )
         )
 
-    async def refine_description(self, request: RefineRequest, context_refs: List[RetrievedReference]) -> str:
-        # Format context
-        context_str = ""
-        for ref in context_refs:
-            context_str += f"[{ref.source_type.upper()}] {ref.title}:\n{ref.content_excerpt}\n---\n"
-        
-        if not context_str:
-            context_str = "No specific references found. Rely on general best practices."
+    async def close(self):
+        await self.client.close()
 
-        lang_config = resolve_language_config(request.output_language)
-        
-        # Decide prompt based on issue type
-        issue_type_lower = (request.issue_type or "").lower()
-        if "bug" in issue_type_lower:
-            prompt_config = PromptConfig.get("qa")
-        else:
-            prompt_config = PromptConfig.get("pm")
-        
-        # Fallback if config is missing (safety check)
-        if not prompt_config:
-            logger.warning("Prompt configuration not found, falling back to default PM prompt.")
-            # Depending on how logic evolved, if 'pm' key missing in yaml, this might fail.
-            # But we just overwrote yaml with both keys.
-            prompt_config = PromptConfig.get("pm") or {}
-
-        system_prompt_raw = prompt_config.get("system_prompt", "")
-        # Apply strict formatting only if prompt exists
-        system_prompt = system_prompt_raw.format(**lang_config) if system_prompt_raw else ""
-        
-        user_template = prompt_config.get("user_prompt_template", "")
+    async def complete(self, messages: List[dict]):
+        # Raw response so the scheduler can read the rate-limit headers
+        response = await self.scheduler.run(lambda: self.client.chat.completions.with_raw_response.create(
+            model=self.model,
+            messages=messages,
+            temperature=0.1,
+            extra_headers=self.extra_headers,
+            # max_tokens=2048 # Optional: Add constraint if needed
+        ))
+        return response.parse()
+
+    async def open_stream(self, messages: List[dict]) -> "OpenedStream":
+        """Start a stream and read up to its first content chunk.
+
+        The provider slot is held until the stream is closed.
+        """
+        response, lease = await self.scheduler.run(
+            lambda: self.client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.1,
+                extra_headers=self.extra_headers,
+                stream=True,
+                stream_options={"include_usage": True} if settings.LLM_STREAM_INCLUDE_USAGE else NOT_GIVEN
+            ),
+            hold=True
+        )
+        opened = OpenedStream(self, response.parse(), lease)
+        try:
+            await opened.read_first_content()
+        except BaseException:
+            await opened.close()
+            raise
+        return opened
+
+
+class OpenedStream:
+    """A provider stream whose leading chunks (through the first content) are buffered."""
+
+    def __init__(self, endpoint: LLMEndpoint, stream, lease):
+        self.endpoint = endpoint
+        self.buffered = []
+        self._stream = stream
+        self._iterator = stream.__aiter__()
+        self._lease = lease
+
+    async def read_first_content(self):
+        async for chunk in self._iterator:
+            self.buffered.append(chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                return
+
+    async def chunks(self):
+        for chunk in self.buffered:
+            yield chunk
+        async for chunk in self._iterator:
+            yield chunk
+
+    async def close(self):
+        self._lease.release()
+        try:
+            await self._stream.close()
+        except Exception as e:
+            logger.warning(f"Closing {self.endpoint.provider} stream failed: {e}")
+
+
+class LLMService:
+    _response_cache = None
+    _draft_cache = None
+    _prompt_templates = None
+
+    @classmethod
+    def get_prompt_templates(cls) -> PromptTemplates:
+        if cls._prompt_templates is None:
+            cls._prompt_templates = PromptTemplates(
+                LANGUAGE_CONFIG, "zh-TW", reload_interval=settings.PROMPTS_RELOAD_INTERVAL
+            )
+        return cls._prompt_templates
+
+    @classmethod
+    def get_response_cache(cls) -> ResponseCache:
+        if cls._response_cache is None:
+            cls._response_cache = ResponseCache(
+                max_entries=settings.RESPONSE_CACHE_SIZE,
+                path=settings.RESPONSE_CACHE_PATH,
+                ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+                disk_max_entries=settings.RESPONSE_CACHE_DISK_MAX_ENTRIES
+            )
+        return cls._response_cache
+
+    @classmethod
+    def get_draft_cache(cls) -> Optional[SemanticCache]:
+        """Drafts reused for near-identical tickets; None unless SEMANTIC_CACHE_ENABLED and SEMANTIC_CACHE_DRAFTS."""
+        if cls._draft_cache is None and settings.SEMANTIC_CACHE_ENABLED and settings.SEMANTIC_CACHE_DRAFTS:
+            cls._draft_cache = SemanticCache(
+                "draft",
+                max_entries=settings.SEMANTIC_CACHE_SIZE,
+                threshold=settings.SEMANTIC_CACHE_DRAFT_THRESHOLD,
+                ttl_seconds=settings.SEMANTIC_CACHE_TTL_SECONDS
+            )
+        return cls._draft_cache
+
+    def _draft_cache_key(self, request: RefineRequest):
+        """(partition, query vector) for the semantic draft cache, or None when it does not apply.
+
+        Only retrieval-backed requests qualify (hand-picked references shape
+        the draft), and the vector must already be in the embedding cache's
+        memory tier, which retrieval guarantees.
+        """
+        if self.get_draft_cache() is None or request.bypass_cache or request.selected_references is not None:
+            return None
+        vector = VectorService.get_cache().peek(build_query_text(request))
+        if vector is None:
+            return None
+        partition = request_key(
+            "draft",
+            resolve_team_hint(request.component_team, request.component_name),
+            request.output_language,
+            request.issue_type,
+            self.get_prompt_templates().version,
+            self.packer.fingerprint,
+            self.model
+        )
+        return partition, vector
+
+    def _response_cache_key(self, request: RefineRequest, context_refs: List[RetrievedReference]) -> str:
+        # Packing settings change the prompt built from the same references
+        prompt_version = f"{self.get_prompt_templates().version}:{self.packer.fingerprint}"
+        return self.get_response_cache().make_key(request, context_refs, prompt_version, self.model)
+
+    def __init__(self):
+        self.provider = settings.LLM_PROVIDER.lower()
+        self.model = settings.LLM_MODEL
+        self._refine_flights = SingleFlight("refine")
+        self.packer = ContextPacker(
+            budget=settings.CONTEXT_TOKEN_BUDGETS.get(self.model, settings.CONTEXT_TOKEN_BUDGET),
+            mmr_lambda=settings.CONTEXT_MMR_LAMBDA,
+            duplicate_threshold=settings.CONTEXT_DUPLICATE_THRESHOLD,
+            min_reference_tokens=settings.CONTEXT_MIN_REFERENCE_TOKENS
+        )
         
-        user_prompt = user_template.format(
+        logger.info(f"LLM Service initialized. Provider: {self.provider}, Model: {self.model}")
+        self.primary = LLMEndpoint(self.provider, self.model)
+        # Kept for callers that talk to the primary provider directly
+        self.client = self.primary.client
+        self.extra_headers = self.primary.extra_headers
+        self.scheduler = self.primary.scheduler
+
+        self.hedge: Optional[LLMEndpoint] = None
+        if settings.LLM_HEDGE_PROVIDER:
+            hedge_provider = settings.LLM_HEDGE_PROVIDER.lower()
+            self.hedge = LLMEndpoint(hedge_provider, settings.LLM_HEDGE_MODEL or self.model)
+            logger.info(f"LLM hedging enabled. Hedge: {hedge_provider}, Model: {self.hedge.model}")
+        # Primary latency per mode: total time for "complete", time to first token for "stream"
+        self.latency = {"complete": LatencyTracker(), "stream": LatencyTracker()}
+
+    async def close(self):
+        await self.primary.close()
+        if self.hedge is not None:
+            await self.hedge.close()
+
+    async def ping(self):
+        """Lists models on the provider without spending tokens.
+
+        This checks reachability only: OpenRouter serves /models without
+        authentication, so a bad API key surfaces on the first completion.
+        """
+        await self.client.models.list()
+
+    def _pack_context(self, context_refs: List[RetrievedReference]) -> PackedContext:
+        packed = self.packer.pack(context_refs)
+        metrics.CONTEXT_TOKENS.observe(packed.tokens_before, stage="before")
+        metrics.CONTEXT_TOKENS.observe(packed.tokens_after, stage="after")
+        metrics.CONTEXT_TOKENS_SAVED.inc(packed.tokens_saved)
+        metrics.CONTEXT_REFERENCES_DROPPED.inc(packed.duplicates_dropped, reason="duplicate")
+        metrics.CONTEXT_REFERENCES_DROPPED.inc(packed.overflow_dropped, reason="budget")
+        if packed.tokens_saved:
+            logger.info(
+                f"Context packed: {packed.tokens_before} -> {packed.tokens_after} tokens "
+                f"(budget {packed.budget}, saved {packed.tokens_saved}; {packed.duplicates_dropped} duplicates, "
+                f"{packed.overflow_dropped} over budget, {packed.truncated} truncated)"
+            )
+        return packed
+
+    def _build_messages(self, request: RefineRequest, context_refs: List[RetrievedReference]) -> List[dict]:
+        context_str = "".join(
+            f"[{ref.source_type.upper()}] {ref.title}:\n{ref.content_excerpt}\n---\n"
+            for ref in self._pack_context(context_refs).references
+        ) or "No specific references found. Rely on general best practices."
+        # System prompt first and byte-identical per (mode, language), so prompt caches hit
+        prompt = self.get_prompt_templates().get(request.issue_type, request.output_language)
+        return prompt.messages(
             issue_type=request.issue_type,
             summary=request.summary,
             context=context_str,
-            draft=request.current_description,
-            output_language=lang_config["language_instruction"]
+            draft=request.current_description
         )
 
-        try:
-            completion = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.1,
-                extra_headers=self.extra_headers,
-                # max_tokens=2048 # Optional: Add constraint if needed
-            )
-            return completion.choices[0].message.content
+    def _record_usage(self, usage, model: Optional[str] = None):
+        if not usage:
+            return
+        metrics.LLM_TOKENS.inc(usage.prompt_tokens or 0, model=model or self.model, kind="prompt")
+        metrics.LLM_TOKENS.inc(usage.completion_tokens or 0, model=model or self.model, kind="completion")
+        # OpenAI-style prompt_tokens_details.cached_tokens; DeepSeek-style prompt_cache_hit_tokens
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+        if cached is None:
+            cached = getattr(usage, "prompt_cache_hit_tokens", None)
+        if cached is not None:
+            metrics.LLM_TOKENS.inc(cached, model=model or self.model, kind="cached_prompt")
+
+    def _hedge_delay(self, mode: str) -> float:
+        observed = self.latency[mode].percentile(settings.LLM_HEDGE_PERCENTILE)
+        delay = observed if observed is not None else settings.LLM_HEDGE_INITIAL_DELAY
+        delay = min(max(delay, settings.LLM_HEDGE_MIN_DELAY), settings.LLM_HEDGE_MAX_DELAY)
+        metrics.LLM_HEDGE_DELAY_SECONDS.set(delay, mode=mode)
+        return delay
 
-        except RateLimitError:
+    async def _run_hedged(self, mode: str, call_primary, call_hedge, discard=None):
+        """Run call_primary, hedged with call_hedge when a hedge provider is configured.
+
+        Returns (result, endpoint that produced it).
+        """
+        if self.hedge is None:
+            return await call_primary(), self.primary
+
+        tracker = self.latency[mode]
+        started = time.perf_counter()
+
+        async def tracked_primary():
+            try:
+                result = await call_primary()
+            except asyncio.CancelledError:
+                # Lost to the hedge: elapsed time is a lower bound of its latency
+                tracker.observe(time.perf_counter() - started)
+                raise
+            tracker.observe(time.perf_counter() - started)
+            return result
+
+        result, winner, hedge_started = await hedged(tracked_primary(), call_hedge, self._hedge_delay(mode), discard)
+        if hedge_started:
+            metrics.LLM_HEDGES.inc(mode=mode)
+            metrics.LLM_HEDGE_WINS.inc(mode=mode, winner=winner)
+        return result, (self.hedge if winner == HEDGE else self.primary)
+
+    def hedge_stats(self) -> dict:
+        if self.hedge is None:
+            return {"enabled": False}
+        stats = {"enabled": True, "primary": self.primary.provider, "hedge": self.hedge.provider, "modes": {}}
+        for mode, tracker in self.latency.items():
+            hedges = metrics.LLM_HEDGES.value(mode=mode)
+            stats["modes"][mode] = {
+                "samples": len(tracker),
+                "delay_seconds": round(self._hedge_delay(mode), 3),
+                "hedges": int(hedges),
+                "hedge_wins": int(metrics.LLM_HEDGE_WINS.value(mode=mode, winner=HEDGE)),
+                "primary_wins_after_hedge": int(metrics.LLM_HEDGE_WINS.value(mode=mode, winner=PRIMARY)),
+            }
+        return stats
+
+    def _describe_error(self, error: Exception) -> str:
+        if isinstance(error, SchedulerRejected):
+            logger.warning(f"LLM call refused: {error}")
+            return "Error: LLM provider is busy. Please try again shortly."
+        if isinstance(error, RateLimitError):
             return "Error: Rate limit exceeded (429). Please try again later."
-        except APIConnectionError as e:
-            logger.error(f"Connection error: {e}")
+        if isinstance(error, APIConnectionError):
+            logger.error(f"Connection error: {error}")
             return "Error: Could not connect to LLM provider."
-        except APIStatusError as e:
-            logger.error(f"API Error {e.status_code}: {e.message}")
-            return f"Error: Provider returned {e.status_code}"
+        logger.error(f"API Error {error.status_code}: {error.message}")
+        return f"Error: Provider returned {error.status_code}"
+
+    async def refine_description(
+        self,
+        request: RefineRequest,
+        context_refs: List[RetrievedReference],
+        raise_errors: bool = False
+    ) -> str:
+        """Refine a draft; identical concurrent requests share one LLM call.
+
+        Provider failures are returned as an "Error: ..." message for the
+        extension to display, or raised as LLMError when raise_errors is set.
+        """
+        cache_key = self._response_cache_key(request, context_refs)
+        try:
+            return await self._refine_flights.do(
+                request_key("refine", cache_key, request.bypass_cache),
+                lambda: self._refine_description(request, context_refs, cache_key)
+            )
+        except LLMError as e:
+            if raise_errors:
+                raise
+            return str(e)
+
+    async def _refine_description(self, request: RefineRequest, context_refs: List[RetrievedReference], cache_key: str) -> str:
+        cache = self.get_response_cache()
+        if not request.bypass_cache:
+            cached = await cache.get_by_key(cache_key)
+            if cached is not None:
+                return cached
+        draft_key = self._draft_cache_key(request)
+        if draft_key is not None:
+            similar = self.get_draft_cache().lookup(*draft_key)
+            if similar is not None:
+                return similar[0]
+
+        messages = self._build_messages(request, context_refs)
+        started = time.perf_counter()
+        model = self.model
+        try:
+            completion, endpoint = await self._run_hedged(
+                "complete",
+                lambda: self.primary.complete(messages),
+                lambda: self.hedge.complete(messages)
+            )
+            model = endpoint.model
+            self._record_usage(completion.usage, model)
+            content = completion.choices[0].message.content
+            # Cache keys name the primary model; a hedge answer came from another endpoint
+            if content and endpoint is self.primary:
+                cache.set_by_key(cache_key, content)
+                if draft_key is not None:
+                    self.get_draft_cache().store(*draft_key, content)
+            return content
+
+        except (RateLimitError, APIConnectionError, APIStatusError, SchedulerRejected) as e:
+            raise LLMError(self._describe_error(e)) from e
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.LLM_SECONDS.observe(elapsed, model=model, mode="complete")
+            metrics.record_stage("llm", elapsed)
+
+    async def stream_refine_description(
+        self,
+        request: RefineRequest,
+        context_refs: List[RetrievedReference]
+    ) -> AsyncIterator[str]:
+        """Yield content deltas as the provider streams them; raises LLMError on provider failure."""
+        cache = self.get_response_cache()
+        cache_key = self._response_cache_key(request, context_refs)
+        if not request.bypass_cache:
+            cached = await cache.get_by_key(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        draft_key = self._draft_cache_key(request)
+        if draft_key is not None:
+            similar = self.get_draft_cache().lookup(*draft_key)
+            if similar is not None:
+                yield similar[0]
+                return
+
+        messages = self._build_messages(request, context_refs)
+        parts = []
+        started = time.perf_counter()
+        model = self.model
+        opened = None
+        endpoint = None
+        try:
+            # Hedging races the streams up to their first token; the loser is closed
+            opened, endpoint = await self._run_hedged(
+                "stream",
+                lambda: self.primary.open_stream(messages),
+                lambda: self.hedge.open_stream(messages),
+                discard=lambda loser: loser.close()
+            )
+            model = endpoint.model
+            async for chunk in opened.chunks():
+                # Providers that report usage send it on the final chunk
+                if getattr(chunk, "usage", None):
+                    self._record_usage(chunk.usage, model)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not parts:
+                        ttft = time.perf_counter() - started
+                        metrics.LLM_TTFT_SECONDS.observe(ttft, model=model)
+                        metrics.record_stage("llm_ttft", ttft)
+                    parts.append(delta)
+                    yield delta
+
+        except (RateLimitError, APIConnectionError, APIStatusError, SchedulerRejected) as e:
+            raise LLMError(self._describe_error(e)) from e
+        finally:
+            if opened is not None:
+                await opened.close()
+            elapsed = time.perf_counter() - started
+            metrics.LLM_SECONDS.observe(elapsed, model=model, mode="stream")
+            metrics.record_stage("llm", elapsed)
+
+        if parts and endpoint is self.primary:
+            cache.set_by_key(cache_key, "".join(parts))
+            if draft_key is not None:
+                self.get_draft_cache().store(*draft_key, "".join(parts))
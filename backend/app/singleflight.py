@@ -0,0 +1,90 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Awaitable, Callable, Dict, Tuple, TypeVar
+
+from app import metrics
+
+T = TypeVar("T")
+
+
+def request_key(*parts) -> str:
+    """Canonical hash of JSON-serializable call arguments."""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key onto one in-flight task.
+
+    The first caller starts the work as its own task; duplicates that arrive
+    before it finishes await the same task and get the same result or
+    exception. Results are shared objects, so callers must not mutate them.
+    A cancelled caller only stops waiting; the work is cancelled once no
+    caller is left waiting for it. Nothing is cached after completion.
+
+    Stage timings recorded by the work are copied into every caller's
+    Server-Timing; callers that joined also get a `coalesced` entry for
+    how long they waited.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        # key -> (task, number of callers waiting on it, stages the task recorded)
+        self._calls: Dict[str, Tuple[asyncio.Task, int, metrics.RequestTimings]] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            timings = metrics.RequestTimings()
+            task = asyncio.ensure_future(self._run(fn, timings))
+            task.add_done_callback(lambda done: self._forget(key, done))
+            waiters = 1
+            coalesced = False
+        else:
+            task, waiters, timings = call[0], call[1] + 1, call[2]
+            coalesced = True
+            metrics.COALESCED_CALLS.inc(operation=self.name)
+        self._calls[key] = (task, waiters, timings)
+
+        started = time.perf_counter()
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done():
+                self._release(key, task)
+            raise
+        finally:
+            if task.done():
+                for stage, seconds in timings.stages:
+                    metrics.record_stage(stage, seconds)
+                if coalesced:
+                    metrics.record_stage("coalesced", time.perf_counter() - started)
+
+    @staticmethod
+    async def _run(fn: Callable[[], Awaitable[T]], timings: metrics.RequestTimings) -> T:
+        # The task runs in a copy of the first caller's context; keep its stages apart
+        metrics.bind_timings(timings)
+        return await fn()
+
+    def _release(self, key: str, task: asyncio.Task):
+        call = self._calls.get(key)
+        if call is None or call[0] is not task:
+            return
+        waiters = call[1] - 1
+        if waiters <= 0:
+            task.cancel()
+        else:
+            self._calls[key] = (task, waiters, call[2])
+
+    def _forget(self, key: str, task: asyncio.Task):
+        call = self._calls.get(key)
+        if call is not None and call[0] is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved when every waiter was cancelled
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger("uvicorn")
+
+SNAPSHOT_DTYPES = ("float16", "int8")
+TEAM_FIELDS = ("team_name", "component_team")
+# Rows scored per matrix product; bounds the float32 copy of an mmapped chunk
+SCORE_CHUNK_ROWS = 32768
+META_FILE = "meta.json"
+
+
+class SnapshotHit:
+    """Quacks like the ScoredPoint fields RAGService reads (id, score, payload, vector)."""
+
+    __slots__ = ("id", "score", "payload", "vector")
+
+    def __init__(self, id, score: float, payload: dict, vector: Optional[List[float]] = None):
+        self.id = id
+        self.score = score
+        self.payload = payload
+        self.vector = vector
+
+
+class CollectionSnapshot:
+    """Read-only, memory-mapped copy of one collection.
+
+    Layout of a snapshot directory:
+      meta.json     count, dim, dtype, team vocabulary, export time
+      vectors.npy   (count, dim) float16, or int8 with a per-row scale
+      scales.npy    (count,) float32, int8 only
+      teams.npy     (count, 2) int32 vocabulary codes of team_name / component_team, -1 if unset
+      payloads.bin  one UTF-8 JSON [id, payload] per row, sliced through offsets.npy
+    Only the rows that make the top-k are decoded. Converting mmapped rows to
+    float32 dominates search time, so collections whose float32 matrix fits
+    in resident_max_bytes are dequantized once into memory.
+    """
+
+    def __init__(self, path: str, resident_max_bytes: int = 0):
+        self.path = path
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as handle:
+            self.meta = json.load(handle)
+        self.collection = self.meta["collection"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.scales = (
+            np.load(os.path.join(path, "scales.npy"), mmap_mode="r") if self.meta["dtype"] == "int8" else None
+        )
+        self.teams = np.load(os.path.join(path, "teams.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.payloads = np.memmap(os.path.join(path, "payloads.bin"), dtype=np.uint8, mode="r") \
+            if self.offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+        self.team_codes: Dict[str, int] = {team: code for code, team in enumerate(self.meta["teams"])}
+        self.resident: Optional[np.ndarray] = None
+        if 0 < self.vectors.size * 4 <= resident_max_bytes:
+            self.resident = np.asarray(self.vectors, dtype=np.float32)
+            if self.scales is not None:
+                self.resident *= np.asarray(self.scales)[:, None]
+
+    def __len__(self) -> int:
+        return int(self.meta["count"])
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.meta["exported_at"]
+
+    def _row(self, index: int):
+        raw = bytes(self.payloads[int(self.offsets[index]):int(self.offsets[index + 1])])
+        point_id, payload = json.loads(raw.decode("utf-8"))
+        return point_id, payload
+
+    def _vector(self, index: int) -> List[float]:
+        row = self.vectors[index].astype(np.float32)
+        if self.scales is not None:
+            row *= self.scales[index]
+        return row.tolist()
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """(queries, count) cosine scores; stored rows and queries are unit length."""
+        if self.resident is not None:
+            return queries @ self.resident.T
+        scores = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), SCORE_CHUNK_ROWS):
+            chunk = np.asarray(self.vectors[start:start + SCORE_CHUNK_ROWS], dtype=np.float32)
+            block = queries @ chunk.T
+            if self.scales is not None:
+                block *= self.scales[start:start + SCORE_CHUNK_ROWS]
+            scores[:, start:start + SCORE_CHUNK_ROWS] = block
+        return scores
+
+    def team_mask(self, team: str) -> Optional[np.ndarray]:
+        """Rows whose team_name or component_team equals team (Qdrant's should/min_should 1)."""
+        if not team:
+            return None
+        code = self.team_codes.get(team)
+        if code is None:
+            return np.zeros(len(self), dtype=bool)
+        return (self.teams == code).any(axis=1)
+
+    @staticmethod
+    def _top(scores: np.ndarray, count: int) -> np.ndarray:
+        count = min(count, scores.shape[0])
+        if count <= 0:
+            return np.empty(0, dtype=np.int64)
+        if count < scores.shape[0]:
+            candidates = np.argpartition(-scores, count - 1)[:count]
+        else:
+            candidates = np.arange(scores.shape[0])
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+    def _plan_rows(self, scores: np.ndarray, limit: int, team: str, restrict_to_team: bool) -> List[int]:
+        # Same merge as RAGService._plan_collection_search: team hits first,
+        # then the unfiltered ranking fills up to limit, without duplicates.
+        rows: List[int] = []
+        mask = self.team_mask(team)
+        if mask is not None:
+            filtered = np.where(mask, scores, -np.inf)
+            rows.extend(int(row) for row in self._top(filtered, limit) if np.isfinite(filtered[row]))
+        if mask is None or not restrict_to_team:
+            seen = set(rows)
+            for row in self._top(scores, limit):
+                if len(rows) >= limit:
+                    break
+                if int(row) not in seen:
+                    rows.append(int(row))
+        return rows[:limit]
+
+    def search_batch(
+        self,
+        vectors: Sequence[Sequence[float]],
+        limit: int,
+        teams: Sequence[str],
+        restrict_to_team: Sequence[bool],
+        offset: int = 0,
+        with_vectors: bool = False
+    ) -> List[List[SnapshotHit]]:
+        if limit <= 0 or len(self) == 0:
+            return [[] for _ in vectors]
+        queries = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1.0)
+        scores = self._scores(queries)
+        results = []
+        for row_scores, team, restrict in zip(scores, teams, restrict_to_team):
+            hits = []
+            for row in self._plan_rows(row_scores, offset + limit, team, restrict)[offset:]:
+                point_id, payload = self._row(row)
+                vector = self._vector(row) if with_vectors else None
+                hits.append(SnapshotHit(point_id, float(row_scores[row]), payload, vector))
+            results.append(hits)
+        return results
+
+    def status(self) -> dict:
+        return {
+            "points": len(self),
+            "dim": self.meta["dim"],
+            "dtype": self.meta["dtype"],
+            "resident": self.resident is not None,
+            "age_seconds": round(self.age_seconds, 1),
+        }
+
+
+def load_snapshots(root: str, collections: Iterable[str], resident_max_bytes: int = 0) -> Dict[str, CollectionSnapshot]:
+    """Open every collection snapshot found under root; missing or broken ones are skipped."""
+    snapshots = {}
+    if not root:
+        return snapshots
+    for collection in collections:
+        path = os.path.join(root, collection)
+        if not os.path.exists(os.path.join(path, META_FILE)):
+            continue
+        try:
+            snapshot = CollectionSnapshot(path, resident_max_bytes)
+        except Exception as e:
+            logger.error(f"Failed to open vector snapshot {path}: {e}")
+            continue
+        snapshots[collection] = snapshot
+        mode = "resident float32" if snapshot.resident is not None else "mmap"
+        logger.info(f"Loaded vector snapshot {collection}: {len(snapshot)} points ({snapshot.meta['dtype']}, {mode})")
+    return snapshots
+
+
+def _quantize(vectors: np.ndarray, dtype: str):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms > 0, norms, 1.0)
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales
+
+
+async def export_collection(client, collection: str, root: str, payload_fields: List[str], dtype: str = "float16", page_size: int = 1024) -> int:
+    """Scroll a Qdrant collection into root/collection; swapped in atomically when complete."""
+    count = (await client.count(collection_name=collection, exact=True)).count
+    final_path = os.path.join(root, collection)
+    work_path = f"{final_path}.tmp"
+    shutil.rmtree(work_path, ignore_errors=True)
+    os.makedirs(work_path)
+
+    vectors = scales = None
+    fields = list(dict.fromkeys([*payload_fields, *TEAM_FIELDS]))
+    teams: Dict[str, int] = {}
+    team_rows = np.full((count, len(TEAM_FIELDS)), -1, dtype=np.int32)
+    offsets = [0]
+    row = 0
+    next_offset = None
+    with open(os.path.join(work_path, "payloads.bin"), "wb") as payload_file:
+        while row < count:
+            points, next_offset = await client.scroll(
+                collection_name=collection,
+                limit=page_size,
+                offset=next_offset,
+                with_payload=fields,
+                with_vectors=True
+            )
+            # Points added after count() are left for the next export
+            points = [point for point in points if point.vector is not None][:count - row]
+            if points:
+                page = np.asarray([
+                    next(iter(point.vector.values())) if isinstance(point.vector, dict) else point.vector
+                    for point in points
+                ], dtype=np.float32)
+                if vectors is None:
+                    vectors = np.lib.format.open_memmap(
+                        os.path.join(work_path, "vectors.npy"), mode="w+", dtype=dtype, shape=(count, page.shape[1])
+                    )
+                    if dtype == "int8":
+                        scales = np.lib.format.open_memmap(
+                            os.path.join(work_path, "scales.npy"), mode="w+", dtype=np.float32, shape=(count,)
+                        )
+                quantized, page_scales = _quantize(page, dtype)
+                vectors[row:row + len(points)] = quantized
+                if scales is not None:
+                    scales[row:row + len(points)] = page_scales
+                for index, point in enumerate(points):
+                    payload = {key: value for key, value in (point.payload or {}).items() if key in fields}
+                    for column, field in enumerate(TEAM_FIELDS):
+                        team = payload.get(field)
+                        if team:
+                            team_rows[row + index, column] = teams.setdefault(str(team), len(teams))
+                    encoded = json.dumps([point.id, payload], ensure_ascii=False).encode("utf-8")
+                    payload_file.write(encoded)
+                    offsets.append(offsets[-1] + len(encoded))
+                row += len(points)
+            if next_offset is None:
+                break
+
+    dim = vectors.shape[1] if vectors is not None else 0
+    if vectors is None or row < count:
+        # Collection shrank during export: rewrite the matrices at the real size
+        # Copies, not views: np.save below truncates the files these memmaps point into
+        kept = np.array(vectors[:row]) if vectors is not None else np.zeros((0, dim), dtype=dtype)
+        kept_scales = np.array(scales[:row]) if scales is not None else None
+        del vectors, scales
+        np.save(os.path.join(work_path, "vectors.npy"), kept)
+        if dtype == "int8":
+            np.save(os.path.join(work_path, "scales.npy"), kept_scales if kept_scales is not None else np.zeros(0, np.float32))
+    else:
+        vectors.flush()
+        if scales is not None:
+            scales.flush()
+        del vectors, scales
+    np.save(os.path.join(work_path, "teams.npy"), team_rows[:row])
+    np.save(os.path.join(work_path, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(work_path, META_FILE), "w", encoding="utf-8") as handle:
+        json.dump({
+            "collection": collection,
+            "count": row,
+            "dim": dim,
+            "dtype": dtype,
+            "teams": sorted(teams, key=teams.get),
+            "payload_fields": fields,
+            "exported_at": time.time(),
+        }, handle, ensure_ascii=False)
+
+    old_path = f"{final_path}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(final_path):
+        # Running servers keep their open mmaps of the old files until restart
+        os.rename(final_path, old_path)
+    os.rename(work_path, final_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return row
+
+
+async def _export(args) -> int:
+    from app.services import PAYLOAD_FIELDS, create_qdrant_client, settings
+
+    collections = {
+        "usm": settings.QDRANT_COLLECTION_USM,
+        "test": settings.QDRANT_COLLECTION_TEST,
+        "jira": settings.QDRANT_COLLECTION_JIRA,
+    }
+    os.makedirs(args.dir, exist_ok=True)
+    client = create_qdrant_client()
+    try:
+        for key in args.collections or list(collections):
+            started = time.perf_counter()
+            count = await export_collection(client, collections[key], args.dir, PAYLOAD_FIELDS[key], args.dtype)
+            print(f"{collections[key]}: {count} points in {time.perf_counter() - started:.1f}s")
+    finally:
+        await client.close()
+    return 0
+
+
+def main(argv=None) -> int:
+    from app.config import get_settings
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Export Qdrant collections to memory-mapped snapshots")
+    parser.add_argument("--dir", default=settings.SNAPSHOT_DIR or "snapshots", help="Snapshot root (SNAPSHOT_DIR)")
+    parser.add_argument("--dtype", choices=SNAPSHOT_DTYPES, default=settings.SNAPSHOT_DTYPE)
+    parser.add_argument(
+        "--collection", dest="collections", action="append", choices=["usm", "test", "jira"], help="Repeatable; defaults to all three"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    return asyncio.run(_export(args))
+
+
+if __name__ == "__main__":
+    # Usage (from backend/): python -m app.snapshot --dir snapshots --dtype int8
+    sys.exit(main())
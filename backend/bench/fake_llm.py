@@ -0,0 +1,130 @@
+"""OpenAI-compatible chat completions stand-in for offline benchmarks.
+
+Serves /v1/chat/completions (plain and stream=True) and /v1/models on a
+background thread, with a configurable delay before the first token and a
+fixed token rate, so the refine path can be driven without a provider.
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+FILLER_TOKENS = [
+    "h1. ", "Menu", "\n", " * ", "*As a* ", "玩家", "\n", " * ", "*I want* ", "修改",
+    "投注", "金額", "\n", "h2. ", "Scenario ", "1", ": ", "調整", "金額", "\n",
+    " * ", "*Given* ", "使用者", "已登入", "\n", " * ", "*When* ", "點擊", "確認", "\n",
+]
+
+
+def build_app(first_token_latency_ms: float, tokens_per_second: float, completion_tokens: int) -> FastAPI:
+    app = FastAPI()
+    token_interval = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+
+    def token_at(index: int) -> str:
+        return FILLER_TOKENS[index % len(FILLER_TOKENS)]
+
+    def usage(messages) -> dict:
+        prompt_chars = sum(len(message.get("content") or "") for message in messages)
+        prompt_tokens = max(prompt_chars // 2, 1)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "bench-model", "object": "model", "owned_by": "bench"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "bench-model")
+        messages = body.get("messages", [])
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(first_token_latency_ms / 1000 + token_interval * completion_tokens)
+            content = "".join(token_at(i) for i in range(completion_tokens))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage(messages),
+            }
+
+        async def events():
+            def chunk(delta: dict, finish_reason=None, **extra) -> str:
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                    **extra,
+                }
+                return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+            await asyncio.sleep(first_token_latency_ms / 1000)
+            yield chunk({"role": "assistant", "content": ""})
+            for index in range(completion_tokens):
+                if index and token_interval:
+                    await asyncio.sleep(token_interval)
+                yield chunk({"content": token_at(index)})
+            yield chunk({}, finish_reason="stop", usage=usage(messages))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeLLMServer:
+    """Runs the fake provider on 127.0.0.1 in a daemon thread; use as a context manager."""
+
+    def __init__(self, first_token_latency_ms: float = 300.0, tokens_per_second: float = 200.0, completion_tokens: int = 300):
+        self.port = _free_port()
+        config = uvicorn.Config(
+            build_app(first_token_latency_ms, tokens_per_second, completion_tokens),
+            host="127.0.0.1",
+            port=self.port,
+            log_level="warning",
+        )
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, name="fake-llm", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def __enter__(self):
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake LLM server did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join(5)
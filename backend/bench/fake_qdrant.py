@@ -0,0 +1,141 @@
+"""Local Qdrant stand-in seeded with synthetic payloads shaped like qdrant_schema.md."""
+import random
+from typing import Callable, List
+
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http import models as qdrant_models
+
+TEAMS = ["TAD", "GED", "GPD", "CBS", "PAY"]
+TERMS = [
+    "調整金額", "注數", "投注", "計算機", "結帳", "折扣碼", "登入", "會員", "報表", "匯出",
+    "遊戲", "API", "壓縮圖", "商戶", "餘額", "提款", "存款", "驗證碼", "通知", "權限",
+]
+
+
+def _phrase(rng: random.Random, words: int) -> str:
+    return "".join(rng.choice(TERMS) for _ in range(words))
+
+
+def _usm_payload(rng: random.Random, index: int) -> dict:
+    team = rng.choice(TEAMS)
+    title = _phrase(rng, 2)
+    description = f"點擊{_phrase(rng, 2)}後彈出{_phrase(rng, 1)}並完成{_phrase(rng, 2)}"
+    i_want = f"修改想要的{_phrase(rng, 2)}"
+    return {
+        "team_id": TEAMS.index(team) + 1,
+        "team_name": team,
+        "map_id": rng.randint(1, 20),
+        "map_name": team,
+        "node_type": "user_story",
+        "level": 3,
+        "node_id": f"Story-{team}-{index:05d}",
+        "children_ids": [],
+        "related_node_ids": [],
+        "title": title,
+        "description": description,
+        "as_a": "玩家",
+        "i_want": i_want,
+        "so_that": "",
+        "jira_tickets": [],
+        "text": f"地圖: {team}\n名稱: {title}\n描述: {description}\n類型: Story\n角色 (As a): 玩家\n需求 (I want): {i_want}",
+        "resource_type": "usm_node",
+        "updated_at": "2025-11-25T08:56:28.322380",
+    }
+
+
+def _test_case_payload(rng: random.Random, index: int) -> dict:
+    team = rng.choice(TEAMS)
+    title = f"{_phrase(rng, 3)} 使用 PNG"
+    precondition = "\n".join(f"●{_phrase(rng, 2)}：{_phrase(rng, 3)}" for _ in range(rng.randint(2, 6)))
+    steps = "\n".join(f"Step{step}. {_phrase(rng, 4)}" for step in range(1, rng.randint(3, 15)))
+    expected = "\n".join(f"●{_phrase(rng, 4)}" for _ in range(rng.randint(1, 5)))
+    return {
+        "team_id": TEAMS.index(team) + 1,
+        "team_name": team,
+        "test_case_number": f"TCG-{100000 + index}.010.010",
+        "priority": rng.choice(["High", "Medium", "Low"]),
+        "set_id": rng.randint(1, 10),
+        "lark_record_id": None,
+        "tcg_tickets": [f"TCG-{100000 + index}"],
+        "title": title,
+        "precondition": precondition,
+        "steps": steps,
+        "expected_result": expected,
+        "text": f"標題: {title}\n前置條件: {precondition}\n測試步驟: {steps}\n預期結果: {expected}",
+        "resource_type": "test_case",
+        "updated_at": "2025-10-25T12:32:09.245471",
+    }
+
+
+def _jira_payload(rng: random.Random, index: int) -> dict:
+    team = rng.choice(TEAMS)
+    summary = f"使用者可以在{_phrase(rng, 2)}輸入{_phrase(rng, 1)}"
+    description = "\n".join(_phrase(rng, 5) for _ in range(rng.randint(1, 8)))
+    acceptance = "Given 使用者已登入\nWhen 點擊確認\nThen " + _phrase(rng, 3)
+    issue_key = f"{team}-{1000 + index}"
+    return {
+        "project_key": team,
+        "issue_key": issue_key,
+        "issue_type": rng.choice(["Story", "Bug", "Task"]),
+        "team_name": team,
+        "component_team": team,
+        "summary": summary,
+        "description": description,
+        "acceptance_criteria": acceptance,
+        "labels": [rng.choice(TERMS)],
+        "text": f"Key: {issue_key}\nSummary: {summary}\nDescription: {description}\nAC: {acceptance}",
+        "resource_type": "jira_reference",
+        "updated_at": "2025-11-25T08:56:28.322380",
+    }
+
+
+PAYLOAD_BUILDERS = {
+    "usm_nodes": _usm_payload,
+    "test_cases": _test_case_payload,
+    "jira_references": _jira_payload,
+}
+
+
+def sample_query(rng: random.Random) -> dict:
+    """A RefineRequest body in the same vocabulary as the seeded payloads."""
+    team = rng.choice(TEAMS)
+    return {
+        "summary": f"{_phrase(rng, 2)}優化",
+        "current_description": "\n".join(_phrase(rng, 4) for _ in range(rng.randint(2, 6))),
+        "issue_type": rng.choice(["Story", "Bug"]),
+        "component_name": f"{team} UI",
+        "component_team": team,
+        "restrict_to_team": rng.random() < 0.5,
+        "output_language": "zh-TW",
+    }
+
+
+async def build_fake_qdrant(
+    collections: dict,
+    points_per_collection: int,
+    encode: Callable[[List[str]], List[List[float]]],
+    vector_size: int,
+    seed: int = 7,
+    batch_size: int = 256
+) -> AsyncQdrantClient:
+    """Create an in-memory client with collections named by `collections` (kind -> name)."""
+    rng = random.Random(seed)
+    client = AsyncQdrantClient(location=":memory:")
+    for kind, name in collections.items():
+        await client.create_collection(
+            collection_name=name,
+            vectors_config=qdrant_models.VectorParams(size=vector_size, distance=qdrant_models.Distance.COSINE),
+        )
+        builder = PAYLOAD_BUILDERS[kind]
+        payloads = [builder(rng, index) for index in range(points_per_collection)]
+        for start in range(0, len(payloads), batch_size):
+            chunk = payloads[start:start + batch_size]
+            vectors = encode([payload["text"] for payload in chunk])
+            await client.upsert(
+                collection_name=name,
+                points=[
+                    qdrant_models.PointStruct(id=start + offset, vector=list(vector), payload=payload)
+                    for offset, (vector, payload) in enumerate(zip(vectors, chunk))
+                ],
+            )
+    return client
@@ -0,0 +1,236 @@
+"""Offline load test for the refine endpoints.
+
+Runs the FastAPI app in-process against a fake OpenAI-compatible provider
+and an in-memory Qdrant seeded with synthetic payloads, then reports
+latency percentiles, throughput and per-stage timings per concurrency level.
+
+Usage (from backend/):
+    python -m bench.run --concurrency 1,8,32 --requests 200
+    python -m bench.run --endpoint refine/stream --llm-latency-ms 800 --json results.json
+    python -m bench.run --embedding real          # load bge-m3 instead of the stub
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+STUB_DIM = 1024
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline refine benchmark")
+    parser.add_argument("--endpoint", choices=["refine", "refine/stream"], default="refine")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--points", type=int, default=500, help="Synthetic points per collection")
+    parser.add_argument("--embedding", choices=["stub", "real"], default="stub")
+    parser.add_argument("--stub-encode-ms", type=float, default=0.0, help="Simulated encode cost per text (stub mode)")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Fake provider time to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--completion-tokens", type=int, default=300)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0, help="Share of requests that repeat an earlier payload")
+    parser.add_argument("--keep-caches", action="store_true", help="Leave embedding/response caches enabled")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, llm_base_url: str, workdir: str):
+    # Settings are read when app modules are imported, so this runs first.
+    os.environ["LLM_PROVIDER"] = "lmstudio"
+    os.environ["LM_STUDIO_URL"] = llm_base_url
+    os.environ["LLM_MODEL"] = "bench-model"
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+    os.environ["RESPONSE_CACHE_PATH"] = ""
+    if not args.keep_caches:
+        os.environ["EMBEDDING_CACHE_SIZE"] = "0"
+        os.environ["RESPONSE_CACHE_SIZE"] = "0"
+    os.chdir(workdir)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    stages = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "dur" and name:
+                stages[name] = stages.get(name, 0.0) + float(value)
+    return stages
+
+
+def parse_done_timing(body: str) -> Dict[str, float]:
+    stages = {}
+    for block in body.split("\n\n"):
+        if block.startswith("event: done"):
+            data = json.loads(block.split("data: ", 1)[1])
+            for key, value in data.get("timing", {}).items():
+                if value is not None:
+                    stages[key.replace("_ms", "")] = value
+    return stages
+
+
+async def run_level(client, endpoint: str, payloads: List[dict], concurrency: int) -> dict:
+    queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+    latencies = []
+    stage_samples = defaultdict(list)
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while True:
+            try:
+                payload = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                response = await client.post(f"/api/v1/{endpoint}", json=payload)
+                body = response.text
+            except Exception:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200 or '"Error:' in body[:200]:
+                errors += 1
+            if endpoint == "refine":
+                stages = parse_server_timing(response.headers.get("server-timing", ""))
+            else:
+                stages = parse_done_timing(body)
+            for stage, value in stages.items():
+                stage_samples[stage].append(value)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(payloads),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 1),
+            "p95": round(percentile(latencies, 95), 1),
+            "p99": round(percentile(latencies, 99), 1),
+            "mean": round(statistics.fmean(latencies), 1) if latencies else 0.0,
+        },
+        "stages_ms": {
+            stage: {
+                "mean": round(statistics.fmean(values), 1),
+                "p95": round(percentile(values, 95), 1),
+            }
+            for stage, values in sorted(stage_samples.items())
+        },
+    }
+
+
+def print_report(results: List[dict], args):
+    print(f"\nendpoint=/api/v1/{args.endpoint} embedding={args.embedding} points={args.points} "
+          f"llm_ttft={args.llm_latency_ms}ms llm_rate={args.llm_tokens_per_second}tok/s")
+    print(f"{'conc':>5} {'reqs':>5} {'err':>4} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for result in results:
+        latency = result["latency_ms"]
+        print(f"{result['concurrency']:>5} {result['requests']:>5} {result['errors']:>4} {result['rps']:>8} "
+              f"{latency['p50']:>9} {latency['p95']:>9} {latency['p99']:>9}")
+    for result in results:
+        stages = ", ".join(
+            f"{stage}={values['mean']}/{values['p95']}" for stage, values in result["stages_ms"].items()
+        )
+        print(f"  c={result['concurrency']} stages mean/p95 ms: {stages}")
+
+
+async def main_async(args) -> List[dict]:
+    import httpx
+    import main
+    from app import analytics
+    from app.config import get_settings
+    from app.services import LLMService, RAGService, VectorService
+    from bench.fake_qdrant import build_fake_qdrant, sample_query
+    from bench.stub_embedding import StubEmbeddingModel
+
+    settings = get_settings()
+    if args.embedding == "stub":
+        VectorService._model = StubEmbeddingModel(STUB_DIM, args.stub_encode_ms)
+    vector_size = len(VectorService.encode(["probe"])[0])
+
+    collections = {
+        "usm_nodes": settings.QDRANT_COLLECTION_USM,
+        "test_cases": settings.QDRANT_COLLECTION_TEST,
+        "jira_references": settings.QDRANT_COLLECTION_JIRA,
+    }
+    print(f"Seeding {args.points} points x {len(collections)} collections (dim={vector_size})...", file=sys.stderr)
+    qdrant = await build_fake_qdrant(collections, args.points, VectorService.encode, vector_size, seed=args.seed)
+
+    analytics.init_db()
+    main.app.state.rag_service = RAGService(client=qdrant)
+    main.app.state.llm_service = LLMService()
+
+    rng = random.Random(args.seed)
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        warmup = [sample_query(rng) for _ in range(args.warmup)]
+        await run_level(client, args.endpoint, warmup, max(1, min(levels)))
+        for level in levels:
+            payloads = []
+            for _ in range(args.requests):
+                if payloads and rng.random() < args.duplicate_ratio:
+                    payloads.append(dict(rng.choice(payloads)))
+                else:
+                    payloads.append(sample_query(rng))
+            print(f"Running concurrency={level}...", file=sys.stderr)
+            results.append(await run_level(client, args.endpoint, payloads, level))
+
+    await main.app.state.llm_service.close()
+    await qdrant.close()
+    analytics.shutdown()
+    VectorService.shutdown()
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, backend_dir)
+
+    from bench.fake_llm import FakeLLMServer
+
+    with tempfile.TemporaryDirectory(prefix="ra-bench-") as workdir, FakeLLMServer(
+        first_token_latency_ms=args.llm_latency_ms,
+        tokens_per_second=args.llm_tokens_per_second,
+        completion_tokens=args.completion_tokens,
+    ) as llm_server:
+        configure_environment(args, llm_server.base_url, workdir)
+        # Relative paths (analytics.db, caches) land in the temp dir; prompts.yaml
+        # falls back to the backend directory.
+        results = asyncio.run(main_async(args))
+
+    print_report(results, args)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
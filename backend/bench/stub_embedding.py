@@ -0,0 +1,35 @@
+"""Deterministic stand-in for bge-m3 so benchmarks can skip model load and CPU encode."""
+import hashlib
+import time
+
+import numpy as np
+
+from app.embedding import EmbeddingBackend
+
+
+class StubEmbeddingModel(EmbeddingBackend):
+    """Hash-seeded unit vectors; same text, same vector. Optional per-text encode cost."""
+
+    name = "stub"
+
+    def __init__(self, dim: int = 1024, encode_ms_per_text: float = 0.0):
+        super().__init__("stub")
+        self.dim = dim
+        self.encode_ms_per_text = encode_ms_per_text
+
+    def load(self):
+        return self
+
+    def encode(self, texts):
+        texts = list(texts)
+        if self.encode_ms_per_text:
+            # Busy-wait so the cost lands on the embedding thread like a real encode
+            deadline = time.perf_counter() + self.encode_ms_per_text * len(texts) / 1000
+            while time.perf_counter() < deadline:
+                pass
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            vectors[row] = vector / np.linalg.norm(vector)
+        return vectors.tolist()
@@ -0,0 +1,2 @@
+# Unit tests live in tests/; test_llm.py is a manual OpenRouter connectivity script
+collect_ignore = ["test_llm.py"]
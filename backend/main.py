@@ -1,20 +1,54 @@
+import asyncio
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from app.schemas import RefineRequest, RefineResponse, HealthCheckResponse
-from app.services import RAGService, LLMService, VectorService
-from app.config import get_settings
-from app import analytics
+from app.schemas import RefineRequest, RefineResponse, HealthCheckResponse, ReferencesRequest, ReferencesResponse, BatchRefineRequest
+from app.services import RAGService, LLMService, VectorService, LLMError, EmbeddingNotReady, SOURCE_LIMIT_KEYS, settings, build_query_text
+from app import analytics, metrics
+from app.batch import BatchJobStore, run_batch
+from app.health import CachedProbe
 import logging
 from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+import json
 import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("uvicorn")
 
-app = FastAPI(title="JIRA Requirement Assistant API")
+# Seconds clients should wait before retrying while the model loads
+NOT_READY_RETRY_AFTER = "5"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Server starting... loading embedding model in the background.")
+    analytics.init_db()
+    analytics.get_writer()
+    # Long-lived clients: connection pools are shared by every request
+    app.state.rag_service = RAGService()
+    app.state.llm_service = LLMService()
+    app.state.probes = {
+        "qdrant": CachedProbe("qdrant", app.state.rag_service.ping, settings.HEALTH_PROBE_TTL_SECONDS, settings.HEALTH_PROBE_TIMEOUT),
+        "llm": CachedProbe("llm", app.state.llm_service.ping, settings.HEALTH_PROBE_TTL_SECONDS, settings.HEALTH_PROBE_TIMEOUT),
+    }
+    app.state.batch_jobs = BatchJobStore(settings.BATCH_MAX_JOBS, settings.BATCH_JOB_TTL_SECONDS)
+    warmup = asyncio.create_task(VectorService.warm_up())
+    yield
+    app.state.batch_jobs.cancel_all()
+    if not warmup.done():
+        # The loader thread itself cannot be interrupted; stop waiting for it
+        warmup.cancel()
+    await app.state.rag_service.close()
+    await app.state.llm_service.close()
+    VectorService.shutdown()
+    LLMService.get_response_cache().close()
+    analytics.shutdown()
+
+app = FastAPI(title="JIRA Requirement Assistant API", lifespan=lifespan)
 
 # Templates
 templates_dir = os.path.join(os.path.dirname(__file__), "app/templates")
@@ -28,43 +62,91 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Batch-Job-Id"],
 )
+app.add_middleware(metrics.ServerTimingMiddleware)
 
-# Dependency Injection
-def get_rag_service():
-    return RAGService()
+# Dependency Injection (singletons owned by the lifespan)
+def get_rag_service(request: Request) -> RAGService:
+    return request.app.state.rag_service
 
-def get_llm_service():
-    return LLMService()
+def get_llm_service(request: Request) -> LLMService:
+    return request.app.state.llm_service
 
-@app.on_event("startup")
-async def startup_event():
-    # Preload Embedding Model
-    logger.info("Server starting... preloading resources.")
-    analytics.init_db()
-    VectorService.get_model()
+@app.exception_handler(EmbeddingNotReady)
+async def embedding_not_ready_handler(request: Request, exc: EmbeddingNotReady):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Embedding model not ready: {exc}"},
+        headers={"Retry-After": NOT_READY_RETRY_AFTER}
+    )
 
-@app.get("/health", response_model=HealthCheckResponse)
-async def health_check():
-    settings = get_settings()
-    # Check Qdrant connectivity
-    qdrant_status = "unknown"
-    try:
-        from qdrant_client import QdrantClient
-        client = QdrantClient(url=settings.QDRANT_URL)
-        collections = client.get_collections()
-        qdrant_status = "connected"
-    except Exception as e:
-        qdrant_status = f"error: {str(e)}"
+def model_status() -> str:
+    if VectorService.is_ready():
+        return "ready"
+    if VectorService.load_error():
+        return f"error: {VectorService.load_error()}"
+    return "loading"
+
+async def probe_dependencies(request: Request) -> dict:
+    probes = request.app.state.probes
+    results = await asyncio.gather(*(probe.status() for probe in probes.values()))
+    return dict(zip(probes.keys(), results))
 
+@app.get("/livez")
+async def liveness():
+    """Process is up and the event loop responds; never touches dependencies."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readiness(request: Request):
+    """Ready once the model is warm and Qdrant answers (or snapshots cover every collection).
+
+    An LLM outage is reported but does not take the pod out of rotation:
+    every pod shares the provider, and retrieval-only endpoints still work.
+    """
+    probes = await probe_dependencies(request)
+    rag_service = request.app.state.rag_service
+    ready = VectorService.is_ready() and (probes["qdrant"]["ok"] or rag_service.snapshots_cover_all)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "embedding_model": model_status(),
+            "dependencies": probes,
+            "snapshots": rag_service.snapshot_status()
+        },
+        headers=None if ready else {"Retry-After": NOT_READY_RETRY_AFTER}
+    )
+
+@app.get("/health", response_model=HealthCheckResponse)
+async def health_check(request: Request):
+    probes = await probe_dependencies(request)
     return {
         "status": "ok",
         "services": {
-            "qdrant": qdrant_status,
-            "llm": "ready"
+            "embedding_model": model_status(),
+            "qdrant": probes["qdrant"]["detail"],
+            "llm": "ready" if probes["llm"]["ok"] else probes["llm"]["detail"]
         }
     }
 
+async def resolve_references(request: RefineRequest, rag_service: RAGService):
+    if request.selected_references is not None:
+        return request.selected_references
+    return await rag_service.search_context(
+        build_query_text(request),
+        component_team=request.component_team,
+        component_name=request.component_name,
+        restrict_to_team=request.restrict_to_team,
+        with_vectors=settings.CONTEXT_FETCH_VECTORS,
+        language=request.output_language,
+        bypass_cache=request.bypass_cache
+    )
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @app.post("/api/v1/refine", response_model=RefineResponse)
 async def refine_description(
     request: RefineRequest,
@@ -73,23 +155,17 @@ async def refine_description(
 ):
     logger.info(f"Refining request for issue: {request.summary}")
     
-    # Log usage (fire and forget, or sync)
+    # Log usage (queued; written in batches off the event loop)
     analytics.log_usage(request)
 
-    # 1. Retrieve Context
-    query = f"{request.summary} {request.current_description}"
-    if request.selected_references is not None:
-        references = request.selected_references
-    else:
-        references = rag_service.search_context(
-            query,
-            component_team=request.component_team,
-            component_name=request.component_name,
-            restrict_to_team=request.restrict_to_team
-        )
-    
-    # 2. Call LLM
-    refined_text = await llm_service.refine_description(request, references)
+    with metrics.timed(metrics.REQUEST_SECONDS, endpoint="refine"):
+        # 1. Retrieve Context
+        started = time.perf_counter()
+        references = await resolve_references(request, rag_service)
+        metrics.record_stage("retrieval", time.perf_counter() - started)
+        
+        # 2. Call LLM
+        refined_text = await llm_service.refine_description(request, references)
     
     return {
         "original_text": request.current_description,
@@ -97,9 +173,169 @@ async def refine_description(
         "references": references
     }
 
+@app.post("/api/v1/refine/stream")
+async def refine_description_stream(
+    request: RefineRequest,
+    rag_service: RAGService = Depends(get_rag_service),
+    llm_service: LLMService = Depends(get_llm_service)
+):
+    logger.info(f"Streaming refine for issue: {request.summary}")
+    # Headers go out before retrieval runs, so reject up front instead of mid-stream
+    if request.selected_references is None and not VectorService.is_ready():
+        raise EmbeddingNotReady(VectorService.load_error() or "Embedding model is still loading")
+    analytics.log_usage(request)
+
+    async def event_stream():
+        started = time.perf_counter()
+        references = await resolve_references(request, rag_service)
+        retrieval_done = time.perf_counter()
+        yield format_sse("references", [ref.model_dump() for ref in references])
+
+        first_token_at = None
+        try:
+            async for delta in llm_service.stream_refine_description(request, references):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                yield format_sse("token", {"content": delta})
+        except LLMError as e:
+            yield format_sse("error", {"detail": str(e)})
+
+        finished = time.perf_counter()
+        metrics.REQUEST_SECONDS.observe(finished - started, endpoint="refine_stream")
+        yield format_sse("done", {
+            "timing": {
+                "retrieval_ms": round((retrieval_done - started) * 1000, 1),
+                "ttft_ms": round((first_token_at - retrieval_done) * 1000, 1) if first_token_at else None,
+                "llm_ms": round((finished - retrieval_done) * 1000, 1),
+                "total_ms": round((finished - started) * 1000, 1)
+            }
+        })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def format_ndjson(data) -> str:
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+@app.post("/api/v1/refine/batch")
+async def refine_batch(
+    batch: BatchRefineRequest,
+    request: Request,
+    rag_service: RAGService = Depends(get_rag_service),
+    llm_service: LLMService = Depends(get_llm_service)
+):
+    """Refine many issues in one job, streaming NDJSON results as they complete.
+
+    The job keeps running if the client disconnects; poll
+    /api/v1/refine/batch/{job_id} for its results.
+    """
+    needs_search = any(item.selected_references is None for item in batch.items)
+    if needs_search and not VectorService.is_ready():
+        raise EmbeddingNotReady(VectorService.load_error() or "Embedding model is still loading")
+    logger.info(f"Batch refine for {len(batch.items)} issues")
+    for item in batch.items:
+        analytics.log_usage(item)
+
+    job = request.app.state.batch_jobs.create(len(batch.items))
+    job.task = asyncio.create_task(run_batch(
+        job,
+        batch.items,
+        rag_service,
+        llm_service,
+        llm_concurrency=settings.BATCH_LLM_CONCURRENCY,
+        with_vectors=settings.CONTEXT_FETCH_VECTORS
+    ))
+
+    async def result_stream():
+        yield format_ndjson({"event": "job", "job_id": job.job_id, "total": job.total})
+        async for result in job.follow():
+            yield format_ndjson({"event": "result", **result})
+        status = job.status()
+        status.pop("results")
+        yield format_ndjson({"event": "done", **status})
+
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Batch-Job-Id": job.job_id}
+    )
+
+@app.get("/api/v1/refine/batch/{job_id}")
+async def get_batch_job(job_id: str, request: Request):
+    job = request.app.state.batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found or expired")
+    return job.status()
+
+@app.post("/api/v1/references", response_model=ReferencesResponse)
+async def search_references(
+    request: ReferencesRequest,
+    rag_service: RAGService = Depends(get_rag_service)
+):
+    """Retrieval only: returns search_context results without calling the LLM."""
+    limits = rag_service.resolve_limits(request.page_size, request.source_limits)
+    with metrics.timed(metrics.REQUEST_SECONDS, endpoint="references"):
+        references = await rag_service.search_context(
+            build_query_text(request),
+            component_team=request.component_team,
+            component_name=request.component_name,
+            restrict_to_team=request.restrict_to_team,
+            limits=limits,
+            page=request.page,
+            language=request.output_language,
+            bypass_cache=request.bypass_cache
+        )
+
+    # A source that filled its page may have more hits behind it
+    returned = {}
+    for ref in references:
+        returned[ref.source_type] = returned.get(ref.source_type, 0) + 1
+    has_more = any(
+        limits[key] > 0 and returned.get(source_type, 0) >= limits[key]
+        for source_type, key in SOURCE_LIMIT_KEYS.items()
+    )
+    return {
+        "references": references,
+        "page": request.page,
+        "limits": {source_type: limits[key] for source_type, key in SOURCE_LIMIT_KEYS.items()},
+        "has_more": has_more
+    }
+
 @app.get("/api/v1/analytics/usage")
-async def get_analytics_usage(period: str = "weekly"):
-    return analytics.get_usage_stats(period)
+async def get_analytics_usage(period: str = "weekly", dimension: Optional[str] = None):
+    return analytics.get_usage_stats(period, dimension)
+
+@app.get("/api/v1/llm/stats")
+async def get_llm_stats(llm_service: LLMService = Depends(get_llm_service)):
+    schedulers = {llm_service.primary.scheduler.provider: llm_service.primary.scheduler}
+    if llm_service.hedge:
+        schedulers.setdefault(llm_service.hedge.scheduler.provider, llm_service.hedge.scheduler)
+    return {
+        "schedulers": [scheduler.stats() for scheduler in schedulers.values()],
+        "prompts": LLMService.get_prompt_templates().stats(),
+        "hedging": llm_service.hedge_stats()
+    }
+
+@app.get("/api/v1/cache/stats")
+async def get_cache_stats():
+    stats = {
+        "embedding": VectorService.get_cache().stats(),
+        "response": LLMService.get_response_cache().stats()
+    }
+    for name, cache in (
+        ("semantic_search", RAGService.get_semantic_cache()),
+        ("semantic_draft", LLMService.get_draft_cache()),
+    ):
+        if cache is not None:
+            stats[name] = cache.stats()
+    return stats
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request):
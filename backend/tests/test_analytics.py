@@ -0,0 +1,111 @@
+import pytest
+
+from app import analytics
+
+ROWS = [
+    ("2024-03-04 09:00:00", "PROJ", "Story", "PAY", 12, "en"),
+    ("2024-03-04 18:30:00", "PROJ", "Bug", None, 30, "zh-TW"),
+    ("2024-03-06 10:00:00", "OPS", "Story", "PAY", 5, "en"),
+    ("2024-04-01 00:00:00", None, "Task", "WEB", 8, "zh-CN"),
+]
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "analytics.db")
+    connect = analytics.connect
+    monkeypatch.setattr(analytics, "connect", lambda db_path=path: connect(db_path))
+    analytics.init_db()
+    return path
+
+
+def logged_rows(path):
+    conn = analytics.connect(path)
+    rows = conn.execute(
+        "SELECT timestamp, project_key, issue_type, component_team, summary_length, output_language FROM request_logs"
+    ).fetchall()
+    conn.close()
+    return sorted(rows, key=lambda row: row[0])
+
+
+def test_writer_flushes_batches_and_drains_on_stop(db_path):
+    writer = analytics.AnalyticsWriter(db_path=db_path, batch_size=3, flush_interval=60)
+    writer.start()
+    for row in ROWS:
+        writer.submit(row)
+    writer.stop()
+    assert logged_rows(db_path) == ROWS
+
+
+def test_writer_drops_rows_when_queue_is_full(db_path):
+    writer = analytics.AnalyticsWriter(db_path=db_path, max_pending=2)
+    for row in ROWS:
+        writer.submit(row)
+    assert writer.dropped == 2
+    writer.start()
+    writer.stop()
+    assert logged_rows(db_path) == ROWS[:2]
+
+
+def rollups(conn):
+    return sorted(conn.execute(
+        "SELECT period, bucket, dimension, dimension_value, count, first_date FROM usage_rollups"
+    ).fetchall())
+
+
+def test_rollup_rows_aggregates_every_period_and_dimension():
+    rows = {row[:4]: row[4:] for row in analytics.rollup_rows(ROWS)}
+    assert rows[("daily", "2024-03-04", "all", "")] == (2, "2024-03-04")
+    assert rows[("weekly", "2024-10", "component_team", "PAY")] == (2, "2024-03-04")
+    assert rows[("weekly", "2024-10", "component_team", "")] == (1, "2024-03-04")
+    assert rows[("monthly", "2024-04", "project_key", "")] == (1, "2024-04-01")
+
+
+def test_upsert_accumulates_across_batches(db_path):
+    conn = analytics.connect()
+    with conn:
+        conn.executemany(analytics.UPSERT_ROLLUP_SQL, analytics.rollup_rows(ROWS[2:]))
+        conn.executemany(analytics.UPSERT_ROLLUP_SQL, analytics.rollup_rows(ROWS[:2]))
+    counts = {row[:4]: row[4:] for row in rollups(conn)}
+    assert counts[("monthly", "2024-03", "all", "")] == (3, "2024-03-04")
+    assert counts[("weekly", "2024-10", "output_language", "en")] == (2, "2024-03-04")
+    conn.close()
+
+
+def test_writer_rollups_match_backfill(db_path):
+    writer = analytics.AnalyticsWriter(db_path=db_path, batch_size=3, flush_interval=0.01)
+    writer.start()
+    for row in ROWS:
+        writer.submit(row)
+    writer.stop()
+
+    conn = analytics.connect()
+    incremental = rollups(conn)
+    analytics.backfill_rollups(conn)
+    assert rollups(conn) == incremental
+    conn.close()
+
+
+def test_usage_stats_read_from_rollups(db_path):
+    conn = analytics.connect()
+    with conn:
+        conn.executemany(analytics.UPSERT_ROLLUP_SQL, analytics.rollup_rows(ROWS))
+    conn.close()
+    stats = analytics.get_usage_stats("monthly", "component_team")
+    assert stats["labels"] == ["2024-03", "2024-04"]
+    assert stats["data"] == [3, 1]
+    assert stats["breakdown"] == {"PAY": [2, 0], "(none)": [1, 0], "WEB": [0, 1]}
+    weekly = analytics.get_usage_stats("weekly")
+    assert weekly["labels"][0] == "Week 2024-10 (2024-03-04)"
+
+
+def test_usage_stats_ignore_breakdown_buckets_outside_the_labels(db_path):
+    conn = analytics.connect()
+    with conn:
+        conn.executemany(analytics.UPSERT_ROLLUP_SQL, analytics.rollup_rows(ROWS))
+        # A bucket whose breakdown row landed without its total, as seen mid-write
+        conn.execute(analytics.UPSERT_ROLLUP_SQL, ("monthly", "2024-05", "component_team", "PAY", 1, "2024-05-02"))
+    conn.close()
+    stats = analytics.get_usage_stats("monthly", "component_team")
+    assert stats["labels"] == ["2024-03", "2024-04"]
+    assert stats["breakdown"]["PAY"] == [2, 0]
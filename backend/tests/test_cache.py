@@ -0,0 +1,129 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from app.cache import EmbeddingCache, ResponseCache, TieredCache, normalize_text
+
+
+def test_normalize_text():
+    assert normalize_text("  a \n b\t") == "a b"
+    assert normalize_text(None) == ""
+
+
+def test_memory_lru_eviction():
+    async def scenario():
+        cache = EmbeddingCache("model", max_entries=2)
+        cache.set("a", [1.0])
+        cache.set("b", [2.0])
+        assert await cache.get("a") == [1.0]
+        cache.set("c", [3.0])
+        assert await cache.get("b") is None
+        assert await cache.get("a") == [1.0]
+        assert cache.stats()["evictions"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_keys_include_model_and_ignore_whitespace():
+    async def scenario():
+        cache = EmbeddingCache("model", max_entries=4)
+        cache.set("login  page", [1.0])
+        assert await cache.get(" login page ") == [1.0]
+        assert cache.make_key("x") != EmbeddingCache("other").make_key("x")
+
+    asyncio.run(scenario())
+
+
+def test_unknown_model_never_hits():
+    async def scenario():
+        cache = EmbeddingCache(None, max_entries=4)
+        cache.set("a", [1.0])
+        assert await cache.get("a") is None
+        assert cache.peek("a") is None
+        cache.model_id = "model"
+        cache.set("a", [1.0])
+        assert await cache.get_many(["a", "b"]) == [[1.0], None]
+
+    asyncio.run(scenario())
+
+
+def test_disk_tier_survives_restart_and_promotes(tmp_path):
+    path = str(tmp_path / "cache.db")
+
+    async def scenario():
+        cache = EmbeddingCache("model", max_entries=1, path=path)
+        cache.set("a", [1.0, 2.0])
+        cache.set("b", [3.0])
+        assert cache.peek("a") is None
+        cache.close()
+
+        reopened = EmbeddingCache("model", max_entries=4, path=path)
+        assert await reopened.get_many(["a", "b", "missing"]) == [[1.0, 2.0], [3.0], None]
+        assert reopened.peek("a") == [1.0, 2.0]
+        stats = reopened.stats()
+        assert (stats["disk_hits"], stats["misses"], stats["pending_writes"]) == (2, 1, 0)
+        reopened.close()
+
+    asyncio.run(scenario())
+
+
+def test_ttl_expires_memory_and_disk(tmp_path):
+    path = str(tmp_path / "cache.db")
+
+    async def scenario():
+        cache = ResponseCache(max_entries=4, path=path, ttl_seconds=0.05)
+        cache.set_by_key("key", "refined")
+        assert await cache.get_by_key("key") == "refined"
+        time.sleep(0.1)
+        assert await cache.get_by_key("key") is None
+        cache.close()
+
+    asyncio.run(scenario())
+    rows = sqlite3.connect(path).execute("SELECT COUNT(*) FROM response_cache").fetchone()
+    assert rows == (0,)
+
+
+def test_disk_prune_bounds_entries(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(max_entries=0, path=path, disk_max_entries=10)
+    for index in range(100):
+        cache.set_by_key(f"key{index}", "value")
+    cache.close()
+    assert sqlite3.connect(path).execute("SELECT COUNT(*) FROM response_cache").fetchone() == (10,)
+
+
+def test_embedding_disk_tier_is_bounded(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = EmbeddingCache("model", max_entries=0, path=path, disk_max_entries=10)
+    for index in range(100):
+        cache.set(f"query {index}", [float(index)])
+    cache.close()
+    assert sqlite3.connect(path).execute("SELECT COUNT(*) FROM embedding_cache").fetchone() == (10,)
+
+
+def test_subclass_without_serializers_fails_on_creation():
+    class Incomplete(TieredCache):
+        table = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_lookups_are_counted_per_result():
+    from app import metrics
+
+    def count(result):
+        return metrics.CACHE_LOOKUPS.value(cache="embedding", result=result)
+
+    async def scenario():
+        before = {result: count(result) for result in ("memory_hits", "misses")}
+        cache = EmbeddingCache("model", max_entries=4)
+        cache.set("a", [1.0])
+        await cache.get_many(["a", "b"])
+        assert count("memory_hits") == before["memory_hits"] + 1
+        assert count("misses") == before["misses"] + 1
+
+    asyncio.run(scenario())
+    assert "# TYPE ra_cache_lookups_total counter" in metrics.REGISTRY.render()
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from app.context import (
+    ELLIPSIS,
+    ContextPacker,
+    estimate_tokens,
+    similarity_matrix,
+    split_fields,
+    truncate_excerpt,
+    truncate_to_tokens,
+    water_fill_cap,
+)
+from app.schemas import RetrievedReference
+
+
+def make_ref(title, excerpt, score, vector=None):
+    ref = RetrievedReference(source_type="usm_node", title=title, content_excerpt=excerpt, relevance_score=score)
+    ref._vector = vector
+    return ref
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+    # CJK characters count one token each
+    assert estimate_tokens("登入頁面") == 4
+
+
+def test_truncate_to_tokens():
+    text = "word " * 100
+    truncated = truncate_to_tokens(text, 10)
+    assert truncated.endswith(ELLIPSIS)
+    assert estimate_tokens(truncated) <= 10
+    assert truncate_to_tokens("short", 10) == "short"
+    assert truncate_to_tokens(text, 0) == ""
+
+
+def test_water_fill_cap():
+    assert water_fill_cap([10, 20], 100) == 20
+    assert water_fill_cap([10, 50, 50], 70) == 30
+    assert water_fill_cap([], 10) == 0
+
+
+def test_split_fields_and_truncate_excerpt_keeps_headlines():
+    excerpt = "Story: Login\nDesc: " + "long description " * 50 + "\nI want: to log in"
+    assert [label for label, _ in split_fields(excerpt)] == ["Story", "Desc", "I want"]
+    truncated = truncate_excerpt(excerpt, 40)
+    assert truncated.startswith("Story: Login\n")
+    assert "I want: to log in" in truncated
+    assert ELLIPSIS in truncated
+    assert estimate_tokens(truncated) <= 40
+
+
+def test_similarity_matrix_mixes_cosine_and_jaccard():
+    refs = [
+        make_ref("a", "login page error", 0.9, [1.0, 0.0]),
+        make_ref("b", "checkout flow", 0.8, [1.0, 1.0]),
+        make_ref("c", "login page error", 0.7),
+    ]
+    similarities = similarity_matrix(refs)
+    assert similarities.shape == (3, 3)
+    assert similarities[0, 1] == pytest.approx(1 / np.sqrt(2))
+    assert similarities[1, 0] == pytest.approx(similarities[0, 1])
+    # c has no vector: word Jaccard against both
+    assert similarities[0, 2] == pytest.approx(1.0)
+    assert similarities[1, 2] == pytest.approx(0.0)
+
+
+def test_diversify_drops_near_duplicates_and_orders_by_mmr():
+    refs = [
+        make_ref("best", "a", 0.9, [1.0, 0.0, 0.0]),
+        make_ref("copy", "b", 0.85, [1.0, 0.001, 0.0]),
+        make_ref("similar", "c", 0.8, [0.8, 0.6, 0.0]),
+        make_ref("different", "d", 0.75, [0.0, 0.0, 1.0]),
+    ]
+    ordered, duplicates = ContextPacker(mmr_lambda=0.5, duplicate_threshold=0.95).diversify(refs)
+    assert duplicates == 1
+    # The less relevant but novel reference overtakes the similar one
+    assert [ref.title for ref in ordered] == ["best", "different", "similar"]
+
+
+def test_pack_fits_budget():
+    refs = [make_ref(f"ref{index}", "Desc: " + f"detail{index} " * 200, 1 - index / 10) for index in range(5)]
+    packer = ContextPacker(budget=400, min_reference_tokens=48)
+    packed = packer.pack(refs)
+    assert packed.tokens_after <= 400
+    assert packed.tokens_before > packed.tokens_after
+    assert packed.truncated == len(packed.references) == 5
+    # The originals are not modified
+    assert refs[0].content_excerpt.startswith("Desc: detail0")
+    assert len(refs[0].content_excerpt) > len(packed.references[0].content_excerpt)
+
+
+def test_pack_drops_overflow_beyond_min_reference_tokens():
+    refs = [make_ref(f"ref{index}", f"text{index}", 1 - index / 10) for index in range(5)]
+    packed = ContextPacker(budget=100, min_reference_tokens=48).pack(refs)
+    assert len(packed.references) == 2
+    assert packed.overflow_dropped == 3
+
+
+def test_pack_disabled_passes_through():
+    refs = [make_ref("a", "x", 0.2), make_ref("b", "y", 0.9)]
+    packed = ContextPacker(budget=0).pack(refs)
+    assert packed.references == refs
+    assert packed.tokens_saved == 0
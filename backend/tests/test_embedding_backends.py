@@ -0,0 +1,62 @@
+import pytest
+
+from app.embedding import EMBEDDING_BACKENDS, EmbeddingBackend
+
+
+def test_backends_implement_the_interface():
+    for backend_cls in EMBEDDING_BACKENDS.values():
+        backend = backend_cls("model", max_length=128)
+        assert backend.max_length == 128
+
+
+def test_incomplete_backend_fails_on_creation():
+    class NoEncode(EmbeddingBackend):
+        def load(self):
+            return self
+
+    with pytest.raises(TypeError):
+        NoEncode("model")
+
+
+class FakeBackend(EmbeddingBackend):
+    name = "fake"
+
+    def load(self):
+        return self
+
+    def encode(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_sidecar_reports_its_model_id_at_handshake(tmp_path):
+    import asyncio
+    import threading
+
+    from app.embedding_sidecar import EmbeddingSidecar, SidecarEmbeddingBackend
+
+    socket_path = str(tmp_path / "embed.sock")
+    sidecar = EmbeddingSidecar(FakeBackend("served-model", max_length=64), socket_path)
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(sidecar.serve())
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        loop.run_until_complete(asyncio.sleep(0.05))
+        loop.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    client = SidecarEmbeddingBackend("configured-model", socket_path=socket_path, connect_timeout=5.0)
+    try:
+        assert client.model_id is None
+        client.load()
+        assert client.model_id == "served-model@fake:64"
+        assert client.dim == 2
+        assert client.encode(["abc"]) == [[3.0, 1.0]]
+    finally:
+        client._close_socket()
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join(timeout=5)
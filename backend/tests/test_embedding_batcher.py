@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.embedding import EmbeddingBatcher
+
+
+class RecordingEncoder:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        time.sleep(self.delay)
+        return [[float(len(text))] for text in texts]
+
+
+def test_lone_request_does_not_wait_for_the_window():
+    async def scenario():
+        batcher = EmbeddingBatcher(RecordingEncoder(), max_wait_ms=500)
+        started = time.monotonic()
+        assert await batcher.embed("abc") == [3.0]
+        assert time.monotonic() - started < 0.2
+        batcher.close()
+
+    asyncio.run(scenario())
+
+
+def test_requests_arriving_during_an_encode_share_the_next_batch():
+    async def scenario():
+        encoder = RecordingEncoder(delay=0.05)
+        batcher = EmbeddingBatcher(encoder, max_wait_ms=1)
+        first = asyncio.ensure_future(batcher.embed("a"))
+        await asyncio.sleep(0.01)
+        rest = [asyncio.ensure_future(batcher.embed(text)) for text in ("bb", "ccc", "bb")]
+        assert await first == [1.0]
+        assert [await future for future in rest] == [[2.0], [3.0], [2.0]]
+        assert encoder.batches == [["a"], ["bb", "ccc"]]
+        batcher.close()
+
+    asyncio.run(scenario())
+
+
+def test_embed_many_preserves_order_and_duplicates():
+    async def scenario():
+        encoder = RecordingEncoder()
+        batcher = EmbeddingBatcher(encoder)
+        assert await batcher.embed_many(["bb", "a", "bb"]) == [[2.0], [1.0], [2.0]]
+        assert encoder.batches == [["bb", "a"]]
+        batcher.close()
+
+    asyncio.run(scenario())
+
+
+def test_encode_errors_reach_every_caller():
+    def failing(texts):
+        raise ValueError("model crashed")
+
+    async def scenario():
+        batcher = EmbeddingBatcher(failing)
+        with pytest.raises(ValueError):
+            await batcher.embed("a")
+        batcher.close()
+
+    asyncio.run(scenario())
+
+
+def test_close_fails_collected_and_queued_callers():
+    release = threading.Event()
+
+    def blocking(texts):
+        release.wait(5)
+        return [[0.0] for _ in texts]
+
+    async def scenario():
+        batcher = EmbeddingBatcher(blocking, max_batch_size=1)
+        collected = asyncio.ensure_future(batcher.embed("a"))
+        await asyncio.sleep(0.01)
+        queued = asyncio.ensure_future(batcher.embed("b"))
+        await asyncio.sleep(0.01)
+        batcher.close()
+        results = await asyncio.wait_for(asyncio.gather(collected, queued, return_exceptions=True), 1)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        release.set()
+
+    asyncio.run(scenario())
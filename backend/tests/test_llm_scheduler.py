@@ -0,0 +1,122 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import pytest
+
+from app.llm_scheduler import LLMScheduler, SchedulerRejected, TokenBucket, parse_duration
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("12", 12.0),
+    ("0.5", 0.5),
+    ("20ms", 0.02),
+    ("6m0s", 360.0),
+    ("1h2m3s", 3723.0),
+    ("-3", 0.0),
+])
+def test_parse_duration(value, expected):
+    assert parse_duration(value) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("value", [None, "", "soon", "5x"])
+def test_parse_duration_rejects_unknown_values(value):
+    assert parse_duration(value) is None
+
+
+def test_parse_duration_epoch_and_http_date():
+    assert parse_duration(str(time.time() + 30)) == pytest.approx(30, abs=1)
+    assert parse_duration(str(int((time.time() + 30) * 1000))) == pytest.approx(30, abs=1)
+    assert parse_duration(formatdate(time.time() + 60, usegmt=True)) == pytest.approx(60, abs=2)
+    assert parse_duration(str(time.time() - 30)) == 0.0
+
+
+def test_token_bucket_unlimited_until_configured():
+    bucket = TokenBucket()
+    assert not bucket.limited
+    for _ in range(100):
+        bucket.take()
+    assert bucket.delay() == 0.0
+
+
+def test_token_bucket_static_rate():
+    bucket = TokenBucket(rate=2.0)
+    assert bucket.capacity == 2.0
+    bucket.take()
+    bucket.take()
+    assert bucket.delay() == pytest.approx(0.5, abs=0.05)
+
+
+def test_token_bucket_follows_headers():
+    bucket = TokenBucket()
+    bucket.update_from_headers({
+        "x-ratelimit-limit-requests": "60",
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "30s",
+    })
+    assert bucket.limited
+    assert bucket.capacity == 60
+    assert bucket.rate == pytest.approx(2.0)
+    assert bucket.delay() == pytest.approx(0.5, abs=0.05)
+
+
+def test_token_bucket_ignores_incomplete_headers():
+    bucket = TokenBucket()
+    bucket.update_from_headers({"x-ratelimit-limit": "60"})
+    bucket.update_from_headers({"x-ratelimit-limit": "abc", "x-ratelimit-remaining": "1"})
+    assert not bucket.limited
+
+
+def test_token_bucket_pause():
+    bucket = TokenBucket()
+    bucket.pause(5)
+    assert bucket.delay() == pytest.approx(5, abs=0.1)
+
+
+def test_scheduler_caps_concurrency_and_rejects_at_deadline():
+    async def scenario():
+        scheduler = LLMScheduler("test", max_concurrency=1, queue_timeout=0.05)
+        lease = await scheduler.acquire()
+        with pytest.raises(SchedulerRejected):
+            await scheduler.acquire()
+        lease.release()
+        (await scheduler.acquire()).release()
+        assert scheduler.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_scheduler_rejects_when_queue_is_full():
+    async def scenario():
+        scheduler = LLMScheduler("test", max_concurrency=1, max_queue=1, queue_timeout=1)
+        lease = await scheduler.acquire()
+        waiter = asyncio.ensure_future(scheduler.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerRejected):
+            await scheduler.acquire()
+        lease.release()
+        (await waiter).release()
+
+    asyncio.run(scenario())
+
+
+def test_scheduler_passes_wakeup_on_when_woken_waiter_leaves():
+    async def scenario():
+        scheduler = LLMScheduler("test", max_concurrency=1, queue_timeout=2)
+        lease = await scheduler.acquire()
+        first = asyncio.ensure_future(scheduler.acquire())
+        second = asyncio.ensure_future(scheduler.acquire())
+        await asyncio.sleep(0.01)
+        first_waiter = scheduler._waiters[0]
+        lease.release()
+        # Cancelled after being woken, before it ran; on Python < 3.12 wait_for
+        # may still hand it the slot, which it then gives back
+        assert first_waiter.done()
+        first.cancel()
+        outcome = (await asyncio.gather(first, return_exceptions=True))[0]
+        if not isinstance(outcome, BaseException):
+            outcome.release()
+        (await asyncio.wait_for(second, timeout=0.5)).release()
+        assert scheduler.in_flight == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from app.config import PromptConfig
+from app.prompts import DYNAMIC_FIELDS, CompiledTemplate, PromptTemplates, prompt_mode
+
+LANGUAGES = {
+    "en": {"language_instruction": "English", "menu_header": "Menu"},
+    "zh-TW": {"language_instruction": "Traditional Chinese", "menu_header": "選單"},
+}
+TEMPLATE = "Write in {output_language}.\nh1. {menu_header}\nIssue: {issue_type!r}\nScore: {score:>5}\n{draft}"
+
+
+def test_compiled_template_matches_str_format():
+    static = {"output_language": "English", "menu_header": "Menu"}
+    values = {"issue_type": "Bug", "score": 7, "draft": "the draft"}
+    compiled = CompiledTemplate.compile(TEMPLATE, static, ("issue_type", "score", "draft"))
+    assert compiled.render(values) == TEMPLATE.format(**static, **values)
+    assert compiled.static_prefix == "Write in English.\nh1. Menu\nIssue: "
+
+
+def test_compiled_template_resolves_static_fields_once():
+    compiled = CompiledTemplate.compile("{a} and {b}", {"a": "x", "b": "y"})
+    assert compiled.fields == ()
+    assert compiled.render({}) == "x and y"
+
+
+def test_compiled_template_keeps_escaped_braces():
+    compiled = CompiledTemplate.compile("{{literal}} {draft}", {}, ("draft",))
+    assert compiled.render({"draft": "d"}) == "{literal} d"
+
+
+def test_compiled_template_rejects_unknown_placeholders():
+    with pytest.raises(KeyError):
+        CompiledTemplate.compile("{unknown}", {}, DYNAMIC_FIELDS)
+
+
+def test_prompt_mode():
+    assert prompt_mode("Bug") == "qa"
+    assert prompt_mode("Production Bug") == "qa"
+    assert prompt_mode("Story") == "pm"
+    assert prompt_mode(None) == "pm"
+
+
+def write_prompts(path, system):
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write(
+            "pm:\n"
+            f"  system_prompt: \"{system} in {{language_instruction}}\"\n"
+            "  user_prompt_template: \"{output_language}|{issue_type}|{summary}|{context}|{draft}\"\n"
+        )
+
+
+@pytest.fixture
+def prompts_file(tmp_path, monkeypatch):
+    path = tmp_path / "prompts.yaml"
+    write_prompts(path, "v1")
+    monkeypatch.setattr(PromptConfig, "resolve_path", staticmethod(lambda path="prompts.yaml": str(tmp_path / "prompts.yaml")))
+    monkeypatch.setattr(PromptConfig, "_prompts", {})
+    monkeypatch.setattr(PromptConfig, "version", "")
+    return path
+
+
+def test_prompt_templates_compile_every_mode_and_language(prompts_file):
+    templates = PromptTemplates(LANGUAGES, "en", reload_interval=0)
+    messages = templates.get("Bug", "zh-TW").messages(issue_type="Bug", summary="s", context="c", draft="d")
+    # qa falls back to the pm prompt when prompts.yaml has no qa section
+    assert messages[0] == {"role": "system", "content": "v1 in Traditional Chinese"}
+    assert messages[1]["content"] == "Traditional Chinese|Bug|s|c|d"
+    assert templates.get("Story", "fr") is templates.get("Story", "en")
+    assert set(templates.stats()["static_prefix_chars"]) == {"pm/en", "pm/zh-TW", "qa/en", "qa/zh-TW"}
+
+
+def test_prompt_templates_reload_on_change_and_keep_old_version_on_error(prompts_file):
+    templates = PromptTemplates(LANGUAGES, "en", reload_interval=0)
+    first_version = templates.version
+    assert not templates.reload()
+
+    write_prompts(prompts_file, "v2")
+    os.utime(prompts_file, ns=(0, os.stat(prompts_file).st_mtime_ns + 1_000_000))
+    assert templates.reload()
+    assert templates.version != first_version
+    assert templates.get("Story", "en").system == "v2 in English"
+    assert PromptConfig.version == templates.version
+
+    prompts_file.write_text("pm:\n  system_prompt: \"{not_a_field}\"\n", encoding="utf-8")
+    os.utime(prompts_file, ns=(0, os.stat(prompts_file).st_mtime_ns + 2_000_000))
+    assert not templates.reload()
+    assert templates.get("Story", "en").system == "v2 in English"
@@ -0,0 +1,55 @@
+import asyncio
+
+from app.cache import ResponseCache
+from app.schemas import RefineRequest, RetrievedReference
+
+
+def make_request(**overrides):
+    return RefineRequest(**{"current_description": "As a user I log in", "summary": "Login", **overrides})
+
+
+def make_refs(excerpt="Given a user"):
+    return [RetrievedReference(source_type="test_case", title="Login", content_excerpt=excerpt, relevance_score=0.8)]
+
+
+def test_key_is_stable_for_identical_content():
+    cache = ResponseCache()
+    key = cache.make_key(make_request(), make_refs(), "v1", "model")
+    assert key == cache.make_key(make_request(), make_refs(), "v1", "model")
+    # Fields that do not reach the prompt do not split the cache
+    assert key == cache.make_key(make_request(project_key="OTHER", bypass_cache=True), make_refs(), "v1", "model")
+
+
+def test_key_changes_with_everything_that_shapes_the_prompt():
+    cache = ResponseCache()
+    key = cache.make_key(make_request(), make_refs(), "v1", "model")
+    variants = [
+        cache.make_key(make_request(current_description="As an admin I log in"), make_refs(), "v1", "model"),
+        cache.make_key(make_request(summary="Logout"), make_refs(), "v1", "model"),
+        cache.make_key(make_request(issue_type="Bug"), make_refs(), "v1", "model"),
+        cache.make_key(make_request(output_language="en"), make_refs(), "v1", "model"),
+        cache.make_key(make_request(), make_refs("Given an admin"), "v1", "model"),
+        cache.make_key(make_request(), [], "v1", "model"),
+        cache.make_key(make_request(), make_refs(), "v2", "model"),
+        cache.make_key(make_request(), make_refs(), "v1", "other-model"),
+    ]
+    assert len({key, *variants}) == len(variants) + 1
+
+
+def test_roundtrip_through_disk(tmp_path):
+    path = str(tmp_path / "responses.db")
+    key = ResponseCache().make_key(make_request(), make_refs(), "v1", "model")
+
+    async def scenario():
+        cache = ResponseCache(max_entries=4, path=path, ttl_seconds=60)
+        cache.set_by_key(key, "h1. 選單\n * Login")
+        assert await cache.get_by_key(key) == "h1. 選單\n * Login"
+        cache.close()
+
+        reopened = ResponseCache(max_entries=4, path=path, ttl_seconds=60)
+        assert await reopened.get_by_key(key) == "h1. 選單\n * Login"
+        assert await reopened.get_by_key("missing") is None
+        assert reopened.stats()["disk_hits"] == 1
+        reopened.close()
+
+    asyncio.run(scenario())
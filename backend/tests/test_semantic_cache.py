@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from app.semantic_cache import SemanticCache
+
+
+def test_hit_above_threshold_only():
+    cache = SemanticCache("test", max_entries=4, threshold=0.95)
+    cache.store("team", [1.0, 0.0], "value")
+    value, similarity = cache.lookup("team", [0.99, 0.05])
+    assert value == "value"
+    assert similarity == pytest.approx(0.9987, abs=1e-3)
+    assert cache.lookup("team", [0.7, 0.7]) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_lookups_never_cross_partitions():
+    cache = SemanticCache("test", max_entries=4, threshold=0.9)
+    cache.store("a", [1.0, 0.0], "from a")
+    assert cache.lookup("b", [1.0, 0.0]) is None
+    assert cache.lookup("a", [2.0, 0.0])[0] == "from a"
+
+
+def test_returns_the_closest_entry():
+    cache = SemanticCache("test", max_entries=4, threshold=0.5)
+    cache.store("p", [1.0, 0.0], "x")
+    cache.store("p", [0.0, 1.0], "y")
+    assert cache.lookup("p", [0.2, 0.9])[0] == "y"
+
+
+def test_evicts_least_recently_used():
+    cache = SemanticCache("test", max_entries=2, threshold=0.99)
+    cache.store("p", [1.0, 0.0, 0.0], "x")
+    time.sleep(0.001)
+    cache.store("p", [0.0, 1.0, 0.0], "y")
+    time.sleep(0.001)
+    assert cache.lookup("p", [1.0, 0.0, 0.0])[0] == "x"
+    cache.store("p", [0.0, 0.0, 1.0], "z")
+    assert cache.lookup("p", [0.0, 1.0, 0.0]) is None
+    assert cache.lookup("p", [1.0, 0.0, 0.0])[0] == "x"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["entries"] == 2
+
+
+def test_expired_entries_miss_and_are_reused():
+    cache = SemanticCache("test", max_entries=1, threshold=0.9, ttl_seconds=0.01)
+    cache.store("p", [1.0, 0.0], "old")
+    time.sleep(0.02)
+    assert cache.lookup("p", [1.0, 0.0]) is None
+    cache.store("p", [0.0, 1.0], "new")
+    assert cache.stats()["evictions"] == 0
+    assert cache.lookup("p", [0.0, 1.0])[0] == "new"
+
+
+def test_dimension_change_resets_the_cache():
+    cache = SemanticCache("test", max_entries=4, threshold=0.9)
+    cache.store("p", [1.0, 0.0], "2d")
+    assert cache.lookup("p", [1.0, 0.0, 0.0]) is None
+    cache.store("p", [1.0, 0.0, 0.0], "3d")
+    assert cache.lookup("p", [1.0, 0.0, 0.0])[0] == "3d"
+    assert cache.stats()["entries"] == 1
+
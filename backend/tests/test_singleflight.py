@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from app.singleflight import SingleFlight, request_key
+
+
+def test_request_key_is_order_insensitive_for_dicts():
+    assert request_key("search", {"a": 1, "b": 2}) == request_key("search", {"b": 2, "a": 1})
+    assert request_key("search", 1) != request_key("search", 2)
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flights = SingleFlight("test")
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        results = await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+        assert results == [1] * 5
+        assert calls == 1
+        assert flights.in_flight() == 0
+        # Nothing is cached after completion
+        assert await flights.do("key", work) == 2
+
+    asyncio.run(scenario())
+
+
+def test_distinct_keys_run_separately():
+    async def scenario():
+        flights = SingleFlight("test")
+
+        async def work(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        assert await asyncio.gather(flights.do("a", lambda: work(1)), flights.do("b", lambda: work(2))) == [1, 2]
+
+    asyncio.run(scenario())
+
+
+def test_exception_reaches_every_caller():
+    async def scenario():
+        flights = SingleFlight("test")
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(*(flights.do("key", work) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert flights.in_flight() == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_caller_does_not_cancel_shared_work():
+    async def scenario():
+        flights = SingleFlight("test")
+        finished = asyncio.Event()
+
+        async def work():
+            await asyncio.sleep(0.02)
+            finished.set()
+            return "done"
+
+        leaving = asyncio.ensure_future(flights.do("key", work))
+        staying = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        assert await staying == "done"
+        assert finished.is_set()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+
+    asyncio.run(scenario())
+
+
+def test_work_is_cancelled_when_last_caller_leaves():
+    async def scenario():
+        flights = SingleFlight("test")
+        cancelled = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.sleep(0.01)
+        assert cancelled.is_set()
+        assert flights.in_flight() == 0
+
+    asyncio.run(scenario())
+
+
+def test_every_caller_gets_the_shared_stage_timings():
+    from app import metrics
+
+    async def scenario():
+        flights = SingleFlight("test")
+
+        async def work():
+            await asyncio.sleep(0.01)
+            metrics.record_stage("embed", 0.005)
+            return "done"
+
+        async def caller():
+            timings = metrics.RequestTimings()
+            metrics.bind_timings(timings)
+            await flights.do("key", work)
+            return [stage for stage, _ in timings.stages]
+
+        first, second = await asyncio.gather(caller(), caller())
+        assert first == ["embed"]
+        assert second == ["embed", "coalesced"]
+
+    asyncio.run(scenario())
@@ -5,6 +5,7 @@ const STORAGE_KEY = "jraApiBaseUrl";
 let isFabInjected = false;
 let modalOverlay = null;
 let lastReferences = [];
+let referencesPage = 0;
 
 function normalizeBaseUrl(value) {
   return value.replace(/\/+$/, "");
@@ -22,9 +23,38 @@ function getApiBaseUrl() {
   });
 }
 
-async function getApiUrl() {
+async function getApiUrl(path = "/api/v1/refine") {
   const baseUrl = await getApiBaseUrl();
-  return `${normalizeBaseUrl(baseUrl)}/api/v1/refine`;
+  return `${normalizeBaseUrl(baseUrl)}${path}`;
+}
+
+// Parses a text/event-stream response body and calls onEvent(name, data) per event.
+async function readEventStream(response, onEvent) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  const dispatch = (rawEvent) => {
+    let eventName = "message";
+    const dataLines = [];
+    rawEvent.split("\n").forEach(line => {
+      if (line.startsWith("event:")) eventName = line.slice(6).trim();
+      else if (line.startsWith("data:")) dataLines.push(line.slice(5).trim());
+    });
+    if (dataLines.length) onEvent(eventName, JSON.parse(dataLines.join("\n")));
+  };
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      dispatch(buffer.slice(0, boundary));
+      buffer = buffer.slice(boundary + 2);
+    }
+  }
+  if (buffer.trim()) dispatch(buffer);
 }
 
 // Initialization
@@ -337,6 +367,9 @@ function showModal(initialText) {
           <div id="jra-tab-context" class="jra-col3-content">
             <div class="jra-ref-top">
                <span class="jra-ref-label">Reference Context</span>
+               <button class="jra-btn jra-btn-secondary" id="jra-fetch-refs" type="button">
+                  搜尋 references
+               </button>
                <button class="jra-btn jra-btn-secondary" id="jra-resuggest" type="button" disabled>
                   重新建議
                </button>
@@ -344,6 +377,9 @@ function showModal(initialText) {
              <div id="jra-ref-list">
                 <p style="color:#999">References will appear here after AI processing.</p>
              </div>
+             <button class="jra-btn jra-btn-secondary" id="jra-more-refs" type="button" style="display:none; width:100%; margin-top:8px;">
+                載入更多
+             </button>
           </div>
         </div>
 
@@ -375,6 +411,8 @@ function showModal(initialText) {
   document.getElementById('jra-close').addEventListener('click', closeModal);
   document.getElementById('jra-submit-ai').addEventListener('click', submitToAI);
   document.getElementById('jra-resuggest').addEventListener('click', handleResuggest);
+  document.getElementById('jra-fetch-refs').addEventListener('click', () => fetchReferences());
+  document.getElementById('jra-more-refs').addEventListener('click', () => fetchReferences({ append: true }));
   document.getElementById('jra-copy').addEventListener('click', copyResult);
   document.getElementById('jra-ref-list').addEventListener('click', (event) => {
     const toggleBtn = event.target.closest('.jra-ref-toggle');
@@ -465,9 +503,77 @@ function getSelectedReferences() {
     .filter(Boolean);
 }
 
+function buildRefinePayload(inputText) {
+  // Get Context
+  const summary = document.querySelector('#summary-val')?.innerText || "Unknown Issue";
+  const issueType = document.querySelector('#type-val')?.innerText || "Story";
+  const componentName = getComponentName();
+  const componentTeam = deriveComponentTeam(componentName);
+  const restrictToTeam = document.getElementById('jra-restrict-team')?.checked ?? true;
+  const outputLanguage = document.getElementById('jra-output-language')?.value || "zh-TW";
+
+  return {
+    current_description: inputText,
+    summary: summary,
+    issue_type: issueType,
+    component_name: componentName,
+    component_team: componentTeam,
+    restrict_to_team: restrictToTeam,
+    output_language: outputLanguage
+  };
+}
+
+// Retrieval only (no LLM call): lets users browse and pick references before generating.
+async function fetchReferences(options = {}) {
+  const inputText = document.getElementById('jra-input-text').value;
+  if (!inputText.trim()) {
+    alert("Please enter some text first.");
+    return;
+  }
+  const append = Boolean(options.append);
+  const fetchBtn = document.getElementById('jra-fetch-refs');
+  const moreBtn = document.getElementById('jra-more-refs');
+  if (fetchBtn) fetchBtn.disabled = true;
+  if (moreBtn) moreBtn.disabled = true;
+
+  try {
+    const page = append ? referencesPage + 1 : 0;
+    const payload = { ...buildRefinePayload(inputText), page };
+    const apiUrl = await getApiUrl("/api/v1/references");
+    const response = await fetch(apiUrl, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(payload)
+    });
+    if (!response.ok) throw new Error("API Request failed");
+    const data = await response.json();
+
+    referencesPage = page;
+    if (append) {
+      const unchecked = Array.from(document.querySelectorAll('.jra-ref-check'))
+        .filter(check => !check.checked)
+        .map(check => Number(check.dataset.refIndex));
+      renderReferences(lastReferences.concat(data.references || []));
+      unchecked.forEach(index => {
+        const check = document.querySelector(`.jra-ref-check[data-ref-index="${index}"]`);
+        if (check) check.checked = false;
+      });
+    } else {
+      renderReferences(data.references || []);
+    }
+    if (moreBtn) moreBtn.style.display = data.has_more ? 'inline-block' : 'none';
+  } catch (error) {
+    console.error(error);
+    alert("Error: " + error.message);
+  } finally {
+    if (fetchBtn) fetchBtn.disabled = false;
+    if (moreBtn) moreBtn.disabled = false;
+  }
+}
+
 async function handleResuggest() {
   if (!lastReferences.length) {
-    alert("尚未取得 references，請先送出一次建議。");
+    await fetchReferences();
     return;
   }
   const selected = getSelectedReferences();
@@ -497,29 +603,13 @@ async function submitToAI(options = {}) {
   document.getElementById('jra-output-text').style.display = 'none';
   document.getElementById('jra-output-visual').style.display = 'none';
 
-  // Get Context
-  const summary = document.querySelector('#summary-val')?.innerText || "Unknown Issue";
-  const issueType = document.querySelector('#type-val')?.innerText || "Story";
-  const componentName = getComponentName();
-  const componentTeam = deriveComponentTeam(componentName);
-  const restrictToTeam = document.getElementById('jra-restrict-team')?.checked ?? true;
-  const outputLanguage = document.getElementById('jra-output-language')?.value || "zh-TW";
-
   try {
-    const payload = {
-      current_description: inputText,
-      summary: summary,
-      issue_type: issueType,
-      component_name: componentName,
-      component_team: componentTeam,
-      restrict_to_team: restrictToTeam,
-      output_language: outputLanguage
-    };
+    const payload = buildRefinePayload(inputText);
     if (selectedReferences) {
       payload.selected_references = selectedReferences;
     }
 
-    const apiUrl = await getApiUrl();
+    const apiUrl = await getApiUrl("/api/v1/refine/stream");
     const response = await fetch(apiUrl, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
@@ -528,11 +618,38 @@ async function submitToAI(options = {}) {
 
     if (!response.ok) throw new Error("API Request failed");
 
-    const data = await response.json();
-    
-    // Success: Render
-    let refinedText = data.refined_content || "";
-    
+    // Stream: references arrive first, then LLM tokens, then a "done" event with timing.
+    let refinedText = "";
+    let renderPending = false;
+    let streamFinished = false;
+    let streamError = null;
+
+    await readEventStream(response, (eventName, data) => {
+      if (eventName === "references") {
+        referencesPage = 0;
+        lastReferences = data;
+        renderReferences(data);
+      } else if (eventName === "token") {
+        refinedText += data.content || "";
+        document.getElementById('jra-loading').style.display = 'none';
+        if (!renderPending) {
+          renderPending = true;
+          requestAnimationFrame(() => {
+            renderPending = false;
+            if (!streamFinished) renderOutput(refinedText);
+          });
+        }
+      } else if (eventName === "error") {
+        streamError = data.detail;
+      } else if (eventName === "done") {
+        console.log("JRA: refine timing", data.timing);
+      }
+    });
+
+    streamFinished = true;
+    if (streamError && !refinedText) throw new Error(streamError);
+    if (streamError) refinedText += `\n\n${streamError}`;
+
     // Extract Questions
     const { cleanWiki, questions } = extractQuestions(refinedText);
     
@@ -542,12 +659,6 @@ async function submitToAI(options = {}) {
     // Switch tab to Questions (with safety check)
     const questionsTab = document.querySelector('.jra-tab-item[data-tab="questions"]');
     if (questionsTab) questionsTab.click();
-
-    // Render References
-    if (data.references) {
-        lastReferences = data.references; // Assuming lastReferences is the global store
-        renderReferences(data.references);
-    }
     
     // Start Cooldown
     startCooldown(inputBtn);